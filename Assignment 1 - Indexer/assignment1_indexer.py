@@ -7,58 +7,178 @@ Created on Fri Sep 20 11:01:59 2024
 
 import os
 import re
+import sys
 from collections import defaultdict
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import nltk
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import filedialog, messagebox, scrolledtext, simpledialog
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ir_core import instrument
+from ir_core.cache import QueryCache
+from ir_core.forward import ForwardIndex
+from ir_core.incremental import diff_manifests, scan_folder
+from ir_core.index_store import DiskCountIndex, corpus_fingerprint
+from ir_core.parallel import DEFAULT_CHUNK_SIZE, map_chunks
+from ir_core.positional import PositionalIndex, document_positions
+from ir_core.preprocessing import TextPreprocessor
+from ir_core.spimi import DEFAULT_MEMORY_BUDGET, SpimiIndexer
+from ir_core.titles import TitleIndex
 
 # nltk.download('punkt')
 # nltk.download('wordnet')
 # nltk.download('averaged_perceptron_tagger')
 # nltk.download('stopwords')
 
+# Shared preprocessing: the lemmatizer, stopwords and tagger are loaded once
+extract_nouns = TextPreprocessor()
+
+NOUN_INDEX_DIR = '.noun_index'
+
+# Default window, in words, for proximity searches
+PROXIMITY_WINDOW = 10
+
+# Repeated queries reuse their extracted nouns and, for the same index generation, their results
+query_cache = QueryCache()
+
 # Step 1: Define functions for document processing and noun indexing
-def gather_documents(folder_path):
-    documents = []
+# Yield documents one at a time, so only one file's content is in memory
+def iter_documents(folder_path):
     for filename in os.listdir(folder_path):
         if filename.endswith(".txt"):
             with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
                 content = file.read()
-                documents.append({
+                yield {
                     'title': filename,
                     'content': content
-                })
-    return documents
+                }
+
+def gather_documents(folder_path):
+    return list(iter_documents(folder_path))
 
 def tokenize_extract_nouns(content):
-    lemmatizer = WordNetLemmatizer()
-    stop_words = set(stopwords.words('english'))
-    tokens = word_tokenize(content)
-    tokens = [lemmatizer.lemmatize(token) for token in tokens if token.isalpha() and token not in stop_words]
-    nouns = [word for (word, pos) in nltk.pos_tag(tokens) if pos.startswith('N')]
-    return nouns
-
-def noun_indexer(documents):
-    inverted_index = defaultdict(lambda: defaultdict(int))
+    return extract_nouns(content)
+
+# Count the nouns that occur more than once within a paragraph of a document
+def document_noun_counts(content):
+    paragraphs = content.split('\n\n')
+    document_nouns = defaultdict(int)
+    for paragraph in paragraphs:
+        nouns = tokenize_extract_nouns(paragraph)
+        paragraph_noun_counts = defaultdict(int)
+        for noun in nouns:
+            paragraph_noun_counts[noun.lower()] += 1
+        for noun, count in paragraph_noun_counts.items():
+            if count > 1:
+                document_nouns[noun] += count
+    return document_nouns
+
+# Partial index for a chunk of documents, built from plain dicts so a worker process can return it
+def index_chunk(documents):
+    partial_index = {}
     for doc in documents:
         doc_name = doc['title']
-        paragraphs = doc['content'].split('\n\n')
-        document_nouns = defaultdict(int)
-        for paragraph in paragraphs:
-            nouns = tokenize_extract_nouns(paragraph)
-            paragraph_noun_counts = defaultdict(int)
-            for noun in nouns:
-                paragraph_noun_counts[noun.lower()] += 1
-            for noun, count in paragraph_noun_counts.items():
-                if count > 1:
-                    document_nouns[noun] += count
-        for noun, count in document_nouns.items():
-            inverted_index[noun][doc_name] += count
+        with instrument.document(doc_name):
+            for noun, count in document_noun_counts(doc['content']).items():
+                postings = partial_index.setdefault(noun, {})
+                postings[doc_name] = postings.get(doc_name, 0) + count
+            instrument.count('index.documents')
+    return partial_index
+
+# workers > 1 (or None for every core) indexes chunks of documents in a process pool;
+# partial indexes are merged in document order, so the result matches a serial build
+def noun_indexer(documents, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    inverted_index = defaultdict(lambda: defaultdict(int))
+    for partial_index in map_chunks(index_chunk, documents, workers, chunk_size):
+        with instrument.stage('index.insert'):
+            for noun, postings in partial_index.items():
+                for doc_name, count in postings.items():
+                    inverted_index[noun][doc_name] += count
     return inverted_index
 
+# Forward index (document -> nouns and counts) of a noun index, for per-document listings
+def forward_indexer(inverted_index):
+    return ForwardIndex.from_inverted_index(inverted_index)
+
+# Incrementally update a noun index built by noun_indexer: only .txt files added or modified
+# since the manifest was taken are read and tagged again, and deleted files are dropped.
+# With a forward_index, it is kept in step and stale documents are removed using only their
+# own nouns instead of a scan of the whole vocabulary. A title_index gets the added and deleted titles.
+# Returns the new manifest; documents and the indexes are updated in place
+def update_noun_index(folder_path, documents, inverted_index, manifest, forward_index=None, title_index=None):
+    new_manifest = scan_folder(folder_path, manifest)
+    changes = diff_manifests(manifest, new_manifest)
+    stale = set(changes.modified) | set(changes.deleted)
+    if title_index is not None:
+        for filename in changes.deleted:
+            title_index.remove(filename)
+        for filename in changes.added:
+            title_index.add(filename)
+
+    if stale:
+        documents[:] = [doc for doc in documents if doc['title'] not in stale]
+        if forward_index is not None:
+            for doc_name in stale:
+                for noun, _ in forward_index.remove_document(doc_name):
+                    postings = inverted_index.get(noun)
+                    if postings is not None:
+                        postings.pop(doc_name, None)
+                        if not postings:
+                            del inverted_index[noun]
+        else:
+            for noun in list(inverted_index):
+                postings = inverted_index[noun]
+                for doc_name in stale & postings.keys():
+                    del postings[doc_name]
+                if not postings:
+                    del inverted_index[noun]
+
+    for filename in changes.added + changes.modified:
+        with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
+            doc = {'title': filename, 'content': file.read()}
+        documents.append(doc)
+        noun_counts = document_noun_counts(doc['content'])
+        for noun, count in noun_counts.items():
+            inverted_index[noun][filename] += count
+        if forward_index is not None:
+            forward_index.add_document(filename, noun_counts)
+    return new_manifest
+
+# Streaming build for corpora larger than RAM: postings are spilled to sorted runs on disk
+# whenever the memory budget is reached, then merged into an on-disk index (see ir_core/spimi.py).
+# Its postings list (doc, count) pairs with integer counts, as in the in-memory index
+def stream_noun_index(folder_path, index_dir=None, memory_budget=DEFAULT_MEMORY_BUDGET):
+    index_dir = index_dir or os.path.join(folder_path, NOUN_INDEX_DIR)
+    fingerprint = corpus_fingerprint(folder_path)
+    indexer = SpimiIndexer(index_dir, memory_budget)
+    for doc in iter_documents(folder_path):
+        indexer.add_document(doc['title'], document_noun_counts(doc['content']))
+    indexer.finish(fingerprint)
+    return DiskCountIndex(index_dir)
+
+# Optional positional layer for phrase and proximity queries (see ir_core/positional.py)
+def positional_indexer(documents):
+    positional_index = PositionalIndex()
+    for doc in documents:
+        positional_index.add_document(doc['title'], *document_positions(doc['content'], extract_nouns))
+    return positional_index
+
+def query_noun_positions(query):
+    nouns, _ = extract_nouns.with_positions(query)
+    return [(noun.lower(), position) for noun, position in nouns]
+
+# Documents containing the query's nouns as an exact phrase, ranked by occurrences
+def search_phrase(positional_index, query):
+    return positional_index.phrase(query_noun_positions(query))
+
+# Documents with all of the query's nouns within window words of each other
+def search_near(positional_index, query, window=PROXIMITY_WINDOW):
+    return positional_index.near([noun for noun, _ in query_noun_positions(query)], window)
+
+# Documents with a paragraph containing all of the query's nouns
+def search_same_paragraph(positional_index, query):
+    return positional_index.same_paragraph([noun for noun, _ in query_noun_positions(query)])
+
 def search_by_title(documents, query):
     results = []
     for doc in documents:
@@ -66,12 +186,33 @@ def search_by_title(documents, query):
             results.append(doc)
     return results
 
-def search_by_content(inverted_index, documents, query):
-    nouns = tokenize_extract_nouns(query)
+# Trigram index over the titles, for substring, prefix and suffix queries without scanning
+# every title (see ir_core/titles.py)
+def title_indexer(documents):
+    return TitleIndex(doc['title'] for doc in documents)
+
+# Matching titles in document order; mode is 'substring', 'prefix', 'suffix' or 'exact'
+def search_title_index(title_index, query, mode='substring'):
+    return title_index.search(query, mode)
+
+# generation identifies the state of inverted_index (bump it whenever the index changes);
+# without one only the query's nouns are cached, not its results
+def search_by_content(inverted_index, documents, query, generation=None):
+    with instrument.query(query):
+        nouns = query_cache.terms(query, tokenize_extract_nouns)
+        if generation is None:
+            return rank_by_content(inverted_index, nouns)
+        return query_cache.results(nouns, 'content', None, generation,
+                                   lambda: rank_by_content(inverted_index, nouns))
+
+@instrument.timed('score.content')
+def rank_by_content(inverted_index, nouns):
     matching_documents = defaultdict(int)
     for noun in nouns:
         if noun in inverted_index:
-            for doc_name, count in inverted_index[noun].items():
+            postings = inverted_index[noun]
+            # In-memory indexes map doc -> count; on-disk indexes list (doc, count) pairs
+            for doc_name, count in (postings.items() if isinstance(postings, dict) else postings):
                 matching_documents[doc_name] += count
     ranked_documents = sorted(matching_documents.items(), key=lambda x: x[1], reverse=True)
     return ranked_documents
@@ -86,18 +227,32 @@ class DocumentSearchApp:
         # Document variables
         self.documents = []
         self.inverted_index = defaultdict(lambda: defaultdict(int))
+        # Document -> (noun, count), so results list their nouns without scanning the vocabulary
+        self.forward_index = ForwardIndex()
+        self.title_index = TitleIndex()
+        # Built on the first phrase or proximity search
+        self.positional_index = None
+        self.folder_path = None
+        self.manifest = None
+        # Bumped whenever the index changes, so cached results are dropped
+        self.index_generation = 0
         
         # GUI elements
         tk.Label(root, text="Document Search Engine", font=("Arial", 16)).pack(pady=10)
         
         # Buttons for folder selection and actions
         tk.Button(root, text="Load Documents", command=self.load_documents).pack(pady=5)
+        tk.Button(root, text="Refresh Index", command=self.refresh_documents).pack(pady=5)
         
         self.query_entry = tk.Entry(root, width=50)
         self.query_entry.pack(pady=5)
         
         tk.Button(root, text="Search by Title", command=self.search_by_title_gui).pack(pady=5)
+        tk.Button(root, text="Title Starts With", command=self.search_title_prefix_gui).pack(pady=5)
         tk.Button(root, text="Search by Content", command=self.search_by_content_gui).pack(pady=5)
+        tk.Button(root, text="Phrase Search", command=self.search_phrase_gui).pack(pady=5)
+        tk.Button(root, text="Proximity Search", command=self.search_near_gui).pack(pady=5)
+        tk.Button(root, text="Same Paragraph Search", command=self.search_same_paragraph_gui).pack(pady=5)
         
         # Results area
         self.result_text = scrolledtext.ScrolledText(root, width=70, height=20)
@@ -109,18 +264,50 @@ class DocumentSearchApp:
             messagebox.showwarning("Warning", "Please select a valid folder.")
             return
         
+        # Loading the same folder again only re-indexes the files that changed
+        if folder_path == self.folder_path and self.manifest is not None:
+            self.refresh_documents()
+            return
+        
+        manifest = scan_folder(folder_path)
         self.documents = gather_documents(folder_path)
         self.inverted_index = noun_indexer(self.documents)
+        self.forward_index = forward_indexer(self.inverted_index)
+        self.title_index = title_indexer(self.documents)
+        self.positional_index = None
+        self.folder_path = folder_path
+        self.manifest = manifest
+        self.index_generation += 1
         messagebox.showinfo("Success", "Documents loaded and indexed successfully.")
     
+    def refresh_documents(self):
+        if self.manifest is None:
+            messagebox.showwarning("Warning", "Please load documents first.")
+            return
+        
+        self.manifest = update_noun_index(self.folder_path, self.documents, self.inverted_index, self.manifest,
+                                          self.forward_index, self.title_index)
+        self.positional_index = None
+        self.index_generation += 1
+        messagebox.showinfo("Success", "Index updated with changed documents.")
+    
     def search_by_title_gui(self):
         query = self.query_entry.get()
         if not query:
             messagebox.showwarning("Warning", "Please enter a search query.")
             return
         
-        results = search_by_title(self.documents, query)
-        self.display_results([(doc['title'], 0) for doc in results])
+        results = search_title_index(self.title_index, query)
+        self.display_results([(title, 0) for title in results])
+    
+    def search_title_prefix_gui(self):
+        query = self.query_entry.get()
+        if not query:
+            messagebox.showwarning("Warning", "Please enter a search query.")
+            return
+        
+        results = search_title_index(self.title_index, query, 'prefix')
+        self.display_results([(title, 0) for title in results])
     
     def search_by_content_gui(self):
         query = self.query_entry.get()
@@ -128,9 +315,43 @@ class DocumentSearchApp:
             messagebox.showwarning("Warning", "Please enter a search query.")
             return
         
-        ranked_results = search_by_content(self.inverted_index, self.documents, query)
+        ranked_results = search_by_content(self.inverted_index, self.documents, query,
+                                            self.index_generation)
         self.display_results(ranked_results)
     
+    def get_positional_index(self):
+        if self.positional_index is None:
+            self.positional_index = positional_indexer(self.documents)
+        return self.positional_index
+    
+    def search_phrase_gui(self):
+        query = self.query_entry.get()
+        if not query:
+            messagebox.showwarning("Warning", "Please enter a search query.")
+            return
+        
+        self.display_results(search_phrase(self.get_positional_index(), query))
+    
+    def search_near_gui(self):
+        query = self.query_entry.get()
+        if not query:
+            messagebox.showwarning("Warning", "Please enter a search query.")
+            return
+        
+        window = simpledialog.askinteger("Proximity", "Maximum distance in words:",
+                                         initialvalue=PROXIMITY_WINDOW, minvalue=1)
+        if window is None:
+            return
+        self.display_results(search_near(self.get_positional_index(), query, window))
+    
+    def search_same_paragraph_gui(self):
+        query = self.query_entry.get()
+        if not query:
+            messagebox.showwarning("Warning", "Please enter a search query.")
+            return
+        
+        self.display_results(search_same_paragraph(self.get_positional_index(), query))
+    
     def display_results(self, ranked_documents):
         self.result_text.delete(1.0, tk.END)
         if not ranked_documents:
@@ -142,11 +363,11 @@ class DocumentSearchApp:
                 self.result_text.insert(tk.END, f"Title: {doc_name}\n")
                 continue
             self.result_text.insert(tk.END, f"Title: {doc_name} (Occurrence: {relevance})\n")
-            if doc_name in self.inverted_index:
+            nouns = self.forward_index.terms(doc_name)
+            if nouns:
                 self.result_text.insert(tk.END, f"Nouns found in '{doc_name}':\n")
-                for noun, count in self.inverted_index.items():
-                    if doc_name in count:
-                        self.result_text.insert(tk.END, f"{noun}: {count[doc_name]}\n")
+                for noun, count in nouns:
+                    self.result_text.insert(tk.END, f"{noun}: {count}\n")
             self.result_text.insert(tk.END, "=" * 50 + "\n")
 
 # Main Program
@@ -6,70 +6,179 @@ Created on Tue Oct  1 23:42:58 2024
 """
 
 import os
+import sys
+import json
 import math
 import nltk
 from collections import defaultdict
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+from functools import partial
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ir_core import instrument
+from ir_core.cache import QueryCache
+from ir_core.incremental import diff_manifests, load_manifest, save_manifest, scan_folder
+from ir_core.index_store import (DiskIndex, StaleIndexError, corpus_fingerprint,
+                                 default_index_dir, write_index)
+from ir_core.parallel import DEFAULT_CHUNK_SIZE, map_chunks
+from ir_core.preprocessing import TextPreprocessor
+from ir_core.scoring import rank, score_query, top_k_max_score
+from ir_core.sharding import DEFAULT_SHARDS, ShardedIndex
+
 # Download necessary NLTK data
 nltk.download('punkt')
 nltk.download('stopwords')
 
-stop_words = set(stopwords.words('english'))
+# Nouns (NN, NNS, NNP, NNPS) that are not stopwords, lowercased; no lemmatization
+extract_nouns = TextPreprocessor(lemmatize=False, tag_all_tokens=True, lowercase_output=True)
+
+# Saved next to the index so it can be updated without re-processing unchanged files
+MANIFEST_FILE = 'manifest.json'
+TF_CACHE_FILE = 'doc_tf.json'
+
+# Shard indexes of the sharded mode go here, inside the documents folder
+SHARD_DIR_NAME = '.tfidf_shards'
+
+# Repeated queries reuse their preprocessed words and, while the folder is unchanged, their rankings
+query_cache = QueryCache()
 
 # Preprocess the text
 def preprocess(document):
-    words = word_tokenize(document)
-    tagged_words = nltk.pos_tag(words)
-    processed_doc = []
-    for word, pos in tagged_words:
-        if pos in ['NN', 'NNS', 'NNP', 'NNPS'] and word.lower() not in stop_words:
-            processed_doc.append(word.lower())
-    return processed_doc
-
-# Create inverted index with TF-IDF scores
-def create_index(dir_path):
-    inverted_index = defaultdict(list)
-    doc_count = defaultdict(int)
-    total_docs = 0
-
-    for filename in os.listdir(dir_path):
-        if filename.endswith('.txt'):
-            total_docs += 1
-            with open(os.path.join(dir_path, filename), 'r', encoding='utf8') as file:
-                document = file.read().lower()
-                processed_doc = preprocess(document)
-                doc_word_count = defaultdict(int)
-                
-                # Count the occurrences of each word
-                for word in processed_doc:
-                    doc_word_count[word] += 1
-                
-                # Total number of words in the document
-                total_terms = len(processed_doc)
-                
-                # Add the words to the inverted index with normalized TF
-                for word, count in doc_word_count.items():
-                    tf = count / total_terms  # Normalized Term Frequency
-                    inverted_index[word].append((filename, tf))
-                    doc_count[word] += 1
-
-    # Now calculate the TF-IDF score for each word
+    return extract_nouns(document)
+
+# Term counts for some of the files in a directory: {word: [(filename, count), ...]}
+def count_files(dir_path, filenames):
+    partial_counts = {}
+    for filename in filenames:
+        with open(os.path.join(dir_path, filename), 'r', encoding='utf8') as file, instrument.document(filename):
+            document = file.read().lower()
+            processed_doc = preprocess(document)
+            doc_word_count = defaultdict(int)
+            
+            # Count the occurrences of each word
+            for word in processed_doc:
+                doc_word_count[word] += 1
+            instrument.count('index.documents')
+            
+            for word, count in doc_word_count.items():
+                partial_counts.setdefault(word, []).append((filename, count))
+    return partial_counts
+
+# Partial index of normalized TF postings for some of the files in a directory
+def index_files(dir_path, filenames):
+    partial_counts = count_files(dir_path, filenames)
+
+    # Total number of words in each document
+    total_terms = defaultdict(int)
+    for postings in partial_counts.values():
+        for filename, count in postings:
+            total_terms[filename] += count
+
+    # Normalized Term Frequency
+    return {word: [(filename, count / total_terms[filename]) for filename, count in postings]
+            for word, postings in partial_counts.items()}
+
+def inverse_document_frequency(df, total_docs):
+    return math.log((total_docs + 1) / (df + 1)) + 1  # Corrected IDF calculation
+
+# Turn normalized TF postings into TF-IDF scores, in place
+@instrument.timed('index.idf')
+def apply_idf(inverted_index, total_docs):
     for word in inverted_index:
-        df = doc_count[word]
-        idf = math.log((total_docs + 1) / (df + 1)) + 1  # Corrected IDF calculation
+        df = len(inverted_index[word])
+        idf = inverse_document_frequency(df, total_docs)
         for i, (doc, tf) in enumerate(inverted_index[word]):
             tfidf = tf * idf
             inverted_index[word][i] = (doc, tfidf)
-    
     return inverted_index
 
+# Save the index together with the file manifest and per-document TF used by update_index
+@instrument.timed('index.write')
+def save_index(index_dir, inverted_index, doc_tf, manifest, fingerprint):
+    write_index(index_dir, inverted_index, list(doc_tf), fingerprint)
+    with open(os.path.join(index_dir, TF_CACHE_FILE), 'w', encoding='utf-8') as file:
+        json.dump(doc_tf, file)
+    save_manifest(os.path.join(index_dir, MANIFEST_FILE), manifest)
+
+# Create inverted index with TF-IDF scores and save it next to the documents.
+# workers > 1 (or None for every core) preprocesses chunks of files in a process pool;
+# partial indexes are merged in file order, so the result matches a serial build
+def create_index(dir_path, index_dir=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    inverted_index = defaultdict(list)
+
+    # Fingerprint before reading, so edits made during the build mark the index stale
+    fingerprint = corpus_fingerprint(dir_path)
+    manifest = scan_folder(dir_path)
+
+    doc_names = [filename for filename in os.listdir(dir_path) if filename.endswith('.txt')]
+    total_docs = len(doc_names)
+    doc_tf = {filename: {} for filename in doc_names}
+
+    for partial_index in map_chunks(partial(index_files, dir_path), doc_names, workers, chunk_size):
+        with instrument.stage('index.insert'):
+            for word, postings in partial_index.items():
+                inverted_index[word].extend(postings)
+                for filename, tf in postings:
+                    doc_tf[filename][word] = tf
+
+    # Now calculate the TF-IDF score for each word
+    apply_idf(inverted_index, total_docs)
+
+    save_index(index_dir or default_index_dir(dir_path), inverted_index, doc_tf, manifest, fingerprint)
+    return inverted_index
+
+# Bring a saved index up to date: only added or modified files are preprocessed again,
+# deleted files are dropped, and document frequencies and IDF are recomputed from the cached TF
+def update_index(dir_path, index_dir=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    index_dir = index_dir or default_index_dir(dir_path)
+    try:
+        manifest = load_manifest(os.path.join(index_dir, MANIFEST_FILE))
+        with open(os.path.join(index_dir, TF_CACHE_FILE), 'r', encoding='utf-8') as file:
+            doc_tf = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return create_index(dir_path, index_dir, workers, chunk_size)
+
+    fingerprint = corpus_fingerprint(dir_path)
+    new_manifest = scan_folder(dir_path, manifest)
+    changes = diff_manifests(manifest, new_manifest)
+
+    for filename in changes.deleted:
+        doc_tf.pop(filename, None)
+    # Modified files keep their position (and doc id); added files go at the end
+    changed = changes.modified + changes.added
+    for filename in changed:
+        doc_tf[filename] = {}
+    for partial_index in map_chunks(partial(index_files, dir_path), changed, workers, chunk_size):
+        for word, postings in partial_index.items():
+            for filename, tf in postings:
+                doc_tf[filename][word] = tf
+
+    inverted_index = defaultdict(list)
+    for filename, word_tf in doc_tf.items():
+        for word, tf in word_tf.items():
+            inverted_index[word].append((filename, tf))
+    apply_idf(inverted_index, len(doc_tf))
+
+    save_index(index_dir, inverted_index, doc_tf, new_manifest, fingerprint)
+    return inverted_index
+
+# Open the saved index, updating it first if it is missing or out of date.
+# Pass the folder's fingerprint if the caller has already computed it
+def load_index(dir_path, index_dir=None, rebuild=True, fingerprint=None):
+    index_dir = index_dir or default_index_dir(dir_path)
+    try:
+        return DiskIndex(index_dir, expected_fingerprint=fingerprint or corpus_fingerprint(dir_path))
+    except (FileNotFoundError, StaleIndexError):
+        if not rebuild:
+            raise
+    update_index(dir_path, index_dir)
+    return DiskIndex(index_dir)
+
 
 # TF-IDF scoring function
+@instrument.timed('score.tf_idf')
 def tf_idf(query, document, inverted_index):
     score = 0
     query_words = preprocess(query)
@@ -80,7 +189,16 @@ def tf_idf(query, document, inverted_index):
                     score += tfidf
     return score
 
+# Magnitude of a document's full TF-IDF vector
+def document_norm(document, inverted_index):
+    # Saved indexes store the norm of every document, so this is a lookup
+    if hasattr(inverted_index, 'document_norm'):
+        return inverted_index.document_norm(document)
+    return math.sqrt(sum(tfidf**2 for postings in inverted_index.values()
+                         for doc, tfidf in postings if doc == document))
+
 # Cosine similarity calculation
+@instrument.timed('score.cosine_similarity')
 def cosine_similarity(query, document, inverted_index):
     query_words = preprocess(query)
     query_vector = defaultdict(float)
@@ -89,18 +207,18 @@ def cosine_similarity(query, document, inverted_index):
     for word in query_words:
         query_vector[word] += 1  # Term frequency in the query
 
-    for word in query_words:
+    for word in query_vector:
         if word in inverted_index:
             for doc, tfidf in inverted_index[word]:
                 if doc == document:
                     document_vector[word] = tfidf
 
     # Compute dot product
-    dot_product = sum(query_vector[word] * document_vector[word] for word in query_words)
+    dot_product = sum(query_vector[word] * document_vector[word] for word in query_vector)
 
-    # Compute magnitudes
+    # Compute magnitudes; the document side covers all of its terms, not just the query's
     query_magnitude = math.sqrt(sum(val**2 for val in query_vector.values()))
-    document_magnitude = math.sqrt(sum(val**2 for val in document_vector.values()))
+    document_magnitude = document_norm(document, inverted_index)
 
     if query_magnitude == 0 or document_magnitude == 0:
         return 0  # Avoid division by zero
@@ -108,23 +226,74 @@ def cosine_similarity(query, document, inverted_index):
     # Compute cosine similarity
     return dot_product / (query_magnitude * document_magnitude)
 
+# The folder and its corpus fingerprint: cached rankings are dropped when any file changes.
+# Each query fingerprints the folder once, and a cache miss hands the fingerprint on to load_index
+def index_generation(dir_path):
+    return (os.path.abspath(dir_path), corpus_fingerprint(dir_path))
+
 # Search function to compute and rank results
+# With instrumentation enabled, each query's stages are also recorded on their own
 def search(query, dir_path):
-    inverted_index = create_index(dir_path)
-    tfidf_scores = {}
-    cosine_scores = {}
-
-    for filename in os.listdir(dir_path):
-        if filename.endswith('.txt'):
-            tfidf_scores[filename] = tf_idf(query, filename, inverted_index)
-            cosine_scores[filename] = cosine_similarity(query, filename, inverted_index)
-
-    # Rank documents
-    ranked_tfidf = sorted(tfidf_scores.items(), key=lambda x: x[1], reverse=False)
-    ranked_cosine = sorted(cosine_scores.items(), key=lambda x: x[1], reverse=False)
+    with instrument.query(query):
+        query_words = query_cache.terms(query, preprocess)
+        generation = index_generation(dir_path)
+        return query_cache.results(query_words, 'tfidf+cosine', None, generation,
+                                   lambda: rank_query(query_words, dir_path, generation[1]))
+
+def rank_query(query_words, dir_path, fingerprint=None):
+    # One pass over each query term's postings scores every matching document
+    with load_index(dir_path, fingerprint=fingerprint) as inverted_index:
+        tfidf_scores, cosine_scores = score_query(inverted_index, query_words)
+
+        # Rank documents
+        with instrument.stage('score.rank'):
+            # Every document is listed, the ones without a query term with 0.0, lowest score first
+            ranked_tfidf = rank(tfidf_scores, inverted_index.doc_names, every_document=True)
+            ranked_cosine = rank(cosine_scores, inverted_index.doc_names, every_document=True)
 
     return ranked_tfidf, ranked_cosine
 
+# Top-k search: the k best documents for each model, best first
+def search_top_k(query, dir_path, k=10):
+    with instrument.query(query):
+        query_words = query_cache.terms(query, preprocess)
+        generation = index_generation(dir_path)
+        return query_cache.results(query_words, 'tfidf+cosine', k, generation,
+                                   lambda: rank_query_top_k(query_words, dir_path, k, generation[1]))
+
+def rank_query_top_k(query_words, dir_path, k, fingerprint=None):
+    with load_index(dir_path, fingerprint=fingerprint) as inverted_index:
+        names = inverted_index.doc_names
+        top_tfidf = top_k_max_score(inverted_index, query_words, k)
+        top_cosine = top_k_max_score(inverted_index, query_words, k, cosine=True)
+
+    return ([(names[doc], score) for doc, score in top_tfidf],
+            [(names[doc], score) for doc, score in top_cosine])
+
+# Batch search on the vectorized backend (needs numpy and scipy): one
+# (ranked_tfidf, ranked_cosine) pair per query, same shape as search()
+def search_batch(queries, dir_path):
+    from ir_core.sparse_backend import SparseScorer
+
+    query_words = [query_cache.terms(query, preprocess) for query in queries]
+    with load_index(dir_path) as inverted_index:
+        scorer = SparseScorer(inverted_index)
+    return scorer.rank_batch(query_words)
+
+# Sharded mode: the folder is split into num_shards index shards, each built and served
+# by its own worker process with global IDF, so scores match a single index exactly.
+# Close the returned ShardedIndex (or use it in a with block) to stop the workers
+def open_sharded_index(dir_path, num_shards=DEFAULT_SHARDS, index_root=None):
+    filenames = [filename for filename in os.listdir(dir_path) if filename.endswith('.txt')]
+    return ShardedIndex(filenames, partial(count_files, dir_path), inverse_document_frequency,
+                        index_root or os.path.join(dir_path, SHARD_DIR_NAME), num_shards)
+
+# Top-k search over a sharded index, best first; same shape as search_top_k
+def search_sharded(query, sharded_index, k=10):
+    query_words = query_cache.terms(query, preprocess)
+    return (sharded_index.search(query_words, k, 'tfidf'),
+            sharded_index.search(query_words, k, 'cosine'))
+
 # GUI class for the desktop application
 class SearchEngineApp:
     def __init__(self, root):
@@ -1,13 +1,20 @@
 import os
+import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox, simpledialog
-import networkx as nx
-import matplotlib.pyplot as plt
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
 import nltk
-from collections import defaultdict
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from ir_core.bitmap import BitmapIndex
+from ir_core.boolean import QuerySyntaxError, run_query
+from ir_core.cache import QueryCache, normalize_query
+from ir_core.incremental import diff_manifests, scan_folder
+from ir_core.minhash import LSHIndex
+from ir_core.postings import CompressedIndex, DocIdMap
+from ir_core.preprocessing import TextPreprocessor
+from ir_core.probabilistic import ProbabilisticIndex
+from ir_core.termgraph import TermDocumentGraph, draw
 
 # Download required NLTK resources
 nltk.download('punkt', quiet=True)
@@ -21,8 +28,25 @@ class DocumentRetrievalApp:
         self.root.title("Document Retrieval App")
         self.root.geometry("400x500")
         self.folder_path = ""
-        self.inverted_index = defaultdict(set)
+        # Compressed term -> documents postings, built from term_docs after a load and patched on refresh
+        self.inverted_index = CompressedIndex.from_sets({})
+        # The same postings as bitmaps, for boolean queries
+        self.bitmap_index = BitmapIndex.from_sets({})
+        # Term frequencies, precomputed weights and document lengths for BIM / BM25
+        self.probabilistic_index = ProbabilisticIndex.from_documents({})
+        # Term <-> document graph in CSR arrays, for proximal node queries
+        self.term_graph = TermDocumentGraph.from_documents({})
+        # Each document's term counts, and each term's documents
         self.document_terms = {}
+        self.term_docs = defaultdict(set)
+        # MinHash signatures of each document's term set, for near-duplicate and similar document search
+        self.minhash_index = LSHIndex()
+        self.manifest = None
+        self.max_results = 20
+        self.preprocessor = TextPreprocessor(lowercase=True)
+        # Preprocessed queries and their results; index_generation is bumped on every rebuild
+        self.query_cache = QueryCache()
+        self.index_generation = 0
 
         # Create UI elements
         self.create_ui()
@@ -31,6 +55,7 @@ class DocumentRetrievalApp:
         tk.Label(self.root, text="Document Retrieval System", font=("Arial", 16, "bold")).pack(pady=10)
 
         tk.Button(self.root, text="Select Folder", command=self.select_folder, width=20).pack(pady=5)
+        tk.Button(self.root, text="Refresh Index", command=self.refresh_folder, width=20).pack(pady=5)
 
         self.folder_label = tk.Label(self.root, text="No folder selected.", font=("Arial", 12))
         self.folder_label.pack(pady=5)
@@ -38,100 +63,181 @@ class DocumentRetrievalApp:
         tk.Button(self.root, text="Non-Overlapping Retrieval", command=self.non_overlapping_retrieval, width=30).pack(pady=5)
         tk.Button(self.root, text="Probabilistic Retrieval", command=self.probabilistic_retrieval, width=30).pack(pady=5)
         tk.Button(self.root, text="Proximal Nodes Retrieval", command=self.proximal_node_retrieval, width=30).pack(pady=5)
+        tk.Button(self.root, text="Similar Documents", command=self.similar_documents, width=30).pack(pady=5)
 
     def select_folder(self):
         folder = filedialog.askdirectory()
         if folder:
+            # Re-selecting the same folder only re-processes the files that changed
+            same_folder = folder == self.folder_path and self.manifest is not None
             self.folder_path = folder
             self.folder_label.config(text=f"Selected Folder: {folder}")
-            self.process_documents(folder)
+            if same_folder:
+                self.update_documents(folder)
+            else:
+                self.process_documents(folder)
         else:
             self.folder_label.config(text="No folder selected.")
 
+    def refresh_folder(self):
+        if not self.folder_path or self.manifest is None:
+            messagebox.showerror("Error", "No documents processed.")
+            return
+        changes = self.update_documents(self.folder_path)
+        if changes is not None:
+            messagebox.showinfo("Index Updated",
+                                f"Added: {len(changes.added)}, Modified: {len(changes.modified)}, "
+                                f"Deleted: {len(changes.deleted)}")
+
     def preprocess_text(self, text, include_adjectives=False):
         """
         Preprocess text by tokenizing, lemmatizing, and filtering
+        (lowercase, drop stopwords, lemmatize, keep nouns and optionally adjectives)
         """
-        lemmatizer = WordNetLemmatizer()
-        stop_words = set(stopwords.words('english'))
-        
-        # Tokenize and lowercase
-        tokens = word_tokenize(text.lower())
-        
-        # Remove non-alphabetic tokens and stopwords
-        tokens = [token for token in tokens if token.isalpha() and token not in stop_words]
-        
-        # Lemmatize tokens
-        tokens = [lemmatizer.lemmatize(token) for token in tokens]
-        
-        # Add POS tagging for filtering
-        pos_tags = nltk.pos_tag(tokens)
-        
-        # Filter tokens based on POS
-        if include_adjectives:
-            filtered_tokens = [word for word, pos in pos_tags 
-                               if pos.startswith('N') or pos.startswith('J')]
-        else:
-            filtered_tokens = [word for word, pos in pos_tags 
-                               if pos.startswith('N')]
-        
-        return filtered_tokens
+        return self.preprocessor(text, include_adjectives=include_adjectives)
+
+    def preprocess_query(self, query, include_adjectives=False):
+        """
+        preprocess_text for queries, cached per normalized query
+        """
+        return self.query_cache.terms(query, lambda text: self.preprocess_text(text, include_adjectives),
+                                      include_adjectives)
 
     def process_documents(self, directory):
         """
         Process documents in the given directory and create an inverted index
         """
-        self.inverted_index.clear()
+        self.inverted_index = CompressedIndex.from_sets({})
+        self.bitmap_index = BitmapIndex.from_sets({})
+        self.probabilistic_index = ProbabilisticIndex.from_documents({})
+        self.term_graph = TermDocumentGraph.from_documents({})
         self.document_terms.clear()
+        self.term_docs.clear()
+        self.minhash_index = LSHIndex(self.minhash_index.threshold)
+        self.manifest = None
+        self.index_generation += 1
         
         if not os.path.exists(directory):
             messagebox.showerror("Error", "Invalid folder path.")
             return
         
+        # Record the files before reading them, so edits made meanwhile are picked up later
+        manifest = scan_folder(directory)
         for filename in os.listdir(directory):
             if filename.endswith(".txt"):
-                file_path = os.path.join(directory, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                        # Extract terms with adjectives
-                        terms = self.preprocess_text(content, include_adjectives=True)
-                        
-                        # Store document terms
-                        self.document_terms[filename] = set(terms)
-                        
-                        # Create inverted index
-                        for term in terms:
-                            self.inverted_index[term].add(filename)
-                except Exception as e:
-                    messagebox.showwarning("Warning", f"Could not process {filename}: {str(e)}")
+                self.index_document(directory, filename)
+        self.build_postings()
+        self.manifest = manifest
+
+    def update_documents(self, directory):
+        """
+        Incrementally update the index: re-process only the .txt files that were
+        added or modified since the last scan and drop deleted ones
+        """
+        if not os.path.exists(directory):
+            messagebox.showerror("Error", "Invalid folder path.")
+            return None
+        
+        manifest = scan_folder(directory, self.manifest)
+        changes = diff_manifests(self.manifest or {}, manifest)
+        # Terms whose postings change: those of the old and the new versions of the files
+        touched = set()
+        for filename in changes.modified + changes.deleted:
+            touched.update(self.document_terms.get(filename, ()))
+            self.remove_document(filename)
+        for filename in changes.added + changes.modified:
+            self.index_document(directory, filename)
+            touched.update(self.document_terms.get(filename, ()))
+        if any(changes):
+            self.patch_postings(changes, touched)
+        self.manifest = manifest
+        return changes
+
+    def build_postings(self):
+        """
+        Encode term_docs into compressed postings and bitmaps with integer doc ids,
+        precompute the probabilistic term weights and build the term-document graph
+        """
+        # Every loaded document gets an id, so ones without any term still match NOT queries
+        doc_map = DocIdMap(sorted(self.document_terms))
+        self.inverted_index = CompressedIndex.from_sets(self.term_docs, doc_map)
+        self.bitmap_index = BitmapIndex.from_sets(self.term_docs, doc_map)
+        self.probabilistic_index = ProbabilisticIndex.from_documents(self.document_terms)
+        self.term_graph = TermDocumentGraph.from_documents(self.document_terms)
+        self.index_generation += 1
+
+    def patch_postings(self, changes, touched):
+        """
+        Apply a folder diff to the built indexes: only the postings of the touched
+        terms are re-encoded, and only the changed documents' graph rows rebuilt
+        """
+        indexed = {filename: self.document_terms[filename]
+                   for filename in changes.added + changes.modified if filename in self.document_terms}
+        # Modified files that could not be read again are gone as well
+        removed = [filename for filename in changes.modified + changes.deleted
+                   if filename not in self.document_terms]
+        term_docs = {term: self.term_docs.get(term, ()) for term in touched}
+        self.inverted_index.update(term_docs)
+        self.bitmap_index.update(term_docs, added=indexed, removed=removed)
+        self.probabilistic_index.update(indexed, removed)
+        self.term_graph.update(indexed, removed)
+        self.index_generation += 1
+
+    def index_document(self, directory, filename):
+        """
+        Extract one document's terms; build_postings or patch_postings adds them to the indexes
+        """
+        file_path = os.path.join(directory, filename)
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                content = file.read()
+                # Extract terms with adjectives
+                terms = self.preprocess_text(content, include_adjectives=True)
+                
+                # Store document term counts
+                self.document_terms[filename] = Counter(terms)
+                for term in self.document_terms[filename]:
+                    self.term_docs[term].add(filename)
+                self.minhash_index.add(filename, terms)
+        except Exception as e:
+            messagebox.showwarning("Warning", f"Could not process {filename}: {str(e)}")
+
+    def remove_document(self, filename):
+        """
+        Forget one document; patch_postings drops it from the indexes
+        """
+        for term in self.document_terms.pop(filename, ()):
+            docs = self.term_docs[term]
+            docs.discard(filename)
+            if not docs:
+                del self.term_docs[term]
+        self.minhash_index.remove(filename)
 
     def non_overlapping_retrieval(self):
         """
         Non-Overlapping Retrieval: Retrieve documents for multiple query terms
+        (comma-separated terms are OR-ed; AND, OR, NOT and parentheses are supported)
         """
         if not self.inverted_index:
             messagebox.showerror("Error", "No documents processed.")
             return
         
         # Get user query
-        query = simpledialog.askstring("Query", "Enter search terms (comma-separated):")
+        query = simpledialog.askstring("Query", "Enter search terms (comma-separated, or AND / OR / NOT):")
         if not query:
             return
         
-        # Preprocess query terms
-        query_terms = [term.strip().lower() for term in query.split(',')]
-        query_terms = self.preprocess_text(' '.join(query_terms))
-        
-        # Retrieve documents for each term
-        results = set()
-        for term in query_terms:
-            if term in self.inverted_index:
-                results.update(self.inverted_index[term])
+        # Preprocess the query's terms and combine their bitmaps
+        try:
+            results = self.query_cache.results(normalize_query(query), 'boolean', None, self.index_generation,
+                                               lambda: run_query(query, self.bitmap_index, self.preprocess_query))
+        except QuerySyntaxError as e:
+            messagebox.showerror("Error", f"Invalid query: {e}")
+            return
         
         # Display results
         self.display_results("Non-Overlapping Retrieval", 
-                             "\n".join(sorted(results)) if results else "No documents found.")
+                             "\n".join(results) if results else "No documents found.")
 
     def probabilistic_retrieval(self):
         """
@@ -147,39 +253,43 @@ class DocumentRetrievalApp:
             return
         
         # Preprocess query
-        query_terms = self.preprocess_text(query, include_adjectives=True)
-        
-        # Calculate document scores using Jaccard coefficient
-        document_scores = {}
-        for doc, doc_terms in self.document_terms.items():
-            # Calculate Jaccard similarity
-            query_term_set = set(query_terms)
-            doc_term_set = set(doc_terms)
-            
-            intersection = len(query_term_set & doc_term_set)
-            union = len(query_term_set | doc_term_set)
-            
-            # Calculate similarity score
-            similarity = (intersection / union) * 100 if union > 0 else 0
-            document_scores[doc] = similarity
-        
-        # Sort and rank documents
-        ranked_results = sorted(document_scores.items(), 
-                                key=lambda x: x[1], 
-                                reverse=True)
-        
-        # Format results
-        results = "\n".join([f"Rank {i+1}: {doc} - Score: {score:.2f}%" 
-                             for i, (doc, score) in enumerate(ranked_results) 
-                             if score > 0])
+        query_terms = self.preprocess_query(query, include_adjectives=True)
+        
+        # Rank the best documents with both models
+        sections = []
+        titles = {'bim': "BIM (RSJ weights)", 'bm25': "BM25",
+                  'bim_feedback': "BIM with pseudo-relevance feedback"}
+        for model, title in titles.items():
+            ranked_results = self.rank_probabilistic(query_terms, k=self.max_results, model=model)
+            lines = [f"Rank {i+1}: {doc} - Score: {score:.4f}"
+                     for i, (doc, score) in enumerate(ranked_results)
+                     if score > 0]
+            sections.append(title + ":\n" + ("\n".join(lines) if lines else "No relevant documents found."))
         
         # Display results
-        self.display_results("Probabilistic Retrieval", 
-                             results if results else "No relevant documents found.")
+        self.display_results("Probabilistic Retrieval", "\n\n".join(sections))
+
+    def rank_probabilistic(self, query_terms, k=None, model='bm25'):
+        """
+        Rank documents with the Binary Independence Model ('bim'), BIM with one round of
+        pseudo-relevance feedback ('bim_feedback') or BM25 ('bm25'), best first. Term
+        weights and document lengths are precomputed when the index is built, so only
+        the query terms' postings are visited. Results are cached until the index changes.
+        """
+        return self.query_cache.results(tuple(query_terms), model, k, self.index_generation,
+                                        lambda: self._rank_probabilistic(query_terms, k, model))
+
+    def _rank_probabilistic(self, query_terms, k, model):
+        if model == 'bim':
+            return self.probabilistic_index.rank_bim(query_terms, k)
+        if model == 'bim_feedback':
+            return self.probabilistic_index.rank_bim_feedback(query_terms, k)
+        return self.probabilistic_index.rank_bm25(query_terms, k)
 
     def proximal_node_retrieval(self):
         """
-        Proximal Nodes Retrieval: Create a graph of related documents
+        Proximal Nodes Retrieval: documents near the query terms in the term-document graph,
+        with related terms and documents; the graph is drawn only if asked for
         """
         if not self.inverted_index:
             messagebox.showerror("Error", "No documents processed.")
@@ -189,38 +299,67 @@ class DocumentRetrievalApp:
         query = simpledialog.askstring("Query", "Enter keywords for proximal nodes:")
         if not query:
             return
+        hops = simpledialog.askinteger("Hops", "Maximum distance in edges from the keywords:",
+                                       initialvalue=1, minvalue=1)
+        if hops is None:
+            return
         
         # Preprocess query terms
-        query_terms = self.preprocess_text(query)
+        query_terms = self.preprocess_query(query)
         
-        # Create graph
-        G = nx.Graph()
-        
-        # Add query terms as nodes
-        for term in query_terms:
-            G.add_node(term, type='keyword')
-            
-            # Connect to documents containing the term
-            if term in self.inverted_index:
-                for doc in self.inverted_index[term]:
-                    G.add_node(doc, type='document')
-                    G.add_edge(term, doc)
+        graph = self.term_graph
+        documents = graph.documents_within(query_terms, hops)[:self.max_results]
+        sections = [
+            (f"Documents within {hops} hop(s)", [f"{doc} - {distance} hop(s)" for doc, distance in documents]),
+            ("Related terms (co-occurrence weight)",
+             [f"{term} - {weight}" for term, weight in graph.related_terms(query_terms, self.max_results)]),
+            ("Related documents (shared term weight)",
+             [f"{doc} - {weight}" for doc, weight in graph.related_documents(query_terms, self.max_results)]),
+        ]
+        sections = [title + ":\n" + ("\n".join(lines) if lines else "None found.") for title, lines in sections]
+        self.display_results("Proximal Nodes", "\n\n".join(sections))
         
         # Visualize graph
-        plt.figure(figsize=(10, 8))
-        pos = nx.spring_layout(G, seed=42)
-        
-        # Color nodes based on type
-        node_colors = ['blue' if G.nodes[node]['type'] == 'keyword' else 'red' 
-                       for node in G.nodes()]
-        
-        nx.draw(G, pos, with_labels=True, 
-                node_color=node_colors, 
-                font_size=10, 
-                node_size=500, 
-                font_weight='bold')
-        plt.title("Proximal Nodes Retrieval")
-        plt.show()
+        if documents and messagebox.askyesno("Proximal Nodes", "Draw the graph of these nodes?"):
+            neighborhood = graph.neighborhood(query_terms, hops)
+            draw(graph.subgraph_edges(neighborhood), query_terms, "Proximal Nodes Retrieval")
+
+    def similar_documents(self):
+        """
+        Documents similar to a given one ("more like this"), or every near-duplicate pair in the
+        folder, by the estimated Jaccard similarity of their term sets (MinHash / LSH)
+        """
+        if not self.document_terms:
+            messagebox.showerror("Error", "No documents processed.")
+            return
+        
+        filename = simpledialog.askstring("Similar Documents",
+                                          "Document name (leave empty to list near-duplicates):")
+        if filename is None:
+            return
+        threshold = simpledialog.askfloat("Similar Documents", "Minimum similarity (0-1):",
+                                          initialvalue=self.minhash_index.threshold,
+                                          minvalue=0.01, maxvalue=1.0)
+        if threshold is None:
+            return
+        # Re-band the signatures for the new threshold; they are not recomputed
+        if threshold != self.minhash_index.threshold:
+            self.minhash_index.set_threshold(threshold)
+        
+        filename = filename.strip()
+        if filename:
+            if filename not in self.minhash_index:
+                messagebox.showerror("Error", f"'{filename}' is not indexed.")
+                return
+            similar = self.minhash_index.more_like_this(filename, k=self.max_results)
+            lines = [f"{doc} - Similarity: {similarity:.2f}" for doc, similarity in similar]
+            self.display_results(f"More Like {filename}",
+                                 "\n".join(lines) if lines else "No similar documents found.")
+        else:
+            pairs = self.minhash_index.near_duplicates()
+            lines = [f"{first} ~ {second} - Similarity: {similarity:.2f}" for first, second, similarity in pairs]
+            self.display_results("Near-Duplicate",
+                                 "\n".join(lines) if lines else "No near-duplicate documents found.")
 
     def display_results(self, method, results):
         """
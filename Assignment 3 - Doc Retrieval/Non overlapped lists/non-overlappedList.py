@@ -1,28 +1,38 @@
 import os
+import sys
+import json
+import time
+import struct
+import argparse
 import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from ir_core.batch import preprocess_unique, read_queries, summarize, write_result
+from ir_core.bitmap import Bitmap, BitmapIndex
+from ir_core.boolean import QuerySyntaxError, evaluate, parse, run_query, word_runs
+from ir_core.index_store import StaleIndexError, corpus_fingerprint
+from ir_core.postings import DocIdMap
+from ir_core.preprocessing import TextPreprocessor
 
 nltk.download('punkt')
 nltk.download('stopwords')
 
+# Shared preprocessing: the lemmatizer, stopwords and tagger are loaded once
+extract_nouns = TextPreprocessor()
+
+# Bitmap index saved in the documents folder
+BITMAP_INDEX_FILE = '.bitmap_index'
+
 # Initialize an empty dictionary to store document data
 documents = {}
+# Every .txt file read, including those without a single noun (they still match NOT queries)
+document_names = set()
 
 def tokenize_extract_nouns(content):
-    # Initialize the lemmatizer and stop words
-    lemmatizer = WordNetLemmatizer()
-    stop_words = set(stopwords.words('english'))
-    # Split the text into tokens
-    tokens = word_tokenize(content)
-    # Remove stop words and non-alphabetic characters
-    tokens = [lemmatizer.lemmatize(token) for token in tokens if token.isalpha() and token not in stop_words]
-    # Extract the nouns from the tokens
-    nouns = [word for (word, pos) in nltk.pos_tag(tokens) if pos.startswith('N')]
-    return nouns
-
-def process_documents(directory):
+    # Tokenize, remove stop words and non-alphabetic tokens, lemmatize and keep the nouns
+    return extract_nouns(content)
+
+def process_documents(directory, verbose=True):
     # Check if the folder path exists
     if os.path.exists(directory):
         # Iterate through the files in the folder
@@ -31,7 +41,9 @@ def process_documents(directory):
             if filename.endswith(".txt"):
                 # Construct the full path to the file
                 file_path = os.path.join(directory, filename)
-                print(f"Reading file: {file_path}")
+                document_names.add(filename)
+                if verbose:
+                    print(f"Reading file: {file_path}")
 
                 # Reading the content of the file
                 with open(file_path, 'r', encoding='utf-8') as file:
@@ -44,7 +56,8 @@ def process_documents(directory):
                         if noun not in documents:
                             documents[noun] = set()  # Use set to store non-overlapping document lists
                         documents[noun].add(filename)  # Store the document in the set
-        print("Dictionary successfully created")
+        if verbose:
+            print("Dictionary successfully created")
     else:
         print("Invalid folder path. Please try again.")
 
@@ -53,28 +66,118 @@ def query_processing(user_query):
     query_nouns = tokenize_extract_nouns(user_query)
     return query_nouns
 
-def retrieve_documents_per_term(query_nouns, documents):
-    # Initialize an empty set to store non-overlapping results
-    non_overlap_results = set()
-
-    # Retrieve documents for each term and combine the sets
+def retrieve_documents_per_term(query_nouns, index):
+    # Union the bitmaps of the query terms; each document appears only once
+    matches = Bitmap()
     for noun in query_nouns:
-        if noun in documents:
-            non_overlap_results.update(documents[noun])
-    return non_overlap_results
+        if noun in index:
+            matches = matches | index[noun]
+    return index.names(matches)
+
+def boolean_retrieval(user_query, index):
+    # AND / OR / NOT and parentheses; plain terms are OR-ed as before
+    return run_query(user_query, index, tokenize_extract_nouns)
+
+def load_bitmap_index(folder_path, verbose=True):
+    # Reuse the saved bitmaps while the folder is unchanged, else rebuild them;
+    # a truncated or corrupt file (struct.error, ValueError) is rebuilt too
+    path = os.path.join(folder_path, BITMAP_INDEX_FILE)
+    fingerprint = corpus_fingerprint(folder_path)
+    try:
+        return BitmapIndex.load(path, fingerprint)
+    except (OSError, StaleIndexError, struct.error, ValueError):
+        pass
+    process_documents(folder_path, verbose)
+    index = BitmapIndex.from_sets(documents, DocIdMap(sorted(document_names)))
+    index.save(path, fingerprint)
+    return index
+
+# Batch mode: all queries are parsed first, every distinct word run of the batch is
+# preprocessed once (in a process pool), and each query's documents are written to
+# output as one JSON line. Returns the latency / throughput summary
+def run_batch(index, queries, output, workers=None):
+    start = time.perf_counter()
+    trees = {}
+    for _, text in queries:
+        if text not in trees:
+            try:
+                trees[text] = parse(text)
+            except QuerySyntaxError as e:
+                trees[text] = e
+    runs = [run for tree in trees.values() if not isinstance(tree, QuerySyntaxError)
+            for run in word_runs(tree)]
+    processed = preprocess_unique(runs, tokenize_extract_nouns, workers)
+    normalized = {run: terms for run, (terms, _) in processed.items()}
+    
+    latencies = []
+    seen = set()
+    for query_id, text in queries:
+        tree = trees[text]
+        # Each word run is charged to the first query that needed it
+        preprocess_seconds = 0.0
+        if not isinstance(tree, QuerySyntaxError):
+            for run in dict.fromkeys(word_runs(tree)):
+                if run not in seen:
+                    preprocess_seconds += processed[run][1]
+                    seen.add(run)
+        score_start = time.perf_counter()
+        if isinstance(tree, QuerySyntaxError):
+            results = {'error': f"Invalid query: {tree}"}
+        else:
+            results = index.names(evaluate(tree, index, normalized.__getitem__))
+        score_seconds = time.perf_counter() - score_start
+        write_result(output, query_id, text, results, preprocess_seconds, score_seconds)
+        latencies.append(preprocess_seconds + score_seconds)
+    return summarize(latencies, time.perf_counter() - start, unique_queries=len(trees),
+                     unique_word_runs=len(processed))
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(description="Run a file of boolean queries")
+    parser.add_argument('folder', help="folder containing the .txt documents")
+    parser.add_argument('queries', help="query file, one query per line ('-' for stdin)")
+    parser.add_argument('--output', default='-', help="JSONL results file ('-' for stdout)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="query preprocessing processes (default: every core)")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.folder):
+        print("Invalid folder path. Please try again.", file=sys.stderr)
+        return 1
+    index = load_bitmap_index(args.folder, verbose=False)
+    queries = read_queries(args.queries)
+    
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        summary = run_batch(index, queries, output, args.workers)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
 
 def main():
+    # With arguments, run a file of queries (see batch_main)
+    if len(sys.argv) > 1:
+        return batch_main(sys.argv[1:])
+    
     # Ask user for the folder path containing .txt files
     folder_path = input("Enter the folder path containing .txt files: ").strip()
     
-    # Process the documents in the given folder
-    process_documents(folder_path)
+    if not os.path.isdir(folder_path):
+        print("Invalid folder path. Please try again.")
+        return
+
+    # Process the documents in the given folder into one bitmap per noun
+    index = load_bitmap_index(folder_path)
 
-    if documents:
+    if index:
         # Get the user's query
-        user_query = input("Enter your query: ")
-        query_nouns = query_processing(user_query)
-        non_overlap_results = retrieve_documents_per_term(query_nouns, documents)
+        user_query = input("Enter your query (AND, OR, NOT and parentheses are supported): ")
+        try:
+            non_overlap_results = boolean_retrieval(user_query, index)
+        except QuerySyntaxError as e:
+            print(f"Invalid query: {e}")
+            return
 
         if non_overlap_results:
             print("Non-Overlapping Results:")
@@ -86,4 +189,4 @@ def main():
         print("No documents processed.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,27 +1,27 @@
 import os
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from ir_core.minhash import DEFAULT_THRESHOLD, LSHIndex
+from ir_core.batch import (format_ranking, preprocess_unique, read_queries, summarize, unique_terms,
+                           write_result)
+from ir_core.preprocessing import TextPreprocessor
+from ir_core.probabilistic import ProbabilisticIndex
 
 # Download required NLTK resources
 # nltk.download('punkt')
 # nltk.download('stopwords')
 # nltk.download('averaged_perceptron_tagger')
 
+# Shared preprocessing: lowercase, lemmatize, keep Nouns (N) and Adjectives (J)
+extract_words = TextPreprocessor(lowercase=True, include_adjectives=True)
+
 # Function to tokenize, remove stop words, and extract nouns and adjectives
 def tokenize_extract_words(content):
-    # Initialize lemmatizer and stop words
-    lemmatizer = WordNetLemmatizer()
-    stop_words = set(stopwords.words('english'))
-    
-    # Tokenize and remove non-alphabetical characters
-    tokens = word_tokenize(content.lower())
-    tokens = [lemmatizer.lemmatize(token) for token in tokens if token.isalpha() and token not in stop_words]
-    
-    # Extract nouns and adjectives using part-of-speech tagging
-    words = [word for word, pos in nltk.pos_tag(tokens) if pos.startswith('N') or pos.startswith('J')]  # Include Nouns (N) and Adjectives (J)
-    return words
+    return extract_words(content)
 
 # Function to process user query by tokenizing and extracting words (nouns + adjectives)
 def query_processing(user_query):
@@ -36,18 +36,119 @@ def jaccard_similarity(set1, set2):
     union = len(set1.union(set2))
     return (intersection / union) * 100
 
-# Function to rank documents based on BIM probabilistic retrieval
-def bim_probabilistic_ranking(query_words, documents):
-    document_scores = {}
-    for doc, doc_words in documents.items():
-        score = jaccard_similarity(set(query_words), doc_words)
-        document_scores[doc] = score
+# Build the postings and precompute the RSJ / BM25 term weights and document lengths once
+def build_probabilistic_index(documents):
+    return ProbabilisticIndex.from_documents(documents)
+
+# Rank documents with the Binary Independence Model: each document scores the sum of
+# the RSJ weights of the query words it contains; only their postings are visited.
+# decoded optionally holds postings already decoded for a batch of queries
+def bim_probabilistic_ranking(query_words, index, k=None, decoded=None):
+    return index.rank_bim(query_words, k, decoded)
+
+# Rank documents with BM25: RSJ-style IDF, term frequency saturation and
+# document length normalization
+def bm25_ranking(query_words, index, k=None, decoded=None):
+    return index.rank_bm25(query_words, k, decoded)
+
+# BIM with pseudo-relevance feedback: the top documents are taken as relevant, the
+# term weights are re-estimated from them, the best new terms are added and the
+# collection is re-scored
+def bim_feedback_ranking(query_words, index, k=None, iterations=1, decoded=None):
+    return index.rank_bim_feedback(query_words, k, iterations=iterations, decoded=decoded)
+
+# MinHash signatures of every document's word set, bucketed for similarity lookups (see
+# ir_core/minhash.py); threshold is the estimated Jaccard similarity that counts as similar
+def build_minhash_index(documents, threshold=DEFAULT_THRESHOLD):
+    lsh = LSHIndex(threshold)
+    for filename, words in documents.items():
+        lsh.add(filename, words)
+    return lsh
+
+# Pairs of documents whose word sets are at least threshold similar, without comparing every pair.
+# Each pair's exact Jaccard similarity (as a percentage) is recomputed from the word sets
+def near_duplicates(documents, lsh, threshold=None):
+    return [(first, second, jaccard_similarity(set(documents[first]), set(documents[second])))
+            for first, second, _ in lsh.near_duplicates(threshold)]
+
+# Documents most similar to filename, [(document, estimated Jaccard similarity)]
+def more_like_this(lsh, filename, k=5, threshold=None):
+    return lsh.more_like_this(filename, threshold, k)
+
+RANKINGS = {'bim': bim_probabilistic_ranking, 'bm25': bm25_ranking, 'bim_feedback': bim_feedback_ranking}
+
+# {filename: words} for every .txt file in a folder
+def read_documents(folder_path, verbose=True):
+    documents = {}
+    for filename in os.listdir(folder_path):
+        if filename.endswith(".txt"):
+            file_path = os.path.join(folder_path, filename)
+            if verbose:
+                print(f"Processing file: {file_path}")
+            
+            with open(file_path, 'r', encoding='utf-8') as file:
+                content = file.read()
+                words = tokenize_extract_words(content)
+                documents[filename] = words
+    return documents
+
+# Batch mode: every distinct query is preprocessed once (in a process pool), the postings of
+# every distinct term are decoded once for the whole batch, and each query's rankings are
+# written to output as one JSON line. Returns the latency / throughput summary
+def run_batch(index, queries, output, k=10, models=tuple(RANKINGS), workers=None):
+    start = time.perf_counter()
+    processed = preprocess_unique([text for _, text in queries], query_processing, workers)
+    decoded = index.decode_postings(unique_terms(terms for terms, _ in processed.values()))
+    latencies = []
+    seen = set()
+    for query_id, text in queries:
+        query_words, preprocess_seconds = processed[text]
+        # A repeated query shares the preprocessing of its first occurrence
+        if text in seen:
+            preprocess_seconds = 0.0
+        seen.add(text)
+        score_start = time.perf_counter()
+        results = {model: format_ranking(RANKINGS[model](query_words, index, k, decoded=decoded))
+                   for model in models}
+        score_seconds = time.perf_counter() - score_start
+        write_result(output, query_id, text, results, preprocess_seconds, score_seconds)
+        latencies.append(preprocess_seconds + score_seconds)
+    return summarize(latencies, time.perf_counter() - start, unique_queries=len(processed),
+                     unique_terms=len(decoded), models=list(models))
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(description="Rank a file of queries with BIM / BM25")
+    parser.add_argument('folder', help="folder containing the .txt documents")
+    parser.add_argument('queries', help="query file, one query per line ('-' for stdin)")
+    parser.add_argument('--output', default='-', help="JSONL results file ('-' for stdout)")
+    parser.add_argument('-k', type=int, default=10, help="results per query and model")
+    parser.add_argument('--model', choices=list(RANKINGS) + ['all'], default='all')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="query preprocessing processes (default: every core)")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.folder):
+        print("Invalid folder path. Please try again.", file=sys.stderr)
+        return 1
+    documents = read_documents(args.folder, verbose=False)
+    index = build_probabilistic_index(documents)
+    queries = read_queries(args.queries)
+    models = tuple(RANKINGS) if args.model == 'all' else (args.model,)
     
-    # Sort documents by score in descending order
-    ranked_documents = sorted(document_scores.items(), key=lambda x: x[1], reverse=True)
-    return ranked_documents
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        summary = run_batch(index, queries, output, args.k, models, args.workers)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
 
 def main():
+    # With arguments, rank a file of queries (see batch_main)
+    if len(sys.argv) > 1:
+        return batch_main(sys.argv[1:])
+    
     # Ask user for the folder path containing .txt files
     folder_path = input("Enter the folder path containing .txt files: ").strip()
     
@@ -56,41 +157,47 @@ def main():
         print("Invalid folder path. Please try again.")
         return
     
-    # Initialize dictionary to store document content
-    documents = {}
-    
-    # Iterate through all .txt files in the folder
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(folder_path, filename)
-            print(f"Processing file: {file_path}")
-            
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                words = tokenize_extract_words(content)
-                documents[filename] = set(words)
+    # Read and preprocess every .txt file in the folder
+    documents = read_documents(folder_path)
     
     if not documents:
         print("No valid .txt files found in the specified folder.")
         return
     
+    # Index time: postings, term weights and document lengths, and the MinHash signatures
+    index = build_probabilistic_index(documents)
+    lsh = build_minhash_index(documents)
+    
     # Get the user's query
     user_query = input("Enter your search query: ").strip()
     
     # Process the user's query to extract nouns and adjectives
     query_words = query_processing(user_query)
     
-    # Rank the documents based on BIM probabilistic retrieval
-    ranked_documents = bim_probabilistic_ranking(query_words, documents)
-    
-    # Display the top-K results (K = 5 in this case)
-    if ranked_documents:
-        K = min(5, len(ranked_documents))  # Show top 5 or fewer if fewer documents are available
+    # Rank the documents with BIM and BM25, keeping the top-K (K = 5 in this case)
+    for model, ranking in (("BIM", bim_probabilistic_ranking), ("BM25", bm25_ranking),
+                           ("BIM with pseudo-relevance feedback", bim_feedback_ranking)):
+        ranked_documents = ranking(query_words, index, k=5)
         
-        for i, (doc, score) in enumerate(ranked_documents[:K]):
-            print(f"Rank {i + 1}: '{doc}' - Similarity Score: {score:.2f}")
-    else:
-        print("No relevant documents found.")
+        # Display the top-K results (top 5 or fewer if fewer documents are available)
+        print(f"{model} results:")
+        if ranked_documents:
+            for i, (doc, score) in enumerate(ranked_documents):
+                print(f"Rank {i + 1}: '{doc}' - Score: {score:.4f}")
+        else:
+            print("No relevant documents found.")
+    
+    # Documents similar to the best BM25 match, found through the MinHash index
+    top_documents = bm25_ranking(query_words, index, k=1)
+    if top_documents:
+        top_document = top_documents[0][0]
+        similar = more_like_this(lsh, top_document)
+        print(f"More like '{top_document}':")
+        if similar:
+            for doc, similarity in similar:
+                print(f"'{doc}' - Similarity: {similarity * 100:.1f}%")
+        else:
+            print("No similar documents found.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,10 +1,20 @@
-import networkx as nx
 import os
-import matplotlib.pyplot as plt
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-import nltk
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+from ir_core.positional import PositionalIndex, document_positions
+from ir_core.preprocessing import TextPreprocessor
+from ir_core.termgraph import TermDocumentGraph, draw
+
+# Shared preprocessing: the lemmatizer, stopwords and tagger are loaded once
+extract_nouns = TextPreprocessor()
+
+# Nouns at most this many words apart count as proximal
+PROXIMITY_WINDOW = 10
+
+# Graph queries: edges to walk from the query nouns, and how many related nouns / files to list
+HOPS = 1
+RELATED_LIMIT = 5
 
 def noun_indexer(documents, result, filename):
     for noun in result:
@@ -17,19 +27,8 @@ def noun_indexer(documents, result, filename):
 
 
 def tokenize_extract_nouns(content):
-    # Initialize the lemmatizer and stop words
-    lemmatizer = WordNetLemmatizer()
-    stop_words = set(stopwords.words('english'))
-    # Split the text into tokens
-    tokens = word_tokenize(content)
-    # Remove stop words and non-alphabetic characters
-    tokens = [lemmatizer.lemmatize(
-        token) for token in tokens if token.isalpha() and token not in stop_words]
-    # Extract the nouns from the tokens
-    nouns = [word for (word, pos) in nltk.pos_tag(
-        tokens) if pos.startswith('N')]
-    # print(nouns)
-    return nouns
+    # Tokenize, remove stop words and non-alphabetic tokens, lemmatize and keep the nouns
+    return extract_nouns(content)
 
 def read_text_files_in_folder(folder_path):
 
@@ -59,7 +58,34 @@ def read_text_files_in_folder(folder_path):
     print(documents)
     return documents
 
+def build_positional_index(folder_path):
+    # Token positions of every noun, for proximity queries
+    positional_index = PositionalIndex()
+    for filename in os.listdir(folder_path):
+        if filename.endswith(".txt"):
+            with open(os.path.join(folder_path, filename), 'r', encoding='utf-8') as file:
+                positional_index.add_document(filename, *document_positions(file.read(), extract_nouns))
+    return positional_index
+
+# Term-document graph in CSR arrays, built once and queried without networkx (see ir_core/termgraph.py)
+def build_term_graph(noun_dict):
+    return TermDocumentGraph.from_postings(noun_dict)
+
+# Files within hops edges of the keywords, the nouns that co-occur with them most and
+# the files holding the most of them
+def query_term_graph(term_graph, keywords, hops=HOPS, k=RELATED_LIMIT):
+    return {
+        'files': term_graph.documents_within(keywords, hops),
+        'related_nouns': term_graph.related_terms(keywords, k),
+        'related_files': term_graph.related_documents(keywords, k),
+    }
+
+def draw_term_graph(term_graph, keywords, hops=HOPS):
+    neighborhood = term_graph.neighborhood(keywords, hops)
+    draw(term_graph.subgraph_edges(neighborhood), keywords)
+
 def build_subgraph(noun_dict, selected_keywords):
+    import networkx as nx
     G = nx.Graph()
     
     # Add selected keywords as nodes
@@ -82,9 +108,12 @@ def build_subgraph(noun_dict, selected_keywords):
     
     return G
 
-def main():
+# show_graph=False (or --no-graph on the command line) only prints the results
+def main(show_graph=True):
     directory = 'C:\\Users\\Ayesha Nadeem\\OneDrive\\Documents\\semester 7\\IR\\Assignment 1 - Indexer\\Folder'
     noun_dict = read_text_files_in_folder(directory)
+    term_graph = build_term_graph(noun_dict)
+    positional_index = None
 
     while True:
         user_query = input("Enter your query (or 'q' to quit): ")
@@ -96,17 +125,29 @@ def main():
         
         if res:
             print(f'The user query "{res}" is connected to the following files:')
+
+            # Files in which the query nouns really are close to each other
+            keywords = [noun.lower() for noun in res]
+            if len(set(keywords)) > 1:
+                if positional_index is None:
+                    positional_index = build_positional_index(directory)
+                for filename, matches in positional_index.near(keywords, PROXIMITY_WINDOW):
+                    print(f'{filename}: within {PROXIMITY_WINDOW} words {matches} time(s)')
             
-            # Build the graph for the selected keyword and connected files
-            G = build_subgraph(noun_dict, res)
+            results = query_term_graph(term_graph, keywords)
+            for filename, hops in results['files']:
+                print(f'{filename}: {hops} hop(s) away')
+            if results['related_nouns']:
+                print('Related nouns: ' + ', '.join(f'{noun} ({weight})' for noun, weight in results['related_nouns']))
+            if results['related_files']:
+                print('Most related files: ' + ', '.join(f'{filename} ({weight})'
+                                                         for filename, weight in results['related_files']))
             
-            # Draw the graph
-            pos = nx.spring_layout(G, seed=42)
-            node_colors = ['blue' if node in res else 'red' for node in G.nodes()]
-            nx.draw(G, pos, with_labels=True, node_color=node_colors)
-            plt.show()
+            # Draw the graph of the keywords and connected files
+            if show_graph:
+                draw_term_graph(term_graph, keywords)
         else:
             print(f'The user query "{res}" was not found in any file.')
 
 if __name__ == "__main__":
-    main()
+    main(show_graph='--no-graph' not in sys.argv[1:])
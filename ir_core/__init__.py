@@ -0,0 +1,6 @@
+"""
+Shared indexing and retrieval components used by the assignment scripts.
+
+The scripts live in folders whose names are not valid Python package names,
+so each of them puts the repository root on sys.path and imports from here.
+"""
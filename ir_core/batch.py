@@ -0,0 +1,127 @@
+"""
+Batch query runs for offline evaluation.
+
+Queries are read one per line from a file or stdin ('-'); a line may start
+with an id and a tab, otherwise the line number is the id. A batch shares
+work across its queries:
+
+- each distinct query text is preprocessed once, and the NLTK work is
+  spread over a process pool (ir_core/parallel.py);
+- the scripts then fetch the postings of each distinct term of the whole
+  batch once (e.g. ProbabilisticIndex.decode_postings) and score every
+  query from them.
+
+Only the preprocessing runs in parallel. Scoring stays serial in the
+calling process, next to the index: once the postings are decoded it costs
+far less per query than tagging does, and handing the index to worker
+processes (pickled, where they are spawned) would cost more than it saves.
+
+Every query's results are written as one JSON line as soon as they are
+ready, with its preprocessing and scoring time; summarize() gives the
+latency percentiles and throughput of the run.
+"""
+
+import sys
+import json
+import time
+from functools import partial
+
+from ir_core.parallel import DEFAULT_CHUNK_SIZE, map_chunks
+
+
+def read_queries(source):
+    """
+    [(query id, query text)] from a path, '-' for stdin, or an open file
+    """
+    if source == '-':
+        return parse_queries(sys.stdin)
+    if isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as file:
+            return parse_queries(file)
+    return parse_queries(source)
+
+
+def parse_queries(lines):
+    queries = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        query_id, tab, text = line.partition('\t')
+        if not tab:
+            query_id, text = str(line_number), line
+        queries.append((query_id, text.strip()))
+    return queries
+
+
+def _preprocess_chunk(preprocess, texts):
+    results = []
+    for text in texts:
+        start = time.perf_counter()
+        terms = tuple(preprocess(text))
+        results.append((terms, time.perf_counter() - start))
+    return results
+
+
+def preprocess_unique(texts, preprocess, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    {text: (terms, seconds)} with every distinct text preprocessed once.
+    preprocess must be picklable (a module-level function) when workers != 1.
+    """
+    unique = list(dict.fromkeys(texts))
+    processed = {}
+    position = 0
+    for chunk in map_chunks(partial(_preprocess_chunk, preprocess), unique, workers, chunk_size):
+        for result in chunk:
+            processed[unique[position]] = result
+            position += 1
+    return processed
+
+
+def unique_terms(term_lists):
+    """
+    Every distinct term of a batch, in first-seen order
+    """
+    return list(dict.fromkeys(term for terms in term_lists for term in terms))
+
+
+def format_ranking(ranked):
+    return [{'document': name, 'score': score} for name, score in ranked]
+
+
+def write_result(output, query_id, query, results, preprocess_seconds, score_seconds):
+    """
+    One JSON line: the query, its results (any JSON value, e.g. a
+    format_ranking list or one per model) and its timing
+    """
+    record = {'id': query_id, 'query': query, 'results': results,
+              'preprocess_ms': round(preprocess_seconds * 1000, 3),
+              'score_ms': round(score_seconds * 1000, 3),
+              'latency_ms': round((preprocess_seconds + score_seconds) * 1000, 3)}
+    output.write(json.dumps(record) + '\n')
+    output.flush()
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies, elapsed, **fields):
+    """
+    Latency percentiles (ms) and throughput (queries/s) of a run; latencies
+    are per-query seconds and elapsed the wall time of the whole run
+    """
+    ordered = sorted(latencies)
+    summary = dict(fields)
+    summary.update({
+        'queries': len(ordered),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_qps': round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency_mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'latency_p50_ms': round(_percentile(ordered, 0.5) * 1000, 3),
+        'latency_p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+        'latency_max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    })
+    return summary
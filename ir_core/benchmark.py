@@ -0,0 +1,383 @@
+"""
+Benchmarks for every retrieval model of the assignments.
+
+    python -m ir_core.benchmark [--docs 1000] [--vocab 5000] [--zipf 1.1]
+                                [--queries 200] [--models indexer,tfidf,...]
+                                [--output benchmark.json] [--compare old.json]
+                                [--stages]
+
+A deterministic synthetic corpus (ir_core/synthetic.py) is written to a
+folder. Then each model is built and queried through its script's own
+functions. Every model runs in a fresh process, so its peak RSS is its own.
+The results go to a JSON file:
+
+    {"config": {...}, "environment": {...},
+     "models": {name: {"build_s", "docs_per_s", "mb_per_s", "index_bytes",
+                       "peak_rss_bytes", "queries": {kind: {"count",
+                       "mean_ms", "p50_ms", "p99_ms"}}}}}
+
+--compare prints each timing and size against an earlier run's file.
+--stages adds each model's stage timings and counters (ir_core/instrument.py)
+as "stages" and "counters".
+
+Query latencies are for uncached queries: the query caches are emptied
+before every timed query. They include query preprocessing, which is how
+the scripts run a query.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import pickle
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ir_core import instrument
+from ir_core.synthetic import CORPUS_MARKER, CorpusConfig, CorpusGenerator
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+SCRIPTS = {
+    'indexer': os.path.join('Assignment 1 - Indexer', 'assignment1_indexer.py'),
+    'tfidf': os.path.join('Assignment 2 - Ranking System', 'TF-IDFscoring.py'),
+    'non_overlapped': os.path.join('Assignment 3 - Doc Retrieval', 'Non overlapped lists', 'non-overlappedList.py'),
+    'probabilistic': os.path.join('Assignment 3 - Doc Retrieval', 'Probabalistic', 'probabilistic.py'),
+    'proximal': os.path.join('Assignment 3 - Doc Retrieval', 'Proximal nodes', 'proximalNodes.py'),
+}
+
+DEFAULT_QUERIES = 200
+DEFAULT_K = 10
+
+
+def load_script(name):
+    """
+    Import one of the assignment scripts as a module (without running main)
+    """
+    path = os.path.normpath(os.path.join(_REPO_ROOT, SCRIPTS[name]))
+    spec = importlib.util.spec_from_file_location(f"benchmark_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def directory_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, filename))
+               for root, _, filenames in os.walk(path) for filename in filenames)
+
+
+def latency_summary(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return {'count': 0}
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 4)
+
+    return {'count': len(ordered), 'mean_ms': round(sum(ordered) / len(ordered) * 1000, 4),
+            'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99)}
+
+
+def time_queries(queries, run, before=None):
+    """
+    Latency summary of run(query) over the queries; before() runs untimed
+    ahead of each query
+    """
+    seconds = []
+    for query in queries:
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        run(query)
+        seconds.append(time.perf_counter() - start)
+    return latency_summary(seconds)
+
+
+def _build(func, *args, **kwargs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _clear_cache(module):
+    return lambda: module.query_cache.clear()
+
+
+def bench_indexer(folder_path, queries, k, workers):
+    a1 = load_script('indexer')
+    documents = a1.gather_documents(folder_path)
+    index, build_seconds = _build(a1.noun_indexer, documents, workers)
+    positional_index, positional_seconds = _build(a1.positional_indexer, documents)
+    return {
+        'build_s': build_seconds,
+        'index_bytes': len(pickle.dumps({noun: dict(postings) for noun, postings in index.items()})),
+        'positional_build_s': positional_seconds,
+        'positional_index_bytes': positional_index.nbytes(),
+        'queries': {
+            'content': time_queries(queries, lambda query: a1.search_by_content(index, documents, query),
+                                    _clear_cache(a1)),
+            'phrase': time_queries(queries, lambda query: a1.search_phrase(positional_index, query)),
+            'near': time_queries(queries, lambda query: a1.search_near(positional_index, query)),
+        },
+    }
+
+
+def bench_tfidf(folder_path, queries, k, workers):
+    a2 = load_script('tfidf')
+    index_dir = a2.default_index_dir(folder_path)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    _, build_seconds = _build(a2.create_index, folder_path, workers=workers)
+    return {
+        'build_s': build_seconds,
+        'index_bytes': directory_size(index_dir),
+        'queries': {
+            'tfidf_cosine': time_queries(queries, lambda query: a2.search(query, folder_path),
+                                         _clear_cache(a2)),
+            'tfidf_cosine_top_k': time_queries(queries, lambda query: a2.search_top_k(query, folder_path, k),
+                                               _clear_cache(a2)),
+        },
+    }
+
+
+def bench_non_overlapped(folder_path, queries, k, workers):
+    no = load_script('non_overlapped')
+    path = os.path.join(folder_path, no.BITMAP_INDEX_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+    index, build_seconds = _build(no.load_bitmap_index, folder_path, verbose=False)
+    return {
+        'build_s': build_seconds,
+        'index_bytes': directory_size(path),
+        'queries': {
+            'boolean_or': time_queries(queries, lambda query: no.boolean_retrieval(query, index)),
+            'boolean_and': time_queries(queries, lambda query: no.boolean_retrieval(' AND '.join(query.split()),
+                                                                                    index)),
+        },
+    }
+
+
+def bench_probabilistic(folder_path, queries, k, workers):
+    pr = load_script('probabilistic')
+
+    def build():
+        return pr.build_probabilistic_index(pr.read_documents(folder_path, verbose=False))
+
+    index, build_seconds = _build(build)
+    return {
+        'build_s': build_seconds,
+        'index_bytes': index.postings.nbytes(),
+        'queries': {model: time_queries(queries, lambda query, ranking=ranking:
+                                        ranking(pr.query_processing(query), index, k))
+                    for model, ranking in pr.RANKINGS.items()},
+    }
+
+
+def bench_proximal(folder_path, queries, k, workers):
+    px = load_script('proximal')
+
+    def build():
+        noun_dict = px.read_text_files_in_folder(folder_path)
+        return noun_dict, px.build_term_graph(noun_dict), px.build_positional_index(folder_path)
+
+    (noun_dict, term_graph, positional_index), build_seconds = _build(build)
+
+    def query_graph(query):
+        nouns = [noun.lower() for noun in px.tokenize_extract_nouns(query)]
+        px.query_term_graph(term_graph, nouns)
+        positional_index.near(nouns, px.PROXIMITY_WINDOW)
+
+    return {
+        'build_s': build_seconds,
+        'index_bytes': len(pickle.dumps(noun_dict)) + term_graph.nbytes() + positional_index.nbytes(),
+        'queries': {'proximal_nodes': time_queries(queries, query_graph)},
+    }
+
+
+MODELS = {
+    'indexer': bench_indexer,
+    'tfidf': bench_tfidf,
+    'non_overlapped': bench_non_overlapped,
+    'probabilistic': bench_probabilistic,
+    'proximal': bench_proximal,
+}
+
+
+def run_model(name, folder_path, queries, k, workers, stages=False):
+    """
+    Benchmark one model; meant to run in a fresh process
+    """
+    if stages:
+        instrument.enable()
+    metrics = MODELS[name](folder_path, queries, k, workers)
+    metrics['peak_rss_bytes'] = peak_rss_bytes()
+    if stages:
+        snapshot = instrument.snapshot()
+        metrics['stages'] = snapshot['stages']
+        metrics['counters'] = snapshot['counters']
+    return metrics
+
+
+def clear_corpus_dir(folder_path):
+    """
+    Delete a corpus folder written by an earlier run. A folder that is not
+    empty and has no CORPUS_MARKER was not written by the generator, so it
+    is left alone and ValueError is raised.
+    """
+    if not os.path.exists(folder_path):
+        return
+    if not os.path.isdir(folder_path):
+        raise ValueError(f"{folder_path} is not a folder")
+    if os.listdir(folder_path) and not os.path.isfile(os.path.join(folder_path, CORPUS_MARKER)):
+        raise ValueError(f"{folder_path} is not empty and does not hold a generated corpus; "
+                         "choose a new or empty folder")
+    shutil.rmtree(folder_path)
+
+
+def run_benchmarks(config, folder_path, num_queries=DEFAULT_QUERIES, models=tuple(MODELS),
+                   k=DEFAULT_K, workers=1, stages=False):
+    """
+    Write the corpus for config to folder_path and benchmark the models.
+    folder_path must be new, empty, or a corpus written by an earlier run.
+    """
+    generator = CorpusGenerator(config)
+    clear_corpus_dir(folder_path)
+    generator.write(folder_path)
+    queries = generator.queries(num_queries)
+    corpus_bytes = directory_size(folder_path)
+
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in models:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            metrics = pool.submit(run_model, name, folder_path, queries, k, workers, stages).result()
+        build_seconds = metrics['build_s']
+        for key in ('build_s', 'positional_build_s'):
+            if key in metrics:
+                metrics[key] = round(metrics[key], 4)
+        metrics['docs_per_s'] = round(config.num_docs / build_seconds, 1) if build_seconds else None
+        metrics['mb_per_s'] = round(corpus_bytes / 1e6 / build_seconds, 3) if build_seconds else None
+        results[name] = metrics
+
+    return {
+        'config': dict(config._asdict(), num_queries=num_queries, k=k, workers=workers,
+                       corpus_bytes=corpus_bytes),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'models': results,
+    }
+
+
+def _flatten(metrics, prefix=''):
+    flat = {}
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(previous, current):
+    """
+    Lines of 'model metric: old -> new (ratio)' for the timings and sizes of
+    two benchmark results
+    """
+    lines = []
+    for model, metrics in current['models'].items():
+        old = _flatten(previous.get('models', {}).get(model, {}))
+        for metric, value in sorted(_flatten(metrics).items()):
+            if metric.endswith('count') or metric not in old or not old[metric]:
+                continue
+            lines.append(f"{model} {metric}: {old[metric]:.4g} -> {value:.4g} ({value / old[metric]:.2f}x)")
+    return lines
+
+
+def main(argv=None):
+    defaults = CorpusConfig()
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval models on a synthetic corpus")
+    parser.add_argument('--docs', type=int, default=defaults.num_docs)
+    parser.add_argument('--vocab', type=int, default=defaults.vocab_size)
+    parser.add_argument('--zipf', type=float, default=defaults.zipf_s)
+    parser.add_argument('--paragraphs', type=int, nargs=2, default=defaults.paragraphs, metavar=('MIN', 'MAX'))
+    parser.add_argument('--sentences', type=int, nargs=2, default=defaults.sentences, metavar=('MIN', 'MAX'),
+                        help="sentences per paragraph")
+    parser.add_argument('--sentence-words', type=int, nargs=2, default=defaults.sentence_words,
+                        metavar=('MIN', 'MAX'))
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES)
+    parser.add_argument('-k', type=int, default=DEFAULT_K)
+    parser.add_argument('--workers', type=int, default=1, help="indexing processes, where a model supports them")
+    parser.add_argument('--models', default=','.join(MODELS),
+                        help=f"comma-separated subset of {', '.join(MODELS)}")
+    parser.add_argument('--corpus-dir', help="where to write the corpus: a new or empty folder, or one written "
+                                             "by an earlier run (default: a temporary folder)")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help="an earlier --output file to compare against")
+    parser.add_argument('--stages', action='store_true', help="record per-stage timings of every model")
+    args = parser.parse_args(argv)
+
+    models = [name.strip() for name in args.models.split(',') if name.strip()]
+    unknown = [name for name in models if name not in MODELS]
+    if unknown:
+        parser.error(f"unknown models: {', '.join(unknown)}")
+    config = CorpusConfig(args.docs, args.vocab, args.zipf, tuple(args.paragraphs), tuple(args.sentences),
+                          tuple(args.sentence_words), args.seed)
+
+    temporary = None
+    folder_path = args.corpus_dir
+    if folder_path is not None:
+        try:
+            clear_corpus_dir(folder_path)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        temporary = tempfile.mkdtemp(prefix='ir_benchmark_')
+        folder_path = os.path.join(temporary, 'corpus')
+    try:
+        results = run_benchmarks(config, folder_path, args.queries, models, args.k, args.workers, args.stages)
+    finally:
+        if temporary is not None:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    for name, metrics in results['models'].items():
+        latencies = ', '.join(f"{kind} p50 {summary['p50_ms']:.2f} ms / p99 {summary['p99_ms']:.2f} ms"
+                              for kind, summary in metrics['queries'].items() if summary['count'])
+        print(f"{name}: built in {metrics['build_s']:.2f} s ({metrics['docs_per_s']} docs/s), "
+              f"{metrics['index_bytes']} bytes; {latencies}")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            previous = json.load(file)
+        for line in compare(previous, results):
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""
+Roaring-style compressed bitmaps of integer doc ids.
+
+A doc id is split into its high 16 bits, which select a container, and its
+low 16 bits, which are stored in that container. A container holding at most
+ARRAY_MAX ids is a sorted array('H'); a fuller one is a 65536-bit bitset held
+in a Python int, so AND/OR/AND NOT of two dense containers is a single
+big-integer operation done in C. Containers are converted back and forth
+after every operation so each stays in its smaller form.
+
+BitmapIndex maps terms to bitmaps and serializes to a single file.
+"""
+
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from ir_core.index_store import StaleIndexError
+from ir_core.postings import DocIdMap
+
+ARRAY_MAX = 4096
+CONTAINER_BITS = 1 << 16
+BITSET_BYTES = CONTAINER_BITS // 8
+
+_MAGIC = b'IRBM'
+_VERSION = 1
+_ARRAY, _BITSET = 0, 1
+_FILE_HEADER = struct.Struct('<4sHIII')
+_TERM_HEADER = struct.Struct('<II')
+_BITMAP_HEADER = struct.Struct('<I')
+_CONTAINER_HEADER = struct.Struct('<HBI')
+
+# Bit positions set in every byte value, for decoding bitsets
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+def _array_to_bits(values):
+    data = bytearray(BITSET_BYTES)
+    for value in values:
+        data[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _bits_to_array(bits):
+    values = array('H')
+    for i, byte in enumerate(bits.to_bytes(BITSET_BYTES, 'little')):
+        if byte:
+            base = i << 3
+            values.extend(base + bit for bit in _BYTE_BITS[byte])
+    return values
+
+
+def _filter_array(values, bits, keep):
+    """
+    Values whose bit in bits is set (keep=True) or clear (keep=False)
+    """
+    data = bits.to_bytes(BITSET_BYTES, 'little')
+    return array('H', (value for value in values
+                       if bool(data[value >> 3] >> (value & 7) & 1) == keep))
+
+
+def _cardinality(container):
+    return container.bit_count() if isinstance(container, int) else len(container)
+
+
+def _normalize(container):
+    """
+    Pick the smaller representation; None for an empty container
+    """
+    if isinstance(container, int):
+        if not container:
+            return None
+        if container.bit_count() <= ARRAY_MAX:
+            return _bits_to_array(container)
+        return container
+    if not container:
+        return None
+    if len(container) > ARRAY_MAX:
+        return _array_to_bits(container)
+    return container
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return _normalize(a & b)
+    if isinstance(a, int):
+        return _normalize(_filter_array(b, a, True))
+    if isinstance(b, int):
+        return _normalize(_filter_array(a, b, True))
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    large = set(large)
+    return _normalize(array('H', (value for value in small if value in large)))
+
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        a = a if isinstance(a, int) else _array_to_bits(a)
+        b = b if isinstance(b, int) else _array_to_bits(b)
+        return _normalize(a | b)
+    return _normalize(array('H', sorted(set(a).union(b))))
+
+
+def _and_not(a, b):
+    if isinstance(a, int):
+        b = b if isinstance(b, int) else _array_to_bits(b)
+        return _normalize(a ^ (a & b))
+    if isinstance(b, int):
+        return _normalize(_filter_array(a, b, False))
+    b = set(b)
+    return _normalize(array('H', (value for value in a if value not in b)))
+
+
+class Bitmap:
+    """
+    Compressed set of non-negative integers below 2**32
+    """
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, values=()):
+        self._containers = {}
+        groups = {}
+        for value in values:
+            groups.setdefault(value >> 16, set()).add(value & 0xFFFF)
+        for key, lows in groups.items():
+            self._containers[key] = _normalize(array('H', sorted(lows)))
+
+    @classmethod
+    def _from_containers(cls, containers):
+        bitmap = cls()
+        bitmap._containers = containers
+        return bitmap
+
+    @classmethod
+    def range(cls, stop):
+        """
+        Bitmap of 0 .. stop - 1, e.g. every doc id of a collection
+        """
+        containers = {}
+        for key in range(0, (stop + CONTAINER_BITS - 1) >> 16):
+            count = min(CONTAINER_BITS, stop - (key << 16))
+            containers[key] = _normalize((1 << count) - 1)
+        return cls._from_containers(containers)
+
+    def add(self, value):
+        key, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(key)
+        if container is None:
+            self._containers[key] = array('H', [low])
+        else:
+            self._containers[key] = _or(container, array('H', [low]))
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        i = bisect_left(container, low)
+        return i < len(container) and container[i] == low
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self._containers.values())
+
+    def __bool__(self):
+        return bool(self._containers)
+
+    def __iter__(self):
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            if isinstance(container, int):
+                container = _bits_to_array(container)
+            base = key << 16
+            for low in container:
+                yield base + low
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self._containers == other._containers
+
+    def _combine(self, other, op, keep_left, keep_right):
+        containers = {}
+        for key, container in self._containers.items():
+            other_container = other._containers.get(key)
+            if other_container is not None:
+                result = op(container, other_container)
+                if result is not None:
+                    containers[key] = result
+            elif keep_left:
+                containers[key] = container
+        if keep_right:
+            for key, container in other._containers.items():
+                if key not in self._containers:
+                    containers[key] = container
+        return Bitmap._from_containers(containers)
+
+    def __and__(self, other):
+        # Only keys present on both sides can survive
+        if len(other._containers) < len(self._containers):
+            return other._combine(self, _and, False, False)
+        return self._combine(other, _and, False, False)
+
+    def __or__(self, other):
+        return self._combine(other, _or, True, True)
+
+    def __sub__(self, other):
+        return self._combine(other, _and_not, True, False)
+
+    def nbytes(self):
+        return sum(BITSET_BYTES if isinstance(container, int) else 2 * len(container)
+                   for container in self._containers.values())
+
+    def to_bytes(self):
+        out = bytearray(_BITMAP_HEADER.pack(len(self._containers)))
+        for key in sorted(self._containers):
+            container = self._containers[key]
+            if isinstance(container, int):
+                out += _CONTAINER_HEADER.pack(key, _BITSET, container.bit_count())
+                out += container.to_bytes(BITSET_BYTES, 'little')
+            else:
+                out += _CONTAINER_HEADER.pack(key, _ARRAY, len(container))
+                out += container.tobytes()
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """
+        Decode a bitmap; returns (bitmap, offset just past it)
+        """
+        (count,) = _BITMAP_HEADER.unpack_from(data, offset)
+        offset += _BITMAP_HEADER.size
+        containers = {}
+        for _ in range(count):
+            key, kind, cardinality = _CONTAINER_HEADER.unpack_from(data, offset)
+            offset += _CONTAINER_HEADER.size
+            if kind == _BITSET:
+                containers[key] = int.from_bytes(data[offset:offset + BITSET_BYTES], 'little')
+                offset += BITSET_BYTES
+            else:
+                values = array('H')
+                values.frombytes(data[offset:offset + 2 * cardinality])
+                containers[key] = values
+                offset += 2 * cardinality
+        return cls._from_containers(containers), offset
+
+
+class BitmapIndex(Mapping):
+    """
+    Term -> Bitmap index over integer doc ids.
+
+    index[term] gives the Bitmap; names(bitmap) turns one back into document
+    names. universe holds every doc id, for NOT. update() replaces the
+    bitmaps of whole terms; removed documents keep their ids but leave the
+    universe, so save() is meant for indexes that were never updated.
+    """
+
+    def __init__(self, doc_map, bitmaps):
+        self.doc_map = doc_map
+        self._bitmaps = bitmaps
+        self.universe = Bitmap.range(len(doc_map))
+
+    @classmethod
+    def from_sets(cls, term_docs, doc_map=None):
+        """
+        Build from {term: set of doc names}
+        """
+        if doc_map is None:
+            doc_map = DocIdMap(sorted({doc for docs in term_docs.values() for doc in docs}))
+        bitmaps = {}
+        for term, docs in term_docs.items():
+            if docs:
+                bitmaps[term] = Bitmap(doc_map.add(doc) for doc in docs)
+        return cls(doc_map, bitmaps)
+
+    def update(self, term_docs, added=(), removed=()):
+        """
+        Replace the bitmaps of the given terms ({term: set of doc names}; a
+        term left without documents is dropped) and add / remove documents
+        from the universe
+        """
+        doc_map = self.doc_map
+        for term, docs in term_docs.items():
+            if docs:
+                self._bitmaps[term] = Bitmap(doc_map.add(doc) for doc in docs)
+            else:
+                self._bitmaps.pop(term, None)
+        if added or removed:
+            gone = Bitmap(doc_map.id(doc) for doc in removed if doc_map.id(doc) is not None)
+            self.universe = (self.universe - gone) | Bitmap(doc_map.add(doc) for doc in added)
+
+    def names(self, bitmap):
+        """
+        Document names of a bitmap's doc ids, in doc id order
+        """
+        names = self.doc_map.names
+        return [names[doc] for doc in bitmap]
+
+    def __getitem__(self, term):
+        return self._bitmaps[term]
+
+    def __contains__(self, term):
+        return term in self._bitmaps
+
+    def __iter__(self):
+        return iter(self._bitmaps)
+
+    def __len__(self):
+        return len(self._bitmaps)
+
+    def nbytes(self):
+        return sum(bitmap.nbytes() for bitmap in self._bitmaps.values())
+
+    def save(self, path, fingerprint=''):
+        """
+        Write the corpus fingerprint, the documents and every term's bitmap
+        to one file
+        """
+        key = fingerprint.encode('utf-8')
+        with open(path + '.tmp', 'wb') as file:
+            file.write(_FILE_HEADER.pack(_MAGIC, _VERSION, len(key), len(self.doc_map), len(self._bitmaps)))
+            file.write(key)
+            for name in self.doc_map.names:
+                key = name.encode('utf-8')
+                file.write(_BITMAP_HEADER.pack(len(key)))
+                file.write(key)
+            for term in sorted(self._bitmaps):
+                key = term.encode('utf-8')
+                data = self._bitmaps[term].to_bytes()
+                file.write(_TERM_HEADER.pack(len(key), len(data)))
+                file.write(key)
+                file.write(data)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path, expected_fingerprint=None):
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, key_length, num_docs, num_terms = _FILE_HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise StaleIndexError(f"{path} is not a version {_VERSION} bitmap index")
+        offset = _FILE_HEADER.size
+        fingerprint = data[offset:offset + key_length].decode('utf-8')
+        offset += key_length
+        if expected_fingerprint is not None and fingerprint != expected_fingerprint:
+            raise StaleIndexError("Index does not match the documents in the folder")
+        doc_map = DocIdMap()
+        for _ in range(num_docs):
+            (length,) = _BITMAP_HEADER.unpack_from(data, offset)
+            offset += _BITMAP_HEADER.size
+            doc_map.add(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        bitmaps = {}
+        for _ in range(num_terms):
+            key_length, data_length = _TERM_HEADER.unpack_from(data, offset)
+            offset += _TERM_HEADER.size
+            term = data[offset:offset + key_length].decode('utf-8')
+            offset += key_length
+            bitmaps[term], offset = Bitmap.from_bytes(data, offset)
+        if offset != len(data):
+            # A short array slice decodes without error, so a truncated file shows up here
+            raise StaleIndexError(f"{path} is truncated or corrupt")
+        return cls(doc_map, bitmaps)
@@ -0,0 +1,157 @@
+"""
+Boolean queries over a BitmapIndex.
+
+Grammar (operators are upper case, NOT binds tightest, then AND, then OR):
+
+    query   := or
+    or      := and ('OR' and)*
+    and     := not (['AND'] not)*
+    not     := 'NOT' not | '(' or ')' | words
+
+A run of plain words (commas and spaces both separate them) is passed as one
+piece of text to the normalize callback, and the documents of any of the
+terms it returns match, so a query without operators behaves like the
+original non-overlapping union. Operands next to each other without an
+operator are AND-ed, so "cat NOT dog" is "cat AND NOT dog" and "(cat) dog"
+is "cat AND dog", while "cat dog" stays one run. Words that normalize to
+nothing (stop words, non-nouns) are ignored rather than matching nothing:
+"the AND cat" is "cat".
+"""
+
+import re
+
+from ir_core.bitmap import Bitmap
+
+_TOKEN = re.compile(r'\(|\)|[^\s(),]+')
+_OPERATORS = {'AND', 'OR', 'NOT'}
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+def tokenize(query):
+    return _TOKEN.findall(query)
+
+
+def parse(query):
+    """
+    Parse a query into a nested tuple tree:
+    ('or', [...]), ('and', [...]), ('not', child) or ('words', text)
+    """
+    tokens = tokenize(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def take_if(token):
+        return take() if peek() == token else None
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == 'OR':
+            take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def parse_and():
+        children = [parse_not()]
+        # Operands next to each other without an operator are AND-ed too
+        while peek() not in (None, ')', 'OR'):
+            take_if('AND')
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def parse_not():
+        token = peek()
+        if token == 'NOT':
+            take()
+            return ('not', parse_not())
+        if token == '(':
+            take()
+            node = parse_or()
+            if take_if(')') is None:
+                raise QuerySyntaxError("Missing closing parenthesis")
+            return node
+        words = []
+        while peek() is not None and peek() not in _OPERATORS and peek() not in ('(', ')'):
+            words.append(take())
+        if not words:
+            raise QuerySyntaxError(f"Expected a term, got {token or 'end of query'}")
+        return ('words', ' '.join(words))
+
+    if not tokens:
+        return None
+    tree = parse_or()
+    if peek() is not None:
+        raise QuerySyntaxError(f"Unexpected {peek()}")
+    return tree
+
+
+def word_runs(tree):
+    """
+    The texts of a parsed query's 'words' nodes, in query order; a caller can
+    normalize them all up front and evaluate with a lookup
+    """
+    if tree is None:
+        return []
+    if tree[0] == 'words':
+        return [tree[1]]
+    if tree[0] == 'not':
+        return word_runs(tree[1])
+    return [text for child in tree[1] for text in word_runs(child)]
+
+
+def evaluate(tree, index, normalize):
+    """
+    Evaluate a parsed query against a BitmapIndex; returns a Bitmap
+    """
+    result = _evaluate(tree, index, normalize) if tree is not None else None
+    return result if result is not None else Bitmap()
+
+
+def _evaluate(node, index, normalize):
+    # None stands for "no constraint": a node whose words all normalized away
+    kind = node[0]
+    if kind == 'words':
+        terms = normalize(node[1])
+        if not terms:
+            return None
+        result = Bitmap()
+        for term in terms:
+            if term in index:
+                result = result | index[term]
+        return result
+    if kind == 'not':
+        child = _evaluate(node[1], index, normalize)
+        return None if child is None else index.universe - child
+    children = [child for child in (_evaluate(child, index, normalize) for child in node[1])
+                if child is not None]
+    if not children:
+        return None
+    if kind == 'or':
+        result = children[0]
+        for child in children[1:]:
+            result = result | child
+        return result
+    # Intersect the smallest operands first and stop once nothing is left
+    children.sort(key=len)
+    result = children[0]
+    for child in children[1:]:
+        if not result:
+            break
+        result = result & child
+    return result
+
+
+def run_query(query, index, normalize):
+    """
+    Parse and evaluate a query; returns the matching document names
+    """
+    return index.names(evaluate(parse(query), index, normalize))
@@ -0,0 +1,169 @@
+"""
+Query caches for repeated searches.
+
+A QueryCache has two levels:
+
+1. normalized query text -> the terms its preprocessing produced, so a
+   repeated query skips NLTK tokenizing, tagging and lemmatizing;
+2. (terms, model, k) -> the ranked results, so a repeated query also skips
+   scoring.
+
+Both levels are LRUCaches bounded by entry count and, optionally, by age
+(ttl in seconds). Results depend on the index, so every lookup passes the
+index generation: any value that changes whenever the index does (a counter
+bumped on rebuild, a corpus fingerprint). When it differs from the
+generation the cached results were computed for, the result level is
+emptied. Terms depend only on the preprocessing and are kept.
+
+Cached values are shared between callers and must not be modified.
+"""
+
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+DEFAULT_MAX_QUERIES = 10000
+DEFAULT_MAX_RESULTS = 1000
+DEFAULT_TTL = None
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'expirations', 'size', 'max_size'])
+
+
+def normalize_query(query):
+    """
+    Collapse runs of whitespace, so spacing alone never misses the cache
+    """
+    return ' '.join(query.split())
+
+
+class LRUCache:
+    """
+    Thread-safe mapping that evicts the least recently used entry beyond
+    max_size entries and drops entries older than ttl seconds
+    """
+
+    def __init__(self, max_size, ttl=None, clock=time.monotonic):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            expires = self._clock() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, self.expirations,
+                         len(self._entries), self.max_size)
+
+
+class QueryCache:
+    """
+    Two-level query cache: query text -> terms, (terms, model, k) -> results
+    """
+
+    def __init__(self, max_queries=DEFAULT_MAX_QUERIES, max_results=DEFAULT_MAX_RESULTS, ttl=DEFAULT_TTL):
+        self.term_cache = LRUCache(max_queries, ttl)
+        self.result_cache = LRUCache(max_results, ttl)
+        self.generation = None
+        self.invalidations = 0
+
+    def lookup_terms(self, query, variant=None):
+        """
+        The cached terms of a query, or None. variant tells apart
+        preprocessings of the same text, e.g. with and without adjectives.
+        """
+        return self.term_cache.get((variant, normalize_query(query)))
+
+    def add_terms(self, query, terms, variant=None):
+        terms = tuple(terms)
+        self.term_cache.put((variant, normalize_query(query)), terms)
+        return terms
+
+    def terms(self, query, preprocess, variant=None):
+        """
+        preprocess(query) as a tuple, computed once per normalized query
+        """
+        terms = self.lookup_terms(query, variant)
+        if terms is None:
+            terms = self.add_terms(query, preprocess(query), variant)
+        return terms
+
+    def check_generation(self, generation):
+        """
+        Empty the result level if the index changed since it was filled
+        """
+        if generation != self.generation:
+            if self.generation is not None:
+                self.invalidations += 1
+            self.result_cache.clear()
+            self.generation = generation
+
+    def lookup_results(self, terms, model, k, generation):
+        """
+        The cached results for terms, model and k on this index generation,
+        or None. terms must be hashable (a tuple or a normalized string).
+        """
+        self.check_generation(generation)
+        return self.result_cache.get((terms, model, k))
+
+    def add_results(self, terms, model, k, generation, results):
+        # The index may have changed while computing; don't cache stale results
+        if generation == self.generation:
+            self.result_cache.put((terms, model, k), results)
+        return results
+
+    def results(self, terms, model, k, generation, compute):
+        """
+        compute() for the given terms, model and k, cached for this index generation
+        """
+        results = self.lookup_results(terms, model, k, generation)
+        if results is None:
+            results = self.add_results(terms, model, k, generation, compute())
+        return results
+
+    def clear(self):
+        self.term_cache.clear()
+        self.result_cache.clear()
+
+    def stats(self):
+        return {'terms': self.term_cache.info()._asdict(),
+                'results': self.result_cache.info()._asdict(),
+                'generation': self.generation,
+                'invalidations': self.invalidations}
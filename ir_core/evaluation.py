@@ -0,0 +1,477 @@
+"""
+Retrieval quality evaluation and ranking consistency checks.
+
+    python -m ir_core.evaluation FOLDER QRELS QUERIES [-k 10] [--workers N]
+                                 [--output evaluation.json]
+
+QUERIES has one query per line, "id<TAB>query" (see ir_core/batch.py).
+QRELS uses the TREC layout, "query_id 0 document grade", or
+"query_id document grade"; documents are file names, and a grade above 0
+is relevant.
+
+The folder is indexed once into the warm indexes of the query server
+(ir_core/server.py), with the same preprocessing as the scripts. Every
+model then runs over those shared indexes, and the queries are
+preprocessed once, in a process pool:
+
+    tfidf, cosine        full rankings, as TF-IDFscoring.search computes them
+    bim, bm25,           full rankings, as probabilistic.py computes them
+    bim_feedback
+    boolean              the unranked OR of the query's nouns
+
+Ranked models report MAP, nDCG@k, P@k and recall@k on the reference
+rankings below, and the boolean model reports set precision, recall and
+F1. The reported ranking times are those of the postings rankings.
+
+Every engine is also checked against a reference that shares none of its
+code:
+- tfidf and cosine: the original TF-IDFscoring.tf_idf and
+  cosine_similarity, called for every document of the script's own index,
+  each preprocessing the raw query with the script's preprocess;
+- bim, bm25 and bim_feedback: the formulas of ir_core/probabilistic.py
+  evaluated document by document over the term lists of probabilistic.py's
+  read_documents and query_processing. The script never had such a loop
+  (its original "BIM" was a Jaccard ranking), so this one stands in.
+
+The postings rankings (score_query, ProbabilisticIndex) must match the
+reference in full; the MaxScore top k (scoring.top_k_max_score), the batch
+path over decoded postings and, when numpy/scipy are installed, the sparse
+batch backend must match its top k. The reference scans the whole
+collection for every query, so it is only meant for evaluation corpora.
+
+A ranking matches when its scores equal the reference's position by
+position (within a relative 1e-9) and every document in it has that score
+in the reference. Equal scores may therefore come in any order. Rankings
+only list the documents that hold a query term.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+from collections import Counter
+from functools import partial
+
+from ir_core.batch import preprocess_unique, read_queries, unique_terms
+from ir_core.benchmark import load_script
+from ir_core.boolean import evaluate as evaluate_boolean
+from ir_core.boolean import QuerySyntaxError, parse, word_runs
+from ir_core.probabilistic import (DEFAULT_B, DEFAULT_K1, EXPANSION_TERMS, FEEDBACK_DOCS, bm25_idf,
+                                   rsj_weight)
+from ir_core.scoring import rank, score_query, top_k_max_score
+from ir_core.server import SearchService, preprocess_query
+from ir_core import sparse_backend
+
+DEFAULT_K = 10
+TOLERANCE = 1e-9
+RANKED_MODELS = ('tfidf', 'cosine', 'bim', 'bm25', 'bim_feedback')
+
+
+def read_qrels(path):
+    """
+    {query id: {document: grade}} from a TREC-style qrels file
+    """
+    qrels = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) == 4:
+                query_id, _, document, grade = fields
+            elif len(fields) == 3:
+                query_id, document, grade = fields
+            else:
+                raise ValueError(f"Malformed qrels line: {line.strip()!r}")
+            qrels.setdefault(query_id, {})[document] = int(grade)
+    return qrels
+
+
+def relevant_documents(judgments):
+    return {document for document, grade in judgments.items() if grade > 0}
+
+
+def precision_at_k(ranking, relevant, k):
+    return sum(1 for document in ranking[:k] if document in relevant) / k
+
+
+def recall_at_k(ranking, relevant, k):
+    if not relevant:
+        return 0.0
+    return sum(1 for document in ranking[:k] if document in relevant) / len(relevant)
+
+
+def average_precision(ranking, relevant):
+    if not relevant:
+        return 0.0
+    hits = 0
+    total = 0.0
+    for position, document in enumerate(ranking, 1):
+        if document in relevant:
+            hits += 1
+            total += hits / position
+    return total / len(relevant)
+
+
+def ndcg_at_k(ranking, judgments, k):
+    """
+    nDCG@k with gain 2**grade - 1 and a log2(rank + 1) discount
+    """
+    def dcg(grades):
+        return sum((2 ** grade - 1) / math.log2(position + 1) for position, grade in enumerate(grades, 1))
+
+    ideal = dcg(sorted((grade for grade in judgments.values() if grade > 0), reverse=True)[:k])
+    if not ideal:
+        return 0.0
+    return dcg(judgments.get(document, 0) for document in ranking[:k]) / ideal
+
+
+def ranked_metrics(ranking, judgments, k):
+    relevant = relevant_documents(judgments)
+    return {'ap': average_precision(ranking, relevant), f'ndcg@{k}': ndcg_at_k(ranking, judgments, k),
+            f'p@{k}': precision_at_k(ranking, relevant, k), f'recall@{k}': recall_at_k(ranking, relevant, k)}
+
+
+def set_metrics(retrieved, judgments):
+    relevant = relevant_documents(judgments)
+    hits = len(relevant & set(retrieved))
+    precision = hits / len(retrieved) if retrieved else 0.0
+    recall = hits / len(relevant) if relevant else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def mean_metrics(per_query):
+    """
+    Average each metric over the queries; 'ap' becomes 'map'
+    """
+    if not per_query:
+        return {}
+    means = {}
+    for name in per_query[0]:
+        means['map' if name == 'ap' else name] = sum(metrics[name] for metrics in per_query) / len(per_query)
+    return means
+
+
+def _close(a, b):
+    return abs(a - b) <= TOLERANCE * max(1.0, abs(a), abs(b))
+
+
+def matches_reference(reference, candidate, k):
+    """
+    Whether candidate is a valid top k of the full reference ranking (both
+    [(document, score)], best first), allowing any order among equal scores
+    """
+    expected = reference[:k]
+    if len(candidate) != len(expected):
+        return False
+    reference_scores = dict(reference)
+    for (_, expected_score), (document, score) in zip(expected, candidate):
+        if not _close(score, expected_score):
+            return False
+        if document not in reference_scores or not _close(reference_scores[document], score):
+            return False
+    return len({document for document, _ in candidate}) == len(candidate)
+
+
+def best_first(scores):
+    """
+    [(document, score)] of a {document: score} dict, best first, ties by name
+    """
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class TfidfReference:
+    """
+    TF-IDF and cosine rankings computed one document at a time by the
+    TF-IDFscoring script's own tf_idf and cosine_similarity
+    """
+
+    def __init__(self, folder_path, index_dir):
+        self.script = load_script('tfidf')
+        self.index = self.script.load_index(folder_path, index_dir)
+
+    def rankings(self, query):
+        tfidf_scores = {}
+        cosine_scores = {}
+        for document in self.index.doc_names:
+            score = self.script.tf_idf(query, document, self.index)
+            if score:
+                tfidf_scores[document] = score
+                cosine_scores[document] = self.script.cosine_similarity(query, document, self.index)
+        return {'tfidf': best_first(tfidf_scores), 'cosine': best_first(cosine_scores)}
+
+    def close(self):
+        self.index.close()
+
+
+class ProbabilisticReference:
+    """
+    BIM, BM25 and BIM with one round of pseudo-relevance feedback, scored
+    document by document from the probabilistic script's term lists
+    """
+
+    def __init__(self, folder_path, k1=DEFAULT_K1, b=DEFAULT_B,
+                 feedback_docs=FEEDBACK_DOCS, expansion_terms=EXPANSION_TERMS):
+        self.script = load_script('probabilistic')
+        self.documents = {document: Counter(terms) for document, terms in
+                          self.script.read_documents(folder_path, verbose=False).items()}
+        self.k1 = k1
+        self.b = b
+        self.feedback_docs = feedback_docs
+        self.expansion_terms = expansion_terms
+        self.num_docs = len(self.documents)
+        total_length = sum(sum(counts.values()) for counts in self.documents.values())
+        self.avg_doc_length = total_length / self.num_docs if self.num_docs else 0.0
+        self.document_frequency = Counter()
+        for counts in self.documents.values():
+            self.document_frequency.update(counts.keys())
+
+    def rsj_weights(self, terms):
+        return {term: rsj_weight(self.document_frequency[term], self.num_docs)
+                for term in terms if self.document_frequency[term]}
+
+    def weighted_scores(self, weights):
+        """
+        {document: sum of the weights of the terms it holds}, for the documents holding any
+        """
+        scores = {}
+        for document, counts in self.documents.items():
+            held = [weight for term, weight in weights.items() if term in counts]
+            if held:
+                scores[document] = sum(held)
+        return scores
+
+    def bm25_scores(self, query_terms):
+        k1, b = self.k1, self.b
+        average = self.avg_doc_length or 1.0
+        query_counts = Counter(query_terms)
+        scores = {}
+        for document, counts in self.documents.items():
+            length_norm = k1 * (1 - b + b * sum(counts.values()) / average)
+            held = [bm25_idf(self.document_frequency[term], self.num_docs) * query_count
+                    * counts[term] * (k1 + 1) / (counts[term] + length_norm)
+                    for term, query_count in query_counts.items() if term in counts]
+            if held:
+                scores[document] = sum(held)
+        return scores
+
+    def feedback_weights(self, query_terms):
+        weights = self.rsj_weights(dict.fromkeys(query_terms))
+        relevant = [document for document, _ in best_first(self.weighted_scores(weights))[:self.feedback_docs]]
+        if not relevant:
+            return weights
+
+        relevant_counts = Counter()
+        for document in relevant:
+            relevant_counts.update(self.documents[document].keys())
+        estimated = {}
+        for term, relevant_df in relevant_counts.items():
+            p = (relevant_df + 0.5) / (len(relevant) + 1)
+            u = (self.document_frequency[term] - relevant_df + 0.5) / (self.num_docs - len(relevant) + 1)
+            estimated[term] = math.log(p * (1 - u) / (u * (1 - p)))
+
+        expanded = {term: estimated.get(term, weight) for term, weight in weights.items()}
+        offers = sorted((-relevant_counts[term] * weight, term) for term, weight in estimated.items() if weight > 0)
+        for _, term in offers:
+            if len(expanded) == len(weights) + self.expansion_terms:
+                break
+            expanded.setdefault(term, estimated[term])
+        return expanded
+
+    def rankings(self, query):
+        query_terms = self.script.query_processing(query)
+        return {'bim': best_first(self.weighted_scores(self.rsj_weights(set(query_terms)))),
+                'bm25': best_first(self.bm25_scores(query_terms)),
+                'bim_feedback': best_first(self.weighted_scores(self.feedback_weights(query_terms)))}
+
+    def close(self):
+        pass
+
+
+class Evaluation:
+    """
+    Runs every model over one preloaded SearchService and checks it against
+    the per-document references
+    """
+
+    def __init__(self, service, references, k=DEFAULT_K, workers=None):
+        self.service = service
+        self.references = references
+        self.k = k
+        self.workers = workers
+
+    def _preprocess(self, kind, texts):
+        return {text: terms for text, (terms, _) in
+                preprocess_unique(texts, partial(preprocess_query, kind), self.workers).items()}
+
+    def reference(self, text):
+        """
+        The reference rankings of every ranked model for one raw query
+        """
+        rankings = {}
+        for reference in self.references:
+            rankings.update(reference.rankings(text))
+        return rankings
+
+    def rankings(self, tfidf_words, probabilistic_terms):
+        """
+        Full best-first [(document, score)] postings rankings of every ranked
+        model, and the seconds each took (TF-IDF and cosine are scored together)
+        """
+        index = self.service.tfidf_index
+        probabilistic_index = self.service.probabilistic_index
+        rankings = {}
+        seconds = {}
+
+        start = time.perf_counter()
+        tfidf_scores, cosine_scores = score_query(index, tfidf_words)
+        rankings['tfidf'] = rank(tfidf_scores, index.doc_names, reverse=True)
+        rankings['cosine'] = rank(cosine_scores, index.doc_names, reverse=True)
+        seconds['tfidf+cosine'] = time.perf_counter() - start
+
+        for model, ranking in (('bim', probabilistic_index.rank_bim), ('bm25', probabilistic_index.rank_bm25),
+                               ('bim_feedback', probabilistic_index.rank_bim_feedback)):
+            start = time.perf_counter()
+            rankings[model] = ranking(probabilistic_terms)
+            seconds[model] = time.perf_counter() - start
+        return rankings, seconds
+
+    def optimized(self, tfidf_words, probabilistic_terms, decoded):
+        """
+        {(engine, model): top k} of every optimized engine for one query
+        """
+        k = self.k
+        index = self.service.tfidf_index
+        probabilistic_index = self.service.probabilistic_index
+        names = index.doc_names
+        return {
+            ('max_score', 'tfidf'): [(names[doc], score) for doc, score in top_k_max_score(index, tfidf_words, k)],
+            ('max_score', 'cosine'): [(names[doc], score) for doc, score in
+                                      top_k_max_score(index, tfidf_words, k, cosine=True)],
+            ('batch', 'bim'): probabilistic_index.rank_bim(probabilistic_terms, k, decoded),
+            ('batch', 'bm25'): probabilistic_index.rank_bm25(probabilistic_terms, k, decoded),
+            ('batch', 'bim_feedback'): probabilistic_index.rank_bim_feedback(probabilistic_terms, k,
+                                                                             decoded=decoded),
+        }
+
+    def run(self, queries, qrels):
+        """
+        Evaluate every model on the judged queries; returns the report dict
+        """
+        k = self.k
+        judged = [(query_id, text) for query_id, text in queries if query_id in qrels]
+        texts = [text for _, text in judged]
+
+        start = time.perf_counter()
+        tfidf_words = self._preprocess('tfidf', texts)
+        probabilistic_terms = self._preprocess('probabilistic', texts)
+        trees = {}
+        for text in texts:
+            try:
+                trees[text] = parse(text)
+            except QuerySyntaxError:
+                # Free-text queries with stray parentheses retrieve nothing as boolean queries
+                trees[text] = None
+        boolean_terms = self._preprocess('boolean', [run for tree in trees.values() for run in word_runs(tree)])
+        decoded = self.service.probabilistic_index.decode_postings(unique_terms(probabilistic_terms.values()))
+        preprocess_seconds = time.perf_counter() - start
+
+        sparse_rankings = {}
+        if sparse_backend.available() and texts:
+            scorer = sparse_backend.SparseScorer(self.service.tfidf_index)
+            for text, (ranked_tfidf, ranked_cosine) in zip(texts, scorer.rank_batch([tfidf_words[text]
+                                                                                      for text in texts])):
+                # The sparse rankings list every document; only the scored ones are candidates
+                sparse_rankings[text] = {'tfidf': [item for item in ranked_tfidf[::-1] if item[1]][:k],
+                                         'cosine': [item for item in ranked_cosine[::-1] if item[1]][:k]}
+
+        per_model = {model: [] for model in RANKED_MODELS + ('boolean',)}
+        seconds = {'tfidf+cosine': 0.0, 'bim': 0.0, 'bm25': 0.0, 'bim_feedback': 0.0, 'boolean': 0.0}
+        mismatches = {}
+        checked = 0
+        for query_id, text in judged:
+            judgments = qrels[query_id]
+            reference = self.reference(text)
+            rankings, model_seconds = self.rankings(tfidf_words[text], probabilistic_terms[text])
+            for model, elapsed in model_seconds.items():
+                seconds[model] += elapsed
+            for model, ranking in reference.items():
+                per_model[model].append(ranked_metrics([document for document, _ in ranking], judgments, k))
+
+            model_start = time.perf_counter()
+            bitmap = evaluate_boolean(trees[text], self.service.bitmap_index, boolean_terms.__getitem__)
+            retrieved = self.service.bitmap_index.names(bitmap)
+            seconds['boolean'] += time.perf_counter() - model_start
+            per_model['boolean'].append(set_metrics(retrieved, judgments))
+
+            candidates = self.optimized(tfidf_words[text], probabilistic_terms[text], decoded)
+            for model, top in sparse_rankings.get(text, {}).items():
+                candidates[('sparse', model)] = top
+            for model, ranking in rankings.items():
+                candidates[('postings', model)] = ranking
+            for (engine, model), ranking in candidates.items():
+                checked += 1
+                # The postings rankings are compared in full, the others as top k
+                limit = len(reference[model]) if engine == 'postings' else k
+                if not matches_reference(reference[model], ranking, limit):
+                    mismatches.setdefault(f"{engine}:{model}", []).append(query_id)
+
+        return {
+            'queries': len(judged),
+            'unjudged_queries': len(queries) - len(judged),
+            'k': k,
+            'preprocess_s': round(preprocess_seconds, 4),
+            'models': {model: mean_metrics(metrics) for model, metrics in per_model.items()},
+            'ranking_s': {model: round(elapsed, 4) for model, elapsed in seconds.items()},
+            'consistency': {'checked': checked, 'mismatches': mismatches},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the retrieval models against relevance judgments")
+    parser.add_argument('folder', help="folder containing the .txt documents")
+    parser.add_argument('qrels', help="relevance judgments, 'query_id 0 document grade' per line")
+    parser.add_argument('queries', help="query file, 'id<TAB>query' per line ('-' for stdin)")
+    parser.add_argument('-k', type=int, default=DEFAULT_K)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="preprocessing processes (default: every core)")
+    parser.add_argument('--output', help="write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='ir_evaluation_') as index_dir:
+        service = SearchService(args.folder, args.workers, index_dir)
+        index_seconds = time.perf_counter() - start
+        references = []
+        try:
+            references.append(TfidfReference(args.folder, os.path.join(index_dir, 'reference')))
+            references.append(ProbabilisticReference(args.folder))
+            report = Evaluation(service, references, args.k, args.workers).run(read_queries(args.queries),
+                                                                               read_qrels(args.qrels))
+        finally:
+            for reference in references:
+                reference.close()
+            service.close()
+    report['index_s'] = round(index_seconds, 4)
+    report['total_s'] = round(time.perf_counter() - start, 4)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    for model, metrics in report['models'].items():
+        print(f"{model:>13}: " + '  '.join(f"{name} {value:.4f}" for name, value in metrics.items()))
+    consistency = report['consistency']
+    print(f"{consistency['checked']} rankings checked against the per-document reference, "
+          f"{sum(len(ids) for ids in consistency['mismatches'].values())} differ from the reference")
+    for engine, query_ids in consistency['mismatches'].items():
+        print(f"  {engine}: queries {', '.join(query_ids[:10])}{' ...' if len(query_ids) > 10 else ''}")
+    print(f"{report['queries']} queries evaluated in {report['total_s']:.2f} s")
+    return 1 if consistency['mismatches'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Forward index: document -> the terms it contains and their counts.
+
+The inverted index answers "which documents hold this term"; listing the
+terms of one document from it means walking the whole vocabulary. The
+forward index keeps, per document, its term ids and counts in two compact
+arrays sorted by term id, so a document's term listing, term vector and
+length are read in time proportional to the document itself.
+
+Term ids are assigned in first-seen order and never reused, so removing a
+document leaves the ids of every other document valid.
+"""
+
+from array import array
+
+from ir_core.postings import DocIdMap
+
+
+def _postings_items(postings):
+    # In-memory indexes map doc -> count; on-disk indexes list (doc, count) pairs,
+    # with the counts stored as float weights
+    if isinstance(postings, dict):
+        return postings.items()
+    return [(doc, int(count)) for doc, count in postings]
+
+
+class ForwardIndex:
+    """
+    In-memory doc -> [(term id, count)] index
+    """
+
+    def __init__(self):
+        self.doc_map = DocIdMap()
+        # DocIdMap is a plain two-way name <-> dense id map; here it numbers terms
+        self.term_map = DocIdMap()
+        self._term_ids = {}
+        self._counts = {}
+        self._lengths = {}
+
+    @classmethod
+    def from_inverted_index(cls, inverted_index):
+        """
+        Forward index of a term -> {doc: count} index, in one pass over its postings
+        """
+        documents = {}
+        for term, postings in inverted_index.items():
+            for doc_name, count in _postings_items(postings):
+                documents.setdefault(doc_name, {})[term] = count
+        forward_index = cls()
+        for doc_name, term_counts in documents.items():
+            forward_index.add_document(doc_name, term_counts)
+        return forward_index
+
+    def add_document(self, name, term_counts):
+        """
+        Set a document's {term: count} map, replacing any earlier one
+        """
+        doc_id = self.doc_map.add(name)
+        pairs = sorted((self.term_map.add(term), count) for term, count in term_counts.items() if count)
+        self._term_ids[doc_id] = array('I', [term_id for term_id, _ in pairs])
+        self._counts[doc_id] = array('I', [count for _, count in pairs])
+        self._lengths[doc_id] = sum(count for _, count in pairs)
+        return doc_id
+
+    def remove_document(self, name):
+        """
+        Drop a document; returns the [(term, count)] it held
+        """
+        terms = self.terms(name)
+        doc_id = self.doc_map.id(name)
+        if doc_id is not None:
+            self._term_ids.pop(doc_id, None)
+            self._counts.pop(doc_id, None)
+            self._lengths.pop(doc_id, None)
+        return terms
+
+    def __contains__(self, name):
+        return self.doc_map.id(name) in self._term_ids
+
+    def __len__(self):
+        return len(self._term_ids)
+
+    def __iter__(self):
+        names = self.doc_map.names
+        return (names[doc_id] for doc_id in self._term_ids)
+
+    def term_ids(self, name):
+        """
+        The document's (term ids, counts) arrays, sorted by term id
+        """
+        doc_id = self.doc_map.id(name)
+        if doc_id not in self._term_ids:
+            return array('I'), array('I')
+        return self._term_ids[doc_id], self._counts[doc_id]
+
+    def terms(self, name):
+        """
+        [(term, count)] of a document, in the order the terms were first indexed
+        """
+        term_ids, counts = self.term_ids(name)
+        terms = self.term_map.names
+        return [(terms[term_id], count) for term_id, count in zip(term_ids, counts)]
+
+    def vector(self, name):
+        """
+        The document's term vector as {term: count}
+        """
+        return dict(self.terms(name))
+
+    def length(self, name):
+        """
+        Total term occurrences in a document (0 if it is not indexed)
+        """
+        return self._lengths.get(self.doc_map.id(name), 0)
+
+    def unique_terms(self, name):
+        return len(self.term_ids(name)[0])
+
+    def length_stats(self):
+        """
+        Document count and the mean, min and max document length
+        """
+        lengths = list(self._lengths.values())
+        if not lengths:
+            return {'documents': 0, 'total': 0, 'mean': 0.0, 'min': 0, 'max': 0}
+        total = sum(lengths)
+        return {'documents': len(lengths), 'total': total, 'mean': total / len(lengths),
+                'min': min(lengths), 'max': max(lengths)}
+
+    def nbytes(self):
+        return sum(ids.itemsize * len(ids) + counts.itemsize * len(counts)
+                   for ids, counts in zip(self._term_ids.values(), self._counts.values()))
@@ -0,0 +1,66 @@
+"""
+File manifests for incremental index updates.
+
+A manifest records the size, modification time and content hash of every
+.txt file in a folder. Comparing the manifest saved with an index to a fresh
+scan tells which files were added, modified or deleted, so only those need
+to be re-processed. Files whose size and mtime are unchanged are not read
+again; a file that was only touched keeps its hash and is not reported.
+"""
+
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+Changes = namedtuple('Changes', ['added', 'modified', 'deleted'])
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_folder(folder_path, previous=None):
+    """
+    Build a {filename: {'size', 'mtime_ns', 'sha1'}} manifest for the .txt
+    files in a folder, reusing hashes from previous where size and mtime match
+    """
+    previous = previous or {}
+    manifest = {}
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if not (entry.name.endswith('.txt') and entry.is_file()):
+                continue
+            stat = entry.stat()
+            old = previous.get(entry.name)
+            if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                sha1 = old['sha1']
+            else:
+                sha1 = file_digest(entry.path)
+            manifest[entry.name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sha1}
+    return manifest
+
+
+def diff_manifests(old, new):
+    """
+    Return Changes(added, modified, deleted), each a sorted list of filenames
+    """
+    added = sorted(name for name in new if name not in old)
+    deleted = sorted(name for name in old if name not in new)
+    modified = sorted(name for name in new if name in old and new[name]['sha1'] != old[name]['sha1'])
+    return Changes(added, modified, deleted)
+
+
+def load_manifest(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(path, manifest):
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,349 @@
+"""
+On-disk inverted index that is written once and memory-mapped on load.
+
+An index is a directory of flat binary arrays:
+
+    meta.json          format version, corpus fingerprint and statistics
+    docs.txt           document table, one file name per line (line = doc id)
+    terms.bin          sorted term dictionary, UTF-8 bytes back to back
+    term_offsets.bin   uint64 offsets into terms.bin (num_terms + 1 entries)
+    post_offsets.bin   uint64 offsets into the postings arrays (num_terms + 1)
+    post_docs.bin      uint32 doc ids grouped by term, ascending within a term
+    post_weights.bin   float64 weights parallel to post_docs.bin
+    doc_norms.bin      float64 L2 norm of each document's weight vector
+    term_max.bin       float64 per-term score upper bounds, two per term: the
+                       largest weight and the largest weight / doc norm
+
+Opening an index maps the arrays instead of reading them, so the cost of a
+search no longer depends on re-reading and re-tagging the corpus.
+"""
+
+import os
+import sys
+import json
+import math
+import mmap
+import hashlib
+from array import array
+from collections.abc import Mapping
+
+FORMAT_VERSION = 3
+INDEX_DIR_NAME = '.tfidf_index'
+
+META_FILE = 'meta.json'
+DOCS_FILE = 'docs.txt'
+TERMS_FILE = 'terms.bin'
+TERM_OFFSETS_FILE = 'term_offsets.bin'
+POST_OFFSETS_FILE = 'post_offsets.bin'
+POST_DOCS_FILE = 'post_docs.bin'
+POST_WEIGHTS_FILE = 'post_weights.bin'
+DOC_NORMS_FILE = 'doc_norms.bin'
+TERM_MAX_FILE = 'term_max.bin'
+
+
+class StaleIndexError(Exception):
+    """Raised when a saved index does not match the documents on disk."""
+
+
+def default_index_dir(dir_path):
+    return os.path.join(dir_path, INDEX_DIR_NAME)
+
+
+def corpus_fingerprint(dir_path):
+    """
+    Hash the name, size and modification time of every .txt file in a folder
+    """
+    entries = []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.name.endswith('.txt') and entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    entries.sort()
+    digest = hashlib.sha1()
+    for name, size, mtime in entries:
+        digest.update(f"{name}\0{size}\0{mtime}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _write_file(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        if isinstance(data, array):
+            data.tofile(file)
+        else:
+            file.write(data)
+    os.replace(tmp_path, path)
+
+
+class IndexWriter:
+    """
+    Write an index incrementally: documents as they are read, then terms in
+    ascending UTF-8 order with their postings sorted by doc id. Only the
+    offset arrays and one float per document are held in memory, so indexes
+    larger than RAM can be written from a streaming merge.
+
+    meta.json is written last by finish(), so a half-written index is never
+    mistaken for a complete one.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        meta_path = os.path.join(index_dir, META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        self.num_docs = 0
+        self.num_terms = 0
+        self.num_postings = 0
+        self._last_term = None
+        self._term_bytes = 0
+        self._term_offsets = array('Q', [0])
+        self._post_offsets = array('Q', [0])
+        self._norm_squares = array('d')
+        self._max_weights = array('d')
+
+        self._docs_file = open(self._tmp_path(DOCS_FILE), 'w', encoding='utf-8', newline='\n')
+        self._terms_file = open(self._tmp_path(TERMS_FILE), 'wb')
+        self._docs_out = open(self._tmp_path(POST_DOCS_FILE), 'wb')
+        self._weights_out = open(self._tmp_path(POST_WEIGHTS_FILE), 'wb')
+
+    def _path(self, filename):
+        return os.path.join(self.index_dir, filename)
+
+    def _tmp_path(self, filename):
+        return self._path(filename) + '.tmp'
+
+    def add_document(self, name):
+        """
+        Append a document to the document table and return its doc id
+        """
+        if '\n' in name:
+            raise ValueError(f"Document name contains a newline: {name!r}")
+        self._docs_file.write(name + '\n')
+        self._norm_squares.append(0.0)
+        self.num_docs += 1
+        return self.num_docs - 1
+
+    def add_term(self, term, doc_ids, weights):
+        key = term.encode('utf-8')
+        if self._last_term is not None and key <= self._last_term:
+            raise ValueError(f"Terms must be added in ascending order, got {term!r}")
+        self._last_term = key
+
+        doc_ids = array('I', doc_ids)
+        weights = array('d', weights)
+        for doc, weight in zip(doc_ids, weights):
+            self._norm_squares[doc] += weight * weight
+        doc_ids.tofile(self._docs_out)
+        weights.tofile(self._weights_out)
+
+        self._terms_file.write(key)
+        self._term_bytes += len(key)
+        self._term_offsets.append(self._term_bytes)
+        self.num_postings += len(doc_ids)
+        self._post_offsets.append(self.num_postings)
+        self._max_weights.append(max(weights, default=0.0))
+        self.num_terms += 1
+
+    def finish(self, fingerprint, stats=None):
+        for file in (self._docs_file, self._terms_file, self._docs_out, self._weights_out):
+            file.close()
+        for filename in (DOCS_FILE, TERMS_FILE, POST_DOCS_FILE, POST_WEIGHTS_FILE):
+            os.replace(self._tmp_path(filename), self._path(filename))
+        _write_file(self._path(TERM_OFFSETS_FILE), self._term_offsets)
+        _write_file(self._path(POST_OFFSETS_FILE), self._post_offsets)
+        doc_norms = array('d', map(math.sqrt, self._norm_squares))
+        _write_file(self._path(DOC_NORMS_FILE), doc_norms)
+
+        # Upper bounds let top-k queries skip documents that cannot make the cut.
+        # The cosine bound needs the finished norms, so postings are read back one term at a time
+        term_max = array('d')
+        with open(self._path(POST_DOCS_FILE), 'rb') as docs_in, \
+                open(self._path(POST_WEIGHTS_FILE), 'rb') as weights_in:
+            for i in range(self.num_terms):
+                count = self._post_offsets[i + 1] - self._post_offsets[i]
+                doc_ids, weights = array('I'), array('d')
+                doc_ids.fromfile(docs_in, count)
+                weights.fromfile(weights_in, count)
+                term_max.append(self._max_weights[i])
+                term_max.append(max((weight / doc_norms[doc] for doc, weight in zip(doc_ids, weights)
+                                     if doc_norms[doc]), default=0.0))
+        _write_file(self._path(TERM_MAX_FILE), term_max)
+
+        meta = {
+            'version': FORMAT_VERSION,
+            'byteorder': sys.byteorder,
+            'fingerprint': fingerprint,
+            'num_docs': self.num_docs,
+            'num_terms': self.num_terms,
+            'num_postings': self.num_postings,
+            'stats': stats or {},
+        }
+        meta_path = self._path(META_FILE)
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(meta, file, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+
+
+def write_index(index_dir, inverted_index, doc_names, fingerprint, stats=None):
+    """
+    Write a term -> [(doc_name, weight), ...] index to index_dir
+    """
+    writer = IndexWriter(index_dir)
+    doc_ids = {name: writer.add_document(name) for name in doc_names}
+    for term in sorted(inverted_index, key=lambda term: term.encode('utf-8')):
+        postings = sorted((doc_ids[doc], weight) for doc, weight in inverted_index[term])
+        writer.add_term(term, [doc for doc, _ in postings], [weight for _, weight in postings])
+    writer.finish(fingerprint, stats)
+
+
+class DiskIndex(Mapping):
+    """
+    Read-only, memory-mapped view of an index written by write_index.
+
+    Behaves like the dict returned by create_index: index[term] is a list of
+    (doc_name, weight) tuples. postings(term) gives the raw doc id and weight
+    arrays without building tuples.
+    """
+
+    def __init__(self, index_dir, expected_fingerprint=None):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, META_FILE), 'r', encoding='utf-8') as file:
+            self.meta = json.load(file)
+
+        if self.meta.get('version') != FORMAT_VERSION:
+            raise StaleIndexError(f"Index format {self.meta.get('version')} is not supported")
+        if self.meta.get('byteorder') != sys.byteorder:
+            raise StaleIndexError("Index was written on a machine with a different byte order")
+        if expected_fingerprint is not None and self.meta.get('fingerprint') != expected_fingerprint:
+            raise StaleIndexError("Index does not match the documents in the folder")
+
+        with open(os.path.join(index_dir, DOCS_FILE), 'r', encoding='utf-8', newline='\n') as file:
+            self.doc_names = file.read().split('\n')[:-1]
+
+        self._maps = []
+        self._terms = self._map(TERMS_FILE, 'B')
+        self._term_offsets = self._map(TERM_OFFSETS_FILE, 'Q')
+        self._post_offsets = self._map(POST_OFFSETS_FILE, 'Q')
+        self._post_docs = self._map(POST_DOCS_FILE, 'I')
+        self._post_weights = self._map(POST_WEIGHTS_FILE, 'd')
+        self.doc_norms = self._map(DOC_NORMS_FILE, 'd')
+        self._term_max = self._map(TERM_MAX_FILE, 'd')
+        self._doc_ids = None
+
+        self.num_docs = self.meta['num_docs']
+        self.num_terms = self.meta['num_terms']
+        self.stats = self.meta.get('stats', {})
+        if (len(self.doc_names) != self.num_docs or len(self.doc_norms) != self.num_docs
+                or len(self._term_offsets) != self.num_terms + 1
+                or len(self._term_max) != 2 * self.num_terms):
+            raise StaleIndexError("Index files are incomplete")
+
+    def _map(self, filename, fmt):
+        with open(os.path.join(self.index_dir, filename), 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return memoryview(b'').cast(fmt)
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(fmt)
+
+    def close(self):
+        # Views must be released before the maps they point into
+        for view in (self._terms, self._term_offsets, self._post_offsets,
+                     self._post_docs, self._post_weights, self.doc_norms, self._term_max):
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _term_at(self, i):
+        return bytes(self._terms[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def term_id(self, term):
+        """
+        Binary search the term dictionary; returns None for unknown terms
+        """
+        key = term.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self._term_at(lo) == key:
+            return lo
+        return None
+
+    def doc_id(self, doc_name):
+        if self._doc_ids is None:
+            self._doc_ids = {name: doc_id for doc_id, name in enumerate(self.doc_names)}
+        return self._doc_ids.get(doc_name)
+
+    def document_norm(self, doc_name):
+        """
+        Stored L2 norm of a document's full weight vector (0.0 if unknown)
+        """
+        doc_id = self.doc_id(doc_name)
+        return self.doc_norms[doc_id] if doc_id is not None else 0.0
+
+    def postings(self, term):
+        """
+        Return (doc_ids, weights) memoryview slices for a term, or None
+        """
+        i = self.term_id(term)
+        if i is None:
+            return None
+        start, end = self._post_offsets[i], self._post_offsets[i + 1]
+        return self._post_docs[start:end], self._post_weights[start:end]
+
+    def upper_bounds(self, term):
+        """
+        Return (max weight, max weight / doc norm) over a term's postings
+        """
+        i = self.term_id(term)
+        if i is None:
+            return 0.0, 0.0
+        return self._term_max[2 * i], self._term_max[2 * i + 1]
+
+    def document_frequency(self, term):
+        i = self.term_id(term)
+        if i is None:
+            return 0
+        return self._post_offsets[i + 1] - self._post_offsets[i]
+
+    def __getitem__(self, term):
+        entry = self.postings(term)
+        if entry is None:
+            raise KeyError(term)
+        doc_ids, weights = entry
+        return [(self.doc_names[doc], weight) for doc, weight in zip(doc_ids, weights)]
+
+    def __contains__(self, term):
+        return isinstance(term, str) and self.term_id(term) is not None
+
+    def __iter__(self):
+        for i in range(self.num_terms):
+            yield self._term_at(i).decode('utf-8')
+
+    def __len__(self):
+        return self.num_terms
+
+
+class DiskCountIndex(DiskIndex):
+    """
+    DiskIndex whose weights are term counts, such as one merged by
+    ir_core/spimi.py: index[term] lists (doc_name, count) with integer
+    counts, like the {doc: count} postings of an in-memory index
+    """
+
+    def __getitem__(self, term):
+        return [(doc_name, int(count)) for doc_name, count in super().__getitem__(term)]
@@ -0,0 +1,402 @@
+"""
+Stage-level instrumentation for indexing and query paths.
+
+    from ir_core import instrument
+
+    instrument.enable()
+    with instrument.document(filename):          # per-document breakdown
+        with instrument.stage('preprocess.tokenize'):
+            tokens = word_tokenize(text)
+        instrument.count('preprocess.tokens', len(tokens))
+    print(instrument.to_json())
+    instrument.write_prometheus('ir.prom')
+
+Each stage keeps its call count, total and maximum time, and counters keep
+running totals. Inside a document() or query() block the stage times and
+counts are also added to that item's own breakdown. The last MAX_ITEMS
+breakdowns of each kind are kept.
+
+Instrumentation is off by default and can be switched at any time with
+enable() / disable(), or at import with IR_INSTRUMENT=1 in the environment.
+When it is off, stage() returns a shared no-op context manager and
+count() returns at once, so each instrumented point costs one flag check.
+
+Stages recorded in worker processes of ir_core.parallel.map_chunks are sent
+back with each chunk's result and merged, so parallel builds are covered too.
+
+Profiling hooks, for a closer look at one stage:
+- profile(): cProfile over a block, optionally dumped to a .prof file;
+- Sampler: a thread that samples another thread's stack at a fixed
+  interval and writes collapsed stacks, as flame graph tools read them.
+
+snapshot() / to_json() give everything as a dict or JSON.
+prometheus_text() / write_prometheus() give the totals in the Prometheus
+text exposition format, e.g. for node_exporter's textfile collector.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+MAX_ITEMS = 1000
+DEFAULT_SAMPLE_INTERVAL = 0.005
+METRIC_PREFIX = 'ir'
+
+_enabled = os.environ.get('IR_INSTRUMENT', '').lower() in ('1', 'true', 'yes', 'on')
+_lock = threading.Lock()
+_local = threading.local()
+# stage -> [calls, total seconds, max seconds]
+_stages = {}
+_counters = {}
+_items = {'document': deque(maxlen=MAX_ITEMS), 'query': deque(maxlen=MAX_ITEMS)}
+
+
+class _NullContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL = _NullContext()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Forget every recorded stage, counter and breakdown
+    """
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        for items in _items.values():
+            items.clear()
+
+
+def _record(name, seconds):
+    with _lock:
+        entry = _stages.get(name)
+        if entry is None:
+            _stages[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+    item = getattr(_local, 'item', None)
+    if item is not None:
+        item['stages'][name] = item['stages'].get(name, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """
+    Context manager timing a block as one call of stage name
+    """
+    if not _enabled:
+        return _NULL
+    return _Stage(name)
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as stage name
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+    item = getattr(_local, 'item', None)
+    if item is not None:
+        item['counters'][name] = item['counters'].get(name, 0) + amount
+
+
+@contextmanager
+def _item(kind, name):
+    item = {'name': name, 'stages': {}, 'counters': {}}
+    previous = getattr(_local, 'item', None)
+    _local.item = item
+    start = time.perf_counter()
+    try:
+        yield item
+    finally:
+        item['total_s'] = time.perf_counter() - start
+        _local.item = previous
+        with _lock:
+            _items[kind].append(item)
+
+
+def document(name):
+    """
+    Context manager collecting the stages of one document into its own breakdown
+    """
+    if not _enabled:
+        return _NULL
+    return _item('document', name)
+
+
+def query(text):
+    """
+    Context manager collecting the stages of one query into its own breakdown
+    """
+    if not _enabled:
+        return _NULL
+    return _item('query', text)
+
+
+def state():
+    """
+    Raw copy of everything recorded, for merge() in another process
+    """
+    with _lock:
+        return ({name: list(entry) for name, entry in _stages.items()}, dict(_counters),
+                {kind: list(items) for kind, items in _items.items()})
+
+
+def merge(recorded):
+    """
+    Add a state() taken elsewhere (e.g. in a worker process)
+    """
+    stages, counters, items = recorded
+    with _lock:
+        for name, (calls, total, longest) in stages.items():
+            entry = _stages.get(name)
+            if entry is None:
+                _stages[name] = [calls, total, longest]
+            else:
+                entry[0] += calls
+                entry[1] += total
+                entry[2] = max(entry[2], longest)
+        for name, amount in counters.items():
+            _counters[name] = _counters.get(name, 0) + amount
+        for kind, kind_items in items.items():
+            _items[kind].extend(kind_items)
+
+
+def call_recorded(func, *args):
+    """
+    func(*args) with instrumentation on and only this call recorded; returns
+    (result, state()). map_chunks runs worker chunks through this.
+    """
+    global _enabled
+    was_enabled = _enabled
+    _enabled = True
+    saved = state()
+    reset()
+    try:
+        result = func(*args)
+        return result, state()
+    finally:
+        reset()
+        merge(saved)
+        _enabled = was_enabled
+
+
+def _round(seconds):
+    return round(seconds, 6)
+
+
+def snapshot():
+    """
+    Every stage's calls, total / mean / max time, the counters and the
+    per-document and per-query breakdowns, as a JSON-ready dict
+    """
+    stages, counters, items = state()
+    return {
+        'enabled': _enabled,
+        'stages': {name: {'calls': calls, 'total_s': _round(total), 'mean_ms': _round(total / calls * 1000),
+                          'max_ms': _round(longest * 1000)}
+                   for name, (calls, total, longest) in sorted(stages.items())},
+        'counters': dict(sorted(counters.items())),
+        'documents': [_item_summary(item) for item in items['document']],
+        'queries': [_item_summary(item) for item in items['query']],
+    }
+
+
+def _item_summary(item):
+    return {'name': item['name'], 'total_ms': _round(item['total_s'] * 1000),
+            'stages_ms': {name: _round(seconds * 1000) for name, seconds in item['stages'].items()},
+            'counters': item['counters']}
+
+
+def to_json(path=None, indent=2):
+    """
+    snapshot() as JSON text, also written to path if given
+    """
+    text = json.dumps(snapshot(), indent=indent)
+    if path is not None:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+    return text
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(prefix=METRIC_PREFIX):
+    """
+    Stage and counter totals in the Prometheus text exposition format
+    """
+    stages, counters, _ = state()
+    metrics = (
+        ('stage_seconds_total', 'counter', 'Seconds spent in each stage.', 1),
+        ('stage_calls_total', 'counter', 'Calls of each stage.', 0),
+        ('stage_seconds_max', 'gauge', 'Longest single call of each stage, in seconds.', 2),
+    )
+    lines = []
+    for name, kind, help_text, field in metrics:
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        for stage_name, entry in sorted(stages.items()):
+            lines.append(f'{prefix}_{name}{{stage="{_label(stage_name)}"}} {entry[field]!r}')
+    lines.append(f"# HELP {prefix}_events_total Running totals of the instrumentation counters.")
+    lines.append(f"# TYPE {prefix}_events_total counter")
+    for counter_name, amount in sorted(counters.items()):
+        lines.append(f'{prefix}_events_total{{counter="{_label(counter_name)}"}} {amount!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, prefix=METRIC_PREFIX):
+    """
+    Write prometheus_text() to path atomically, so a collector never reads half a file
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(prometheus_text(prefix))
+    os.replace(temporary, path)
+
+
+@contextmanager
+def profile(output=None):
+    """
+    cProfile over a block; yields the cProfile.Profile (read it with pstats)
+    and dumps it to output if given
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output is not None:
+            profiler.dump_stats(output)
+
+
+class Sampler:
+    """
+    Samples one thread's Python stack every interval seconds from a
+    background thread. Unlike cProfile it does not slow the sampled code
+    down, at the price of statistical rather than exact counts.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ir-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def top(self, n=20):
+        """
+        [(function, samples)] of the functions most often on top of the stack
+        """
+        leaves = {}
+        for stack, samples in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + samples
+        return sorted(leaves.items(), key=lambda item: (-item[1], item[0]))[:n]
+
+    def collapsed(self):
+        """
+        'frame;frame;frame samples' lines, as flame graph tools read them
+        """
+        return '\n'.join(f"{stack} {samples}" for stack, samples in sorted(self.stacks.items())) + '\n'
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.collapsed())
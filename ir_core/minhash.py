@@ -0,0 +1,220 @@
+"""
+MinHash signatures and an LSH banding index over document term sets.
+
+A document's signature holds, for each of num_perm hash functions
+h(x) = (a * x + b) mod (2**31 - 1), the minimum over its terms. Two
+signatures agree at a position with probability equal to the Jaccard
+similarity of the term sets, so the fraction of equal positions estimates
+it.
+
+Signatures are split into bands of rows. Documents that agree on every
+row of at least one band land in the same bucket and become candidates.
+Documents with similarity s collide with probability 1 - (1 - s**r)**b,
+an S-curve that rises steeply around (1 / b)**(1 / r). The band layout is
+chosen so that point is as close as possible to the threshold. Queries
+only look at the query's own buckets, and candidates are then filtered by
+their estimated similarity.
+
+Terms are hashed with blake2b, not hash(), so signatures are the same in
+every process and can be compared across runs with the same seed. With
+numpy installed, the hash functions are applied as one vectorized product.
+The values stay below 2**62, so this is exact and gives the same
+signatures as the pure Python loop.
+"""
+
+import random
+import hashlib
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+MERSENNE_PRIME = (1 << 31) - 1
+MAX_HASH = MERSENNE_PRIME - 1
+DEFAULT_NUM_PERM = 128
+DEFAULT_THRESHOLD = 0.5
+
+
+def hash_term(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little') % MERSENNE_PRIME
+
+
+def jaccard(a, b):
+    """
+    Exact Jaccard similarity of two sets, 0 when either is empty
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def band_layout(threshold, num_perm):
+    """
+    (bands, rows) with bands * rows <= num_perm whose S-curve midpoint
+    (1 / bands) ** (1 / rows) is closest to threshold
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures with num_perm seeded hash functions
+    """
+
+    def __init__(self, num_perm=DEFAULT_NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.seed = seed
+        self._params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                        for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array([a for a, _ in self._params], dtype=np.uint64)[:, None]
+            self._b = np.array([b for _, b in self._params], dtype=np.uint64)[:, None]
+
+    def signature(self, terms):
+        """
+        array('I') of num_perm minimum hashes of the distinct terms; an empty
+        set gets MAX_HASH everywhere
+        """
+        hashes = [hash_term(term) for term in set(terms)]
+        if not hashes:
+            return array('I', [MAX_HASH] * self.num_perm)
+        if np is not None:
+            values = (self._a * np.array(hashes, dtype=np.uint64) + self._b) % MERSENNE_PRIME
+            return array('I', values.min(axis=1).astype(np.uint32).tobytes())
+        return array('I', [min((a * x + b) % MERSENNE_PRIME for x in hashes) for a, b in self._params])
+
+
+def estimate_jaccard(a, b):
+    """
+    Fraction of equal positions of two signatures
+    """
+    if not a:
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+class LSHIndex:
+    """
+    document -> MinHash signature, bucketed by band for candidate lookup
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=DEFAULT_NUM_PERM, seed=1):
+        self.hasher = MinHasher(num_perm, seed)
+        self.signatures = {}
+        self.set_threshold(threshold)
+
+    def set_threshold(self, threshold):
+        """
+        Re-band the stored signatures for a new threshold; nothing is re-hashed
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.bands, self.rows = band_layout(threshold, self.hasher.num_perm)
+        self._buckets = [{} for _ in range(self.bands)]
+        for name, signature in self.signatures.items():
+            self._insert(name, signature)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def _insert(self, name, signature):
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(key, set()).add(name)
+
+    def add(self, name, terms):
+        """
+        Index (or re-index) a document's terms; returns its signature
+        """
+        self.remove(name)
+        terms = set(terms)
+        signature = self.hasher.signature(terms)
+        self.signatures[name] = signature
+        # Empty documents would all share every bucket; they are kept out of the bands
+        if terms:
+            self._insert(name, signature)
+        return signature
+
+    def remove(self, name):
+        signature = self.signatures.pop(name, None)
+        if signature is None:
+            return
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(name)
+                if not bucket:
+                    del buckets[key]
+
+    def __contains__(self, name):
+        return name in self.signatures
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def candidates(self, signature):
+        """
+        Documents sharing at least one band with signature
+        """
+        found = set()
+        for buckets, key in zip(self._buckets, self._band_keys(signature)):
+            found.update(buckets.get(key, ()))
+        return found
+
+    def _similar(self, signature, threshold, k, exclude=None):
+        threshold = self.threshold if threshold is None else threshold
+        scored = []
+        for name in self.candidates(signature):
+            if name != exclude:
+                similarity = estimate_jaccard(signature, self.signatures[name])
+                if similarity >= threshold:
+                    scored.append((name, similarity))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored if k is None else scored[:k]
+
+    def query(self, terms, threshold=None, k=None):
+        """
+        [(document, estimated Jaccard)] of the documents similar to a term
+        set, most similar first. threshold defaults to the index's; asking
+        for a lower one than the index was banded for misses more matches.
+        """
+        return self._similar(self.hasher.signature(terms), threshold, k)
+
+    def more_like_this(self, name, threshold=None, k=None):
+        """
+        query() for an indexed document, without the document itself
+        """
+        signature = self.signatures.get(name)
+        if signature is None:
+            return []
+        return self._similar(signature, threshold, k, exclude=name)
+
+    def near_duplicates(self, threshold=None):
+        """
+        [(document, document, estimated Jaccard)] of every pair that shares a
+        bucket and reaches threshold, most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        pairs = {}
+        for buckets in self._buckets:
+            for bucket in buckets.values():
+                if len(bucket) < 2:
+                    continue
+                members = sorted(bucket)
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        if (first, second) not in pairs:
+                            pairs[first, second] = estimate_jaccard(self.signatures[first],
+                                                                    self.signatures[second])
+        return sorted(((first, second, similarity) for (first, second), similarity in pairs.items()
+                       if similarity >= threshold), key=lambda item: (-item[2], item[0], item[1]))
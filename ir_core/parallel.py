@@ -0,0 +1,54 @@
+"""
+Process-pool helpers for building indexes on several cores.
+
+NLTK tokenizing and tagging is CPU-bound, so the indexers split their input
+into chunks, build a partial index per chunk in a worker process and merge
+the partial indexes in chunk order. Merging in order keeps every posting
+list in the same order a serial build produces.
+
+Worker functions must be importable from a child process: define them at
+module level and keep the script's entry point under
+`if __name__ == "__main__":` (required on Windows, which spawns workers).
+
+While ir_core.instrument is enabled, each chunk's stage timings are sent
+back from its worker with the result and merged into the parent's.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from ir_core import instrument
+
+DEFAULT_CHUNK_SIZE = 64
+
+
+def chunked(items, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split a list into consecutive chunks of at most chunk_size items
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def map_chunks(func, items, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Apply func to each chunk of items and yield the results in chunk order.
+
+    workers=None uses every core; workers=1, or a single chunk, runs in the
+    calling process without starting a pool.
+    """
+    chunks = chunked(list(items), chunk_size)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        if not instrument.is_enabled():
+            yield from pool.map(func, chunks)
+            return
+        for result, recorded in pool.map(partial(instrument.call_recorded, func), chunks):
+            instrument.merge(recorded)
+            yield result
@@ -0,0 +1,213 @@
+"""
+Positional postings for phrase and proximity queries.
+
+For every term and document the token positions are stored sorted, as delta
+gaps, variable-byte encoded. Positions count every token of the document
+(see TextPreprocessor.with_positions), so the distance between two kept
+words is their distance in the original text. Per document the positions at
+which its paragraphs start are kept too, for same-paragraph queries.
+
+Queries first intersect the documents of their terms, rarest term first,
+and only then decode and intersect the position lists of the surviving
+documents.
+"""
+
+from array import array
+from bisect import bisect_right
+
+from ir_core.postings import DocIdMap, vbyte_decode, vbyte_encode
+
+
+def encode_positions(positions):
+    previous = 0
+    gaps = []
+    for position in positions:
+        gaps.append(position - previous)
+        previous = position
+    return bytes(vbyte_encode(gaps))
+
+
+def decode_positions(data):
+    positions = []
+    position = 0
+    for gap in vbyte_decode(data):
+        position += gap
+        positions.append(position)
+    return positions
+
+
+def intersect_sorted(a, b):
+    """
+    Values present in both ascending lists, by a linear merge
+    """
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            i += 1
+        elif a[i] > b[j]:
+            j += 1
+        else:
+            result.append(a[i])
+            i += 1
+            j += 1
+    return result
+
+
+def count_windows(position_lists, window):
+    """
+    Number of positions at which a span of at most window tokens ending
+    there holds every list at least once
+    """
+    merged = sorted((position, term) for term, positions in enumerate(position_lists)
+                    for position in positions)
+    needed = len(position_lists)
+    counts = [0] * needed
+    covered = 0
+    matches = 0
+    left = 0
+    for position, term in merged:
+        if counts[term] == 0:
+            covered += 1
+        counts[term] += 1
+        # Drop positions from the left while the window still holds every term
+        while counts[merged[left][1]] > 1:
+            counts[merged[left][1]] -= 1
+            left += 1
+        if covered == needed and position - merged[left][0] <= window:
+            matches += 1
+    return matches
+
+
+def document_positions(content, preprocess):
+    """
+    ({term: positions}, paragraph starts) for a text, with paragraphs split
+    on blank lines. preprocess is a TextPreprocessor; terms are lowercased.
+    """
+    term_positions = {}
+    paragraph_starts = []
+    offset = 0
+    for paragraph in content.split('\n\n'):
+        paragraph_starts.append(offset)
+        words, num_tokens = preprocess.with_positions(paragraph)
+        for word, position in words:
+            term_positions.setdefault(word.lower(), []).append(offset + position)
+        offset += num_tokens
+    return term_positions, paragraph_starts
+
+
+def _ranked(counts, names):
+    return sorted(((names[doc], count) for doc, count in counts.items() if count),
+                  key=lambda item: (-item[1], item[0]))
+
+
+class PositionalIndex:
+    """
+    In-memory term -> {doc id: compressed positions} index
+    """
+
+    def __init__(self):
+        self.doc_map = DocIdMap()
+        self._postings = {}
+        self._paragraphs = {}
+
+    def add_document(self, name, term_positions, paragraph_starts=(0,)):
+        """
+        Add a document's {term: ascending positions} map; paragraph_starts
+        are the positions at which its paragraphs begin
+        """
+        doc_id = self.doc_map.add(name)
+        for term, positions in term_positions.items():
+            self._postings.setdefault(term, {})[doc_id] = encode_positions(positions)
+        self._paragraphs[doc_id] = array('I', paragraph_starts)
+        return doc_id
+
+    def remove_document(self, name):
+        doc_id = self.doc_map.id(name)
+        if doc_id is None:
+            return
+        for term in list(self._postings):
+            postings = self._postings[term]
+            if postings.pop(doc_id, None) is not None and not postings:
+                del self._postings[term]
+        self._paragraphs.pop(doc_id, None)
+
+    def __contains__(self, term):
+        return term in self._postings
+
+    def __len__(self):
+        return len(self._postings)
+
+    def document_frequency(self, term):
+        return len(self._postings.get(term, ()))
+
+    def positions(self, term, doc_id):
+        data = self._postings.get(term, {}).get(doc_id)
+        return decode_positions(data) if data is not None else []
+
+    def paragraph_of(self, doc_id, position):
+        return bisect_right(self._paragraphs[doc_id], position) - 1
+
+    def nbytes(self):
+        return sum(len(data) for postings in self._postings.values() for data in postings.values())
+
+    def _candidates(self, terms):
+        """
+        Doc ids holding every term, intersected from the rarest term up
+        """
+        if not terms or any(term not in self._postings for term in terms):
+            return []
+        ordered = sorted(set(terms), key=self.document_frequency)
+        docs = set(self._postings[ordered[0]])
+        for term in ordered[1:]:
+            docs.intersection_update(self._postings[term])
+            if not docs:
+                break
+        return sorted(docs)
+
+    def phrase(self, query_positions):
+        """
+        Documents holding the query's words at the same relative positions
+        as in the query. query_positions is [(term, position)] as returned by
+        TextPreprocessor.with_positions, so stopwords the index skips still
+        count as gaps. Returns [(name, occurrences)], most occurrences first.
+        """
+        terms = [term for term, _ in query_positions]
+        counts = {}
+        for doc in self._candidates(terms):
+            starts = None
+            for term, offset in query_positions:
+                shifted = [position - offset for position in self.positions(term, doc)]
+                starts = shifted if starts is None else intersect_sorted(starts, shifted)
+                if not starts:
+                    break
+            counts[doc] = len(starts)
+        return _ranked(counts, self.doc_map.names)
+
+    def near(self, terms, window):
+        """
+        Documents where all terms occur within window tokens of each other.
+        Returns [(name, matching windows)], most matches first.
+        """
+        terms = list(dict.fromkeys(terms))
+        counts = {}
+        for doc in self._candidates(terms):
+            counts[doc] = count_windows([self.positions(term, doc) for term in terms], window)
+        return _ranked(counts, self.doc_map.names)
+
+    def same_paragraph(self, terms):
+        """
+        Documents with a paragraph holding all terms.
+        Returns [(name, matching paragraphs)], most matches first.
+        """
+        terms = list(dict.fromkeys(terms))
+        counts = {}
+        for doc in self._candidates(terms):
+            paragraphs = None
+            for term in terms:
+                found = {self.paragraph_of(doc, position) for position in self.positions(term, doc)}
+                paragraphs = found if paragraphs is None else paragraphs & found
+                if not paragraphs:
+                    break
+            counts[doc] = len(paragraphs)
+        return _ranked(counts, self.doc_map.names)
@@ -0,0 +1,274 @@
+"""
+Compressed in-memory postings with integer doc ids.
+
+Filenames are replaced by integer ids from a DocIdMap. Each posting list
+stores its ids sorted, as delta gaps, variable-byte encoded (7 data bits per
+byte, high bit marks the last byte of a number), in blocks of BLOCK_SIZE
+postings. Per block a skip entry keeps the last doc id and the block's byte
+offset, so membership tests and intersections jump straight to the one
+block that can hold a doc id and decode only that block.
+
+An optional integer payload per posting (e.g. a term count) is stored
+variable-byte encoded right after its gap.
+"""
+
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+BLOCK_SIZE = 128
+
+
+def vbyte_encode(numbers, out=None):
+    """
+    Append non-negative integers to a bytearray, variable-byte encoded
+    """
+    out = bytearray() if out is None else out
+    for number in numbers:
+        while number >= 128:
+            out.append(number & 127)
+            number >>= 7
+        out.append(number | 128)
+    return out
+
+
+def vbyte_decode(data, offset=0, count=None):
+    """
+    Decode count integers (all if None) starting at offset
+    """
+    numbers = []
+    number = shift = 0
+    end = len(data)
+    while offset < end and (count is None or len(numbers) < count):
+        byte = data[offset]
+        offset += 1
+        if byte & 128:
+            numbers.append(number | ((byte & 127) << shift))
+            number = shift = 0
+        else:
+            number |= byte << shift
+            shift += 7
+    return numbers
+
+
+class DocIdMap:
+    """
+    Two-way mapping between document names and dense integer ids
+    """
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        doc_id = self.ids.get(name)
+        if doc_id is None:
+            doc_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return doc_id
+
+    def id(self, name):
+        return self.ids.get(name)
+
+    def name(self, doc_id):
+        return self.names[doc_id]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class CompressedPostings:
+    """
+    Immutable posting list: sorted doc ids with optional integer payloads
+    """
+
+    __slots__ = ('data', 'skip_docs', 'skip_offsets', 'length', 'has_payload', '_cache')
+
+    def __init__(self, doc_ids, payloads=None):
+        self.length = len(doc_ids)
+        self.has_payload = payloads is not None
+        self.skip_docs = array('I')
+        self.skip_offsets = array('I')
+        data = bytearray()
+        previous = 0
+        for start in range(0, self.length, BLOCK_SIZE):
+            self.skip_offsets.append(len(data))
+            for i in range(start, min(start + BLOCK_SIZE, self.length)):
+                doc = doc_ids[i]
+                if i and doc <= previous:
+                    raise ValueError("Doc ids must be strictly increasing")
+                vbyte_encode((doc - previous,), data)
+                if self.has_payload:
+                    vbyte_encode((payloads[i],), data)
+                previous = doc
+            self.skip_docs.append(previous)
+        self.data = bytes(data)
+        self._cache = None
+
+    def __len__(self):
+        return self.length
+
+    def _block(self, block):
+        """
+        Decode one block into (doc_ids, payloads); the last block decoded is cached
+        """
+        # Read the cache once: another thread may replace it between a check and a read
+        cached = self._cache
+        if cached is not None and cached[0] == block:
+            return cached[1], cached[2]
+        start = block * BLOCK_SIZE
+        count = min(BLOCK_SIZE, self.length - start)
+        per_posting = 2 if self.has_payload else 1
+        numbers = vbyte_decode(self.data, self.skip_offsets[block], count * per_posting)
+        doc = self.skip_docs[block - 1] if block else 0
+        doc_ids = []
+        for gap in numbers[::per_posting]:
+            doc += gap
+            doc_ids.append(doc)
+        payloads = numbers[1::2] if self.has_payload else None
+        self._cache = (block, doc_ids, payloads)
+        return doc_ids, payloads
+
+    def __iter__(self):
+        for block in range(len(self.skip_docs)):
+            yield from self._block(block)[0]
+
+    def items(self):
+        """
+        Yield (doc_id, payload) pairs
+        """
+        for block in range(len(self.skip_docs)):
+            doc_ids, payloads = self._block(block)
+            yield from zip(doc_ids, payloads if payloads is not None else [None] * len(doc_ids))
+
+    def block_of(self, doc):
+        """
+        Index of the only block that can contain doc, or None if past the end
+        """
+        block = bisect_left(self.skip_docs, doc)
+        return block if block < len(self.skip_docs) else None
+
+    def __contains__(self, doc):
+        block = self.block_of(doc)
+        if block is None:
+            return False
+        doc_ids = self._block(block)[0]
+        i = bisect_left(doc_ids, doc)
+        return i < len(doc_ids) and doc_ids[i] == doc
+
+    def payload(self, doc):
+        block = self.block_of(doc)
+        if block is None:
+            return None
+        doc_ids, payloads = self._block(block)
+        i = bisect_left(doc_ids, doc)
+        if i < len(doc_ids) and doc_ids[i] == doc and payloads is not None:
+            return payloads[i]
+        return None
+
+    def nbytes(self):
+        return len(self.data) + self.skip_docs.itemsize * (len(self.skip_docs) + len(self.skip_offsets))
+
+
+def intersect(postings_lists):
+    """
+    Doc ids present in every posting list. The shortest list drives; the
+    others are probed through their skip pointers.
+    """
+    if not postings_lists:
+        return []
+    ordered = sorted(postings_lists, key=len)
+    result = []
+    for doc in ordered[0]:
+        if all(doc in other for other in ordered[1:]):
+            result.append(doc)
+    return result
+
+
+class CompressedIndex(Mapping):
+    """
+    Term -> compressed postings index.
+
+    Like the dict indexes it replaces, index[term] gives document names (or
+    (name, count) pairs when built from counts); postings(term) gives the
+    CompressedPostings for id-level work. Postings are never changed in
+    place; update() swaps in new postings for whole terms.
+    """
+
+    def __init__(self, doc_map, postings):
+        self.doc_map = doc_map
+        self._postings = postings
+
+    @classmethod
+    def from_sets(cls, term_docs, doc_map=None):
+        """
+        Build from {term: set of doc names}
+        """
+        if doc_map is None:
+            doc_map = DocIdMap(sorted({doc for docs in term_docs.values() for doc in docs}))
+        postings = {}
+        for term, docs in term_docs.items():
+            if docs:
+                postings[term] = CompressedPostings(sorted(doc_map.add(doc) for doc in docs))
+        return cls(doc_map, postings)
+
+    @classmethod
+    def from_counts(cls, term_counts, doc_map=None):
+        """
+        Build from {term: {doc name: count}}
+        """
+        if doc_map is None:
+            doc_map = DocIdMap(sorted({doc for counts in term_counts.values() for doc in counts}))
+        postings = {}
+        for term, counts in term_counts.items():
+            if counts:
+                pairs = sorted((doc_map.add(doc), count) for doc, count in counts.items())
+                postings[term] = CompressedPostings([doc for doc, _ in pairs], [count for _, count in pairs])
+        return cls(doc_map, postings)
+
+    def update(self, term_docs):
+        """
+        Replace the postings of the given terms, each a set of doc names (as
+        in from_sets) or a {doc name: count} dict (as in from_counts). A term
+        left without documents is dropped; every other term is untouched.
+        """
+        doc_map = self.doc_map
+        for term, docs in term_docs.items():
+            if not docs:
+                self._postings.pop(term, None)
+            elif isinstance(docs, dict):
+                pairs = sorted((doc_map.add(doc), count) for doc, count in docs.items())
+                self._postings[term] = CompressedPostings([doc for doc, _ in pairs], [count for _, count in pairs])
+            else:
+                self._postings[term] = CompressedPostings(sorted(doc_map.add(doc) for doc in docs))
+
+    def postings(self, term):
+        return self._postings.get(term)
+
+    def document_frequency(self, term):
+        postings = self._postings.get(term)
+        return len(postings) if postings is not None else 0
+
+    def __getitem__(self, term):
+        postings = self._postings[term]
+        names = self.doc_map.names
+        if postings.has_payload:
+            return [(names[doc], count) for doc, count in postings.items()]
+        return [names[doc] for doc in postings]
+
+    def __contains__(self, term):
+        return term in self._postings
+
+    def __iter__(self):
+        return iter(self._postings)
+
+    def __len__(self):
+        return len(self._postings)
+
+    def nbytes(self):
+        """
+        Bytes used by the encoded postings and skip tables
+        """
+        return sum(postings.nbytes() for postings in self._postings.values())
@@ -0,0 +1,158 @@
+"""
+Shared NLTK text preprocessing for the indexers and retrieval scripts.
+
+The scripts used to build a WordNetLemmatizer and the stopword set on every
+call, and nltk.pos_tag loads the perceptron tagger model every time it is
+called. Here each of those is created once per process, lemmas are memoized
+in a bounded LRU cache, and per-token tags can optionally be memoized too.
+
+Tokenizing, stopword filtering, lemmatizing and tagging are timed as the
+preprocess.* stages of ir_core.instrument when it is enabled.
+"""
+
+from functools import lru_cache
+
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from nltk.tag import PerceptronTagger
+from nltk.tokenize import word_tokenize
+
+from ir_core import instrument
+
+LEMMA_CACHE_SIZE = 100000
+TAG_CACHE_SIZE = 100000
+
+_stop_words = None
+_lemmatizer = None
+_tagger = None
+
+
+def get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        _stop_words = frozenset(stopwords.words('english'))
+    return _stop_words
+
+
+def get_lemmatizer():
+    global _lemmatizer
+    if _lemmatizer is None:
+        _lemmatizer = WordNetLemmatizer()
+    return _lemmatizer
+
+
+def get_tagger():
+    global _tagger
+    if _tagger is None:
+        _tagger = PerceptronTagger()
+    return _tagger
+
+
+def pos_tag(tokens):
+    """
+    Same tags as nltk.pos_tag, without reloading the tagger model
+    """
+    return get_tagger().tag(tokens)
+
+
+def _lemmatize(token):
+    return get_lemmatizer().lemmatize(token)
+
+
+def _tag_token(token):
+    return get_tagger().tag([token])[0][1]
+
+
+lemma = lru_cache(maxsize=LEMMA_CACHE_SIZE)(_lemmatize)
+token_tag = lru_cache(maxsize=TAG_CACHE_SIZE)(_tag_token)
+
+
+def configure_caches(lemma_cache_size=LEMMA_CACHE_SIZE, tag_cache_size=TAG_CACHE_SIZE):
+    """
+    Resize (and empty) the shared lemma and tag caches
+    """
+    global lemma, token_tag
+    lemma = lru_cache(maxsize=lemma_cache_size)(_lemmatize)
+    token_tag = lru_cache(maxsize=tag_cache_size)(_tag_token)
+
+
+def cache_info():
+    return {'lemma': lemma.cache_info()._asdict(), 'tag': token_tag.cache_info()._asdict()}
+
+
+class TextPreprocessor:
+    """
+    Tokenize, filter, lemmatize and POS-filter text the way one of the
+    scripts does it. The options cover the variants used in the repo:
+
+    lowercase            lowercase the text before tokenizing
+    lemmatize            lemmatize tokens (after dropping stopwords)
+    include_adjectives   keep adjectives (J*) as well as nouns (N*)
+    tag_all_tokens       tag the raw token stream, punctuation and stopwords
+                         included, and drop stopwords afterwards (TF-IDF)
+    lowercase_output     lowercase the words that are kept
+    cache_tags           tag each distinct token once, on its own, and
+                         memoize it. Faster, but ignores sentence context,
+                         so results can differ from tagging whole texts.
+    """
+
+    def __init__(self, lowercase=False, lemmatize=True, include_adjectives=False,
+                 tag_all_tokens=False, lowercase_output=False, cache_tags=False):
+        self.lowercase = lowercase
+        self.lemmatize = lemmatize
+        self.include_adjectives = include_adjectives
+        self.tag_all_tokens = tag_all_tokens
+        self.lowercase_output = lowercase_output
+        self.cache_tags = cache_tags
+
+    def _tag(self, tokens):
+        if self.cache_tags:
+            return [(token, token_tag(token)) for token in tokens]
+        return pos_tag(tokens)
+
+    def _select(self, text, include_adjectives):
+        """
+        Kept words with the index of their token in the tokenized text,
+        and the number of tokens
+        """
+        if include_adjectives is None:
+            include_adjectives = self.include_adjectives
+        prefixes = ('N', 'J') if include_adjectives else ('N',)
+        stop_words = get_stop_words()
+
+        with instrument.stage('preprocess.tokenize'):
+            tokens = word_tokenize(text.lower() if self.lowercase else text)
+
+        if self.tag_all_tokens:
+            with instrument.stage('preprocess.pos_tag'):
+                tagged = self._tag(tokens)
+            with instrument.stage('preprocess.stopwords'):
+                selected = [(word, i) for i, (word, pos) in enumerate(tagged)
+                            if pos.startswith(prefixes) and word.lower() not in stop_words]
+        else:
+            with instrument.stage('preprocess.stopwords'):
+                kept = [i for i, token in enumerate(tokens) if token.isalpha() and token not in stop_words]
+                words = [tokens[i] for i in kept]
+            if self.lemmatize:
+                with instrument.stage('preprocess.lemmatize'):
+                    words = [lemma(word) for word in words]
+            with instrument.stage('preprocess.pos_tag'):
+                tagged = self._tag(words)
+            selected = [(word, i) for (word, pos), i in zip(tagged, kept) if pos.startswith(prefixes)]
+        instrument.count('preprocess.tokens', len(tokens))
+        instrument.count('preprocess.words_kept', len(selected))
+
+        if self.lowercase_output:
+            selected = [(word.lower(), i) for word, i in selected]
+        return selected, len(tokens)
+
+    def __call__(self, text, include_adjectives=None):
+        return [word for word, _ in self._select(text, include_adjectives)[0]]
+
+    def with_positions(self, text, include_adjectives=None):
+        """
+        Return ([(word, token position)], number of tokens). Positions count
+        every token, stopwords and punctuation included, so they measure
+        distance in the original text.
+        """
+        return self._select(text, include_adjectives)
@@ -0,0 +1,332 @@
+"""
+Probabilistic ranking: the Binary Independence Model and BM25.
+
+Everything that depends only on the collection is computed once when the
+index is built: per-term RSJ (Robertson / Sparck Jones) and BM25 IDF
+weights, every document's length, the average document length and each
+document's BM25 length normalization. A query then only walks the postings
+of its own terms, so its cost depends on those terms' postings and not on
+the size of the collection. update() applies added, changed and removed
+documents by re-encoding only the postings of the terms they hold.
+
+With no relevance information the RSJ weight of term i is
+
+    log((N - n_i + 0.5) / (n_i + 0.5))
+
+(p_i = 0.5, u_i estimated from the document frequency n_i), and a
+document's BIM score is the sum of the weights of the query terms it holds.
+BM25 adds term frequency saturation (k1) and length normalization (b):
+
+    idf_i * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+
+with idf_i = log(1 + (N - n_i + 0.5) / (n_i + 0.5)), which stays positive.
+
+Pseudo-relevance feedback treats the top documents V of a ranking as
+relevant and re-estimates, from the v_i of them that hold term i,
+
+    p_i = (v_i + 0.5) / (|V| + 1)      u_i = (n_i - v_i + 0.5) / (N - |V| + 1)
+
+    c_i = log(p_i (1 - u_i) / (u_i (1 - p_i)))
+
+The terms of V come from cached per-document term vectors, so an iteration
+costs one postings pass over the (expanded) query, not a corpus rescan.
+
+The scoring methods take an optional decoded={term: {doc id: tf}} map from
+decode_postings(), so a batch of queries decodes each term's compressed
+postings once instead of once per query.
+"""
+
+import math
+from array import array
+from collections import Counter
+
+from ir_core import instrument
+from ir_core.postings import CompressedIndex, DocIdMap
+from ir_core.scoring import query_term_counts, top_k
+
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# Pseudo-relevance feedback defaults
+FEEDBACK_DOCS = 10
+EXPANSION_TERMS = 5
+
+
+def rsj_weight(df, num_docs):
+    return math.log((num_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_idf(df, num_docs):
+    return math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+
+
+class ProbabilisticIndex:
+    """
+    Term frequency postings plus the precomputed statistics BIM and BM25 need
+    """
+
+    def __init__(self, term_counts, doc_map, k1=DEFAULT_K1, b=DEFAULT_B,
+                 num_docs=None, avg_doc_length=None, document_frequency=None):
+        """
+        term_counts is {term: {doc name: count}}; doc_map must hold every
+        document of the collection, including ones without any term.
+
+        num_docs, avg_doc_length and document_frequency(term) override the
+        statistics of this index with those of a larger collection, for a
+        shard that must score like the whole collection (ir_core/sharding.py).
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_map = doc_map
+        self.postings = CompressedIndex.from_counts(term_counts, doc_map)
+        # Ids of removed documents (see update); they keep their ids but hold no terms
+        self._removed = set()
+        self._shared_statistics = (num_docs is not None or avg_doc_length is not None
+                                   or document_frequency is not None)
+        self.document_frequency = document_frequency or self.postings.document_frequency
+
+        self.doc_lengths = array('I', [0] * len(doc_map))
+        for counts in term_counts.values():
+            for doc, count in counts.items():
+                self.doc_lengths[doc_map.id(doc)] += count
+
+        # Every document's term ids, for relevance feedback
+        self.terms = list(self.postings)
+        self._term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.doc_terms = [array('I') for _ in range(len(doc_map))]
+        for term_id, term in enumerate(self.terms):
+            for doc in self.postings.postings(term):
+                self.doc_terms[doc].append(term_id)
+
+        self.rsj_weights = {}
+        self.idf_weights = {}
+        self._statistics(self.postings, num_docs, avg_doc_length)
+
+    def _statistics(self, terms, num_docs=None, avg_doc_length=None):
+        """
+        Recompute N, the average document length and every document's BM25
+        length normalization, and the weights of terms
+        """
+        local_docs = len(self.doc_map) - len(self._removed)
+        self.num_docs = local_docs if num_docs is None else num_docs
+        if avg_doc_length is None:
+            avg_doc_length = sum(self.doc_lengths) / local_docs if local_docs else 0.0
+        self.avg_doc_length = avg_doc_length
+
+        # k1 * (1 - b + b * len / avg_len) for every document
+        k1, b = self.k1, self.b
+        average = self.avg_doc_length or 1.0
+        self.length_norms = array('d', (k1 * (1 - b + b * length / average) for length in self.doc_lengths))
+
+        for term in terms:
+            df = self.document_frequency(term)
+            if df:
+                self.rsj_weights[term] = rsj_weight(df, self.num_docs)
+                self.idf_weights[term] = bm25_idf(df, self.num_docs)
+            else:
+                self.rsj_weights.pop(term, None)
+                self.idf_weights.pop(term, None)
+
+    def update(self, documents, removed=()):
+        """
+        Apply new or re-indexed documents ({doc name: list of terms (or
+        {term: count})}) and removed document names in place. Only the
+        postings of the terms those documents hold, before or after, are
+        re-encoded; the collection statistics are then recomputed from the
+        arrays already in memory. Removed documents keep their ids.
+        """
+        if self._shared_statistics:
+            raise ValueError("An index scored with another collection's statistics cannot be updated")
+        doc_map = self.doc_map
+        # term -> {doc id: new count, 0 to drop the posting}
+        changes = {}
+        for name in list(documents) + list(removed):
+            doc = doc_map.id(name)
+            if doc is None or doc in self._removed:
+                continue
+            for term_id in self.doc_terms[doc]:
+                changes.setdefault(self.terms[term_id], {})[doc] = 0
+            self.doc_terms[doc] = array('I')
+            self.doc_lengths[doc] = 0
+            self._removed.add(doc)
+
+        for name, terms in documents.items():
+            doc = doc_map.add(name)
+            if doc == len(self.doc_lengths):
+                self.doc_lengths.append(0)
+                self.doc_terms.append(array('I'))
+            self._removed.discard(doc)
+            counts = terms if isinstance(terms, dict) else Counter(terms)
+            term_ids = array('I')
+            for term, count in counts.items():
+                if count:
+                    changes.setdefault(term, {})[doc] = count
+                    term_id = self._term_ids.get(term)
+                    if term_id is None:
+                        term_id = self._term_ids[term] = len(self.terms)
+                        self.terms.append(term)
+                    term_ids.append(term_id)
+            self.doc_terms[doc] = term_ids
+            self.doc_lengths[doc] = sum(counts.values())
+
+        names = doc_map.names
+        term_counts = {}
+        for term, doc_counts in changes.items():
+            postings = self.postings.postings(term)
+            counts = dict(postings.items()) if postings is not None else {}
+            for doc, count in doc_counts.items():
+                if count:
+                    counts[doc] = count
+                else:
+                    counts.pop(doc, None)
+            term_counts[term] = {names[doc]: count for doc, count in counts.items()}
+        self.postings.update(term_counts)
+        # The weights depend on N, so a change of N reweighs every term
+        if len(doc_map) - len(self._removed) == self.num_docs:
+            self._statistics(changes)
+        else:
+            self._statistics(list(self.postings) + list(changes))
+
+    @classmethod
+    def from_documents(cls, documents, k1=DEFAULT_K1, b=DEFAULT_B):
+        """
+        Build from {doc name: list of terms (or {term: count})}
+        """
+        with instrument.stage('index.probabilistic'):
+            doc_map = DocIdMap(sorted(documents))
+            term_counts = {}
+            for doc, terms in documents.items():
+                counts = terms if isinstance(terms, dict) else Counter(terms)
+                for term, count in counts.items():
+                    term_counts.setdefault(term, {})[doc] = count
+            return cls(term_counts, doc_map, k1, b)
+
+    def decode_postings(self, terms):
+        """
+        {term: {doc id: tf}} for the terms of the index among terms
+        """
+        decoded = {}
+        for term in terms:
+            postings = self.postings.postings(term)
+            if postings is not None and term not in decoded:
+                decoded[term] = dict(postings.items())
+        return decoded
+
+    def _postings(self, term, decoded):
+        if decoded is not None and term in decoded:
+            return decoded[term]
+        return self.postings.postings(term)
+
+    def bim_scores(self, query_terms, decoded=None):
+        """
+        {doc id: sum of the RSJ weights of the query terms it contains}
+        """
+        scores = {}
+        for term in set(query_terms):
+            postings = self._postings(term, decoded)
+            if postings is None:
+                continue
+            weight = self.rsj_weights[term]
+            for doc in postings:
+                scores[doc] = scores.get(doc, 0.0) + weight
+        return scores
+
+    def weighted_scores(self, term_weights, decoded=None):
+        """
+        {doc id: sum of the weights of the terms it contains} for a {term: weight} query
+        """
+        scores = {}
+        for term, weight in term_weights.items():
+            postings = self._postings(term, decoded)
+            if postings is None:
+                continue
+            for doc in postings:
+                scores[doc] = scores.get(doc, 0.0) + weight
+        return scores
+
+    def feedback_weights(self, query_terms, feedback_docs=FEEDBACK_DOCS,
+                         expansion_terms=EXPANSION_TERMS, iterations=1, decoded=None):
+        """
+        Pseudo-relevance feedback: re-estimate the BIM weights from the top
+        feedback_docs documents, add the expansion_terms best new terms and
+        repeat for the given number of iterations. Returns {term: weight}.
+        """
+        query = [term for term in dict.fromkeys(query_terms) if term in self.rsj_weights]
+        weights = {term: self.rsj_weights[term] for term in query}
+        for _ in range(iterations):
+            # The feedback documents are the top of the ranking, ties by name as in rank()
+            relevant = [self.doc_map.id(name) for name, _ in
+                        self.rank(self.weighted_scores(weights, decoded), feedback_docs)]
+            if not relevant:
+                break
+
+            # v_i for every term of the feedback documents, from their cached term vectors
+            relevant_counts = Counter()
+            for doc in relevant:
+                relevant_counts.update(self.doc_terms[doc])
+
+            num_relevant = len(relevant)
+            estimated = {}
+            offers = []
+            for term_id, relevant_df in relevant_counts.items():
+                term = self.terms[term_id]
+                df = self.document_frequency(term)
+                p = (relevant_df + 0.5) / (num_relevant + 1)
+                u = (df - relevant_df + 0.5) / (self.num_docs - num_relevant + 1)
+                estimated[term] = weight = math.log(p * (1 - u) / (u * (1 - p)))
+                if weight > 0:
+                    # Expansion terms are chosen by their offer weight v_i * c_i
+                    offers.append((-relevant_df * weight, term))
+
+            # Query terms keep a weight even when no feedback document holds them
+            weights = {term: estimated.get(term, self.rsj_weights[term]) for term in query}
+            offers.sort()
+            added = 0
+            for _, term in offers:
+                if added == expansion_terms:
+                    break
+                if term not in weights:
+                    weights[term] = estimated[term]
+                    added += 1
+        return weights
+
+    def bm25_scores(self, query_terms, decoded=None):
+        """
+        {doc id: BM25 score}; a term repeated in the query counts repeatedly
+        """
+        scores = {}
+        k1_plus_one = self.k1 + 1
+        length_norms = self.length_norms
+        for term, query_count in query_term_counts(query_terms).items():
+            postings = self._postings(term, decoded)
+            if postings is None:
+                continue
+            weight = self.idf_weights[term] * query_count
+            for doc, tf in postings.items():
+                scores[doc] = scores.get(doc, 0.0) + weight * tf * k1_plus_one / (tf + length_norms[doc])
+        return scores
+
+    def rank(self, scores, k=None):
+        """
+        [(doc name, score)], best first, ties by name whether or not k is
+        given (doc ids stop following name order once update() adds documents)
+        """
+        names = self.doc_map.names
+        named_scores = {names[doc]: score for doc, score in scores.items()}
+        if k is not None:
+            return top_k(named_scores, k)
+        return sorted(named_scores.items(), key=lambda item: (-item[1], item[0]))
+
+    @instrument.timed('score.bim')
+    def rank_bim(self, query_terms, k=None, decoded=None):
+        return self.rank(self.bim_scores(query_terms, decoded), k)
+
+    @instrument.timed('score.bm25')
+    def rank_bm25(self, query_terms, k=None, decoded=None):
+        return self.rank(self.bm25_scores(query_terms, decoded), k)
+
+    @instrument.timed('score.bim_feedback')
+    def rank_bim_feedback(self, query_terms, k=None, feedback_docs=FEEDBACK_DOCS,
+                          expansion_terms=EXPANSION_TERMS, iterations=1, decoded=None):
+        weights = self.feedback_weights(query_terms, feedback_docs, expansion_terms, iterations, decoded)
+        return self.rank(self.weighted_scores(weights, decoded), k)
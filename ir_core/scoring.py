@@ -0,0 +1,209 @@
+"""
+Accumulator-based query scoring over an inverted index.
+
+Each query term's postings are walked exactly once (term-at-a-time) and the
+partial scores are kept in per-document accumulators, so a query costs time
+proportional to the length of its posting lists instead of the corpus size.
+
+When only the best k documents are wanted, top_k_max_score walks the
+postings document-at-a-time instead and uses the per-term upper bounds saved
+in the index (MaxScore) to skip documents that cannot reach the top k.
+"""
+
+import math
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+
+from ir_core import instrument
+
+
+def query_term_counts(query_terms):
+    """
+    Count query terms, keeping the order in which they first appear
+    """
+    counts = {}
+    for term in query_terms:
+        counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+@instrument.timed('score.tfidf_cosine')
+def score_query(index, query_terms):
+    """
+    Score every document that contains a query term in a single pass.
+
+    Returns two dicts keyed by doc id: the summed TF-IDF weight of the query
+    terms (a repeated term counts once per occurrence) and the cosine
+    similarity between the query term-frequency vector and the document's
+    full weight vector, whose norm is read from index.doc_norms.
+    """
+    counts = query_term_counts(query_terms)
+    dot_acc = defaultdict(float)
+
+    for term, count in counts.items():
+        entry = index.postings(term)
+        if entry is None:
+            continue
+        doc_ids, weights = entry
+        for doc, weight in zip(doc_ids, weights):
+            dot_acc[doc] += count * weight
+
+    query_norm = math.sqrt(sum(count * count for count in counts.values()))
+    doc_norms = index.doc_norms
+    cosine_scores = {}
+    for doc, dot in dot_acc.items():
+        doc_norm = doc_norms[doc]
+        cosine_scores[doc] = dot / (query_norm * doc_norm) if doc_norm else 0
+    return dict(dot_acc), cosine_scores
+
+
+def rank(scores, doc_names, reverse=False, every_document=False):
+    """
+    Turn a doc id -> score dict into a sorted list of (doc_name, score);
+    ties keep doc id order. With every_document, the documents missing from
+    scores are listed too, with a score of 0.0, as the original search did.
+    """
+    if every_document:
+        scores = {doc: scores.get(doc, 0.0) for doc in range(len(doc_names))}
+    ordered = sorted(scores.items(), key=lambda item: (-item[1] if reverse else item[1], item[0]))
+    return [(doc_names[doc], score) for doc, score in ordered]
+
+
+def top_k(scores, k):
+    """
+    Pick the k best (key, score) pairs from a dict with a bounded heap;
+    ties go to the smaller key
+    """
+    return heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class TopKHeap:
+    """
+    Bounded min-heap of the k best items pushed so far.
+
+    Items are expected in a fixed order (e.g. ascending doc id); among equal
+    scores the item pushed first wins, which matches a stable sort.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._pushed = 0
+
+    def is_full(self):
+        return len(self._heap) >= self.k
+
+    @property
+    def threshold(self):
+        """
+        Score an item must beat to enter the heap, or None while it has room
+        """
+        if self.k <= 0:
+            return math.inf
+        return self._heap[0][0] if self.is_full() else None
+
+    def can_enter(self, bound):
+        threshold = self.threshold
+        return threshold is None or bound > threshold
+
+    def push(self, item, score):
+        if self.k <= 0:
+            return
+        entry = (score, -self._pushed, item)
+        self._pushed += 1
+        if not self.is_full():
+            heapq.heappush(self._heap, entry)
+        elif score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def results(self):
+        """
+        Return [(item, score), ...] best first
+        """
+        return [(item, score) for score, _, item in sorted(self._heap, reverse=True)]
+
+
+class _TermCursor:
+    def __init__(self, doc_ids, weights, scale, bound):
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.scale = scale
+        self.bound = bound
+        self.pos = 0
+        self.size = len(doc_ids)
+
+    def doc(self):
+        return self.doc_ids[self.pos] if self.pos < self.size else None
+
+    def seek(self, doc):
+        # Postings are sorted by doc id, so skipping ahead is a binary search
+        self.pos = bisect_left(self.doc_ids, doc, self.pos)
+        return self.doc()
+
+
+@instrument.timed('score.max_score')
+def top_k_max_score(index, query_terms, k, cosine=False):
+    """
+    Return the k best (doc_id, score) pairs for a query, best first.
+
+    Scores match score_query (TF-IDF sum, or cosine when cosine=True). Terms
+    are ordered by upper bound; once the k-th best score is at least the sum
+    of the smallest bounds, those terms stop generating candidates and are
+    only probed for documents found through the other terms.
+    """
+    counts = query_term_counts(query_terms)
+    query_norm = math.sqrt(sum(count * count for count in counts.values()))
+    doc_norms = index.doc_norms
+
+    cursors = []
+    for term, count in counts.items():
+        entry = index.postings(term)
+        if entry is None:
+            continue
+        max_weight, max_normalized = index.upper_bounds(term)
+        if cosine:
+            scale = count / query_norm
+            cursors.append(_TermCursor(entry[0], entry[1], scale, scale * max_normalized))
+        else:
+            cursors.append(_TermCursor(entry[0], entry[1], count, count * max_weight))
+    cursors.sort(key=lambda cursor: cursor.bound)
+
+    # prefix[i] bounds the score a document can get from cursors[0..i]
+    prefix = []
+    total = 0.0
+    for cursor in cursors:
+        total += cursor.bound
+        prefix.append(total)
+
+    heap = TopKHeap(k)
+    first_essential = 0
+    while first_essential < len(cursors):
+        essential = cursors[first_essential:]
+        doc = min((cursor.doc() for cursor in essential if cursor.pos < cursor.size), default=None)
+        if doc is None:
+            break
+
+        score = 0.0
+        for cursor in essential:
+            if cursor.pos < cursor.size and cursor.doc_ids[cursor.pos] == doc:
+                weight = cursor.weights[cursor.pos]
+                score += cursor.scale * (weight / doc_norms[doc] if cosine else weight)
+                cursor.pos += 1
+
+        threshold = heap.threshold
+        for i in range(first_essential - 1, -1, -1):
+            if threshold is not None and score + prefix[i] <= threshold:
+                break
+            cursor = cursors[i]
+            if cursor.seek(doc) == doc:
+                weight = cursor.weights[cursor.pos]
+                score += cursor.scale * (weight / doc_norms[doc] if cosine else weight)
+        else:
+            heap.push(doc, score)
+
+        threshold = heap.threshold
+        if threshold is not None:
+            while first_essential < len(cursors) and prefix[first_essential] <= threshold:
+                first_essential += 1
+    return heap.results()
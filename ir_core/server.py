@@ -0,0 +1,616 @@
+"""
+Headless HTTP/JSON query server with warm indexes.
+
+    python -m ir_core.server FOLDER [--host 127.0.0.1] [--port 8080]
+                                    [--workers N] [--timeout 5] [--instrument]
+
+The .txt files of FOLDER are preprocessed once, in a process pool, into the
+same indexes the scripts build (with the same preprocessing):
+
+    content         noun counts per document (Assignment 1)
+    tfidf           TF-IDF / cosine on-disk index (Assignment 2)
+    boolean         term bitmaps (Assignment 3, non-overlapping lists)
+    probabilistic   BIM / BM25 index (Assignment 3)
+
+Endpoints (GET with query parameters, or POST with a JSON object body):
+
+    /search/title          q, k, mode           substring | prefix | suffix | exact
+    /search/content        q, k
+    /search/tfidf          q, k                 -> tfidf and cosine rankings
+    /search/boolean        q                    AND / OR / NOT, parentheses
+    /search/probabilistic  q, k, model          bim | bm25 | bim_feedback
+    /reload                                     re-index the folder
+    /health
+    /stats                                      query cache hits and misses
+    /metrics               format               stage timings (ir_core/instrument.py),
+                                                JSON or format=prometheus text
+    /instrument            enabled, reset       POST: switch stage timing on / off;
+                                                true / false or 1 / 0
+
+Connections are handled concurrently on one event loop. NLTK preprocessing
+of queries runs in the worker process pool and scoring in a thread, so the
+event loop only parses requests and writes responses. A request that takes
+longer than the timeout gets a 504, except /reload, which always runs to
+the end. Preprocessed queries and results are cached (ir_core/cache.py); a
+reload invalidates the cached results.
+
+A GET to /reload or /instrument gets a 405 with an Allow header. A request
+line and headers over 64 KiB get a 431, and a larger body a 413; the
+connection is then closed.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import shutil
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from ir_core import instrument
+from ir_core.bitmap import BitmapIndex
+from ir_core.cache import QueryCache, normalize_query
+from ir_core.boolean import QuerySyntaxError, parse, word_runs
+from ir_core.boolean import evaluate as evaluate_boolean
+from ir_core.index_store import DiskIndex, corpus_fingerprint, write_index
+from ir_core.parallel import map_chunks
+from ir_core.postings import DocIdMap
+from ir_core.preprocessing import TextPreprocessor
+from ir_core.probabilistic import ProbabilisticIndex
+from ir_core.scoring import score_query, top_k
+from ir_core.titles import TitleIndex
+
+SERVER_INDEX_DIR = '.server_index'
+GENERATION_PREFIX = 'generation-'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_K = 10
+MAX_REQUEST_BYTES = 64 * 1024
+
+# The preprocessing of each script
+_content_nouns = TextPreprocessor()
+_tfidf_nouns = TextPreprocessor(lemmatize=False, tag_all_tokens=True, lowercase_output=True)
+_retrieval_terms = TextPreprocessor(lowercase=True)
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+            504: 'Gateway Timeout'}
+
+
+class BadRequest(Exception):
+    status = 400
+    headers = {}
+
+
+class MethodNotAllowed(BadRequest):
+    status = 405
+
+    def __init__(self, allowed, message):
+        super().__init__(message)
+        self.headers = {'Allow': allowed}
+
+
+class PayloadTooLarge(BadRequest):
+    status = 413
+
+
+class HeadersTooLarge(BadRequest):
+    status = 431
+
+
+def _content_counts(content):
+    # Assignment 1: nouns that occur more than once within a paragraph
+    counts = {}
+    for paragraph in content.split('\n\n'):
+        paragraph_counts = {}
+        for noun in _content_nouns(paragraph):
+            noun = noun.lower()
+            paragraph_counts[noun] = paragraph_counts.get(noun, 0) + 1
+        for noun, count in paragraph_counts.items():
+            if count > 1:
+                counts[noun] = counts.get(noun, 0) + count
+    return counts
+
+
+def _tfidf_counts(content):
+    counts = {}
+    for word in _tfidf_nouns(content.lower()):
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def analyze_documents(documents):
+    """
+    Worker: [(name, content)] -> [(name, content counts, tfidf counts, retrieval terms)]
+    """
+    return [(name, _content_counts(content), _tfidf_counts(content),
+             _retrieval_terms(content, include_adjectives=True))
+            for name, content in documents]
+
+
+def preprocess_query(kind, text):
+    """
+    Worker: the terms of a query, preprocessed the way the target index was
+    """
+    if kind == 'content':
+        return [noun.lower() for noun in _content_nouns(text)]
+    if kind == 'tfidf':
+        return _tfidf_nouns(text)
+    if kind == 'probabilistic':
+        return _retrieval_terms(text, include_adjectives=True)
+    if kind == 'boolean':
+        return _retrieval_terms(text)
+    raise ValueError(f"Unknown query kind {kind!r}")
+
+
+def _inverse_document_frequency(df, total_docs):
+    return math.log((total_docs + 1) / (df + 1)) + 1
+
+
+class IndexGeneration:
+    """
+    One immutable build of every index, in its own index directory.
+    Searches hold a reference while they run; a retired generation closes
+    its on-disk index once the last of them lets go.
+    """
+
+    def __init__(self, number, index_dir, doc_names, content_index, tfidf_index, bitmap_index,
+                 probabilistic_index):
+        self.number = number
+        self.index_dir = index_dir
+        self.doc_names = doc_names
+        self.title_index = TitleIndex(doc_names)
+        self.content_index = content_index
+        self.tfidf_index = tfidf_index
+        self.bitmap_index = bitmap_index
+        self.probabilistic_index = probabilistic_index
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+
+    def acquire(self):
+        with self._lock:
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            done = self._retired and not self._users
+        if done:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            done = not self._users
+        if done:
+            self._close()
+
+    def _close(self):
+        self.tfidf_index.close()
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+
+class SearchService:
+    """
+    The warm indexes of one folder and the queries they answer.
+
+    load() builds a new IndexGeneration in a fresh subdirectory of index_dir
+    and swaps it in with one assignment, so a query sees either the old or
+    the new indexes, never a mix. The old generation's files are closed and
+    deleted once the searches still using it are done.
+    """
+
+    def __init__(self, folder_path, workers=None, index_dir=None):
+        self.folder_path = folder_path
+        self.workers = workers
+        self.index_dir = index_dir or os.path.join(folder_path, SERVER_INDEX_DIR)
+        self._state = None
+        self._swap_lock = threading.Lock()
+        # Generation directories left behind by an earlier run
+        if os.path.isdir(self.index_dir):
+            for entry in os.listdir(self.index_dir):
+                if entry.startswith(GENERATION_PREFIX):
+                    shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
+        self.load()
+
+    def load(self):
+        """
+        (Re)build every index from the folder into a new generation and swap it in
+        """
+        fingerprint = corpus_fingerprint(self.folder_path)
+        names = sorted(filename for filename in os.listdir(self.folder_path) if filename.endswith('.txt'))
+        documents = []
+        for name in names:
+            with open(os.path.join(self.folder_path, name), 'r', encoding='utf-8') as file:
+                documents.append((name, file.read()))
+
+        content_index = {}
+        tfidf_postings = {}
+        retrieval_terms = {}
+        for chunk in map_chunks(analyze_documents, documents, self.workers):
+            for name, content_counts, tfidf_counts, terms in chunk:
+                for noun, count in content_counts.items():
+                    content_index.setdefault(noun, {})[name] = count
+                total_terms = sum(tfidf_counts.values())
+                for word, count in tfidf_counts.items():
+                    tfidf_postings.setdefault(word, []).append((name, count / total_terms))
+                retrieval_terms[name] = terms
+        del documents
+
+        for word, postings in tfidf_postings.items():
+            idf = _inverse_document_frequency(len(postings), len(names))
+            tfidf_postings[word] = [(name, tf * idf) for name, tf in postings]
+
+        number = (self._state.number if self._state is not None else 0) + 1
+        generation_dir = os.path.join(self.index_dir, f"{GENERATION_PREFIX}{number}")
+        shutil.rmtree(generation_dir, ignore_errors=True)
+        write_index(generation_dir, tfidf_postings, names, fingerprint)
+
+        term_docs = {}
+        for name, terms in retrieval_terms.items():
+            for term in terms:
+                term_docs.setdefault(term, set()).add(name)
+        state = IndexGeneration(number, generation_dir, names, content_index, DiskIndex(generation_dir),
+                                BitmapIndex.from_sets(term_docs, DocIdMap(names)),
+                                ProbabilisticIndex.from_documents(retrieval_terms))
+        with self._swap_lock:
+            previous, self._state = self._state, state
+        if previous is not None:
+            previous.retire()
+
+    def close(self):
+        with self._swap_lock:
+            previous, self._state = self._state, None
+        if previous is not None:
+            previous.retire()
+
+    @contextmanager
+    def current(self):
+        """
+        The current IndexGeneration, kept open until the block ends
+        """
+        with self._swap_lock:
+            state = self._state
+            state.acquire()
+        try:
+            yield state
+        finally:
+            state.release()
+
+    # Read-only views of the current generation, for single-threaded callers
+    @property
+    def generation(self):
+        return self._state.number
+
+    @property
+    def doc_names(self):
+        return self._state.doc_names
+
+    @property
+    def title_index(self):
+        return self._state.title_index
+
+    @property
+    def content_index(self):
+        return self._state.content_index
+
+    @property
+    def tfidf_index(self):
+        return self._state.tfidf_index
+
+    @property
+    def bitmap_index(self):
+        return self._state.bitmap_index
+
+    @property
+    def probabilistic_index(self):
+        return self._state.probabilistic_index
+
+    def search_title(self, query, k=None, mode='substring'):
+        with self.current() as state:
+            try:
+                return [(name, 0) for name in state.title_index.search(query, mode, limit=k)]
+            except ValueError as e:
+                raise BadRequest(str(e))
+
+    def search_content(self, nouns, k=None):
+        with self.current() as state:
+            scores = {}
+            for noun in nouns:
+                for name, count in state.content_index.get(noun, {}).items():
+                    scores[name] = scores.get(name, 0) + count
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked if k is None else ranked[:k]
+
+    def search_tfidf(self, words, k=None):
+        with self.current() as state:
+            tfidf_scores, cosine_scores = score_query(state.tfidf_index, words)
+            names = state.tfidf_index.doc_names
+        k = len(tfidf_scores) if k is None else k
+        return ([(names[doc], score) for doc, score in top_k(tfidf_scores, k)],
+                [(names[doc], score) for doc, score in top_k(cosine_scores, k)])
+
+    def search_boolean(self, tree, normalized):
+        with self.current() as state:
+            bitmap = evaluate_boolean(tree, state.bitmap_index, lambda text: normalized[text])
+            return [(name, 1) for name in state.bitmap_index.names(bitmap)]
+
+    def search_probabilistic(self, terms, k=None, model='bm25'):
+        with self.current() as state:
+            if model == 'bim':
+                return state.probabilistic_index.rank_bim(terms, k)
+            if model == 'bim_feedback':
+                return state.probabilistic_index.rank_bim_feedback(terms, k)
+            if model == 'bm25':
+                return state.probabilistic_index.rank_bm25(terms, k)
+        raise BadRequest(f"Unknown model {model!r}")
+
+
+def _results(ranked):
+    return [{'document': name, 'score': score} for name, score in ranked]
+
+
+def _flag(params, name, default=False):
+    """
+    A boolean parameter: JSON true / false, or true / false / 1 / 0 as text
+    """
+    value = params.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('true', '1'):
+        return True
+    if isinstance(value, str) and value.strip().lower() in ('false', '0'):
+        return False
+    raise BadRequest(f"'{name}' must be true or false")
+
+
+class QueryServer:
+    """
+    asyncio HTTP/1.1 server in front of a SearchService
+    """
+
+    def __init__(self, service, pool, timeout=DEFAULT_TIMEOUT, cache=None):
+        self.service = service
+        self.pool = pool
+        self.timeout = timeout
+        self.cache = cache or QueryCache()
+        self._reload_lock = asyncio.Lock()
+
+    async def _preprocess(self, kind, text):
+        terms = self.cache.lookup_terms(text, kind)
+        if terms is None:
+            loop = asyncio.get_running_loop()
+            if instrument.is_enabled():
+                # Bring the worker's preprocessing stage timings back to this process
+                terms, recorded = await loop.run_in_executor(self.pool, instrument.call_recorded,
+                                                             preprocess_query, kind, text)
+                instrument.merge(recorded)
+            else:
+                terms = await loop.run_in_executor(self.pool, preprocess_query, kind, text)
+            terms = self.cache.add_terms(text, terms, kind)
+        return terms
+
+    async def _compute(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def _ranked(self, terms, model, k, func, *args):
+        generation = self.service.generation
+        results = self.cache.lookup_results(terms, model, k, generation)
+        if results is None:
+            results = self.cache.add_results(terms, model, k, generation, await self._compute(func, *args))
+        return results
+
+    async def dispatch(self, method, path, params):
+        service = self.service
+        if path == '/health':
+            return {'status': 'ok', 'documents': len(service.doc_names), 'generation': service.generation}
+        if path == '/stats':
+            return self.cache.stats()
+        if path == '/metrics':
+            if params.get('format') == 'prometheus':
+                return instrument.prometheus_text()
+            return instrument.snapshot()
+        if path == '/instrument':
+            if method != 'POST':
+                raise MethodNotAllowed('POST', 'Use POST to switch instrumentation')
+            # Both are parsed before either is applied, so a bad value changes nothing
+            reset = _flag(params, 'reset')
+            enabled = _flag(params, 'enabled', None)
+            if reset:
+                instrument.reset()
+            if enabled is not None:
+                instrument.enable() if enabled else instrument.disable()
+            return {'enabled': instrument.is_enabled()}
+        if path == '/reload':
+            if method != 'POST':
+                raise MethodNotAllowed('POST', 'Use POST to reload')
+            async with self._reload_lock:
+                await self._compute(service.load)
+            return {'status': 'reloaded', 'documents': len(service.doc_names), 'generation': service.generation}
+        if not path.startswith('/search/'):
+            return None
+
+        query = params.get('q')
+        if not isinstance(query, str) or not query.strip():
+            raise BadRequest("Missing query parameter 'q'")
+        try:
+            k = int(params['k']) if params.get('k') not in (None, '') else DEFAULT_K
+        except (TypeError, ValueError):
+            raise BadRequest("'k' must be an integer")
+        if k < 1:
+            raise BadRequest("'k' must be at least 1")
+
+        kind = path[len('/search/'):]
+        response = {'query': query, 'generation': service.generation}
+        if kind == 'title':
+            response['results'] = _results(service.search_title(query, k, params.get('mode') or 'substring'))
+        elif kind == 'content':
+            nouns = await self._preprocess('content', query)
+            response['results'] = _results(await self._ranked(nouns, 'content', k, service.search_content, nouns, k))
+        elif kind == 'tfidf':
+            words = await self._preprocess('tfidf', query)
+            ranked_tfidf, ranked_cosine = await self._ranked(words, 'tfidf+cosine', k,
+                                                             service.search_tfidf, words, k)
+            response['tfidf'] = _results(ranked_tfidf)
+            response['cosine'] = _results(ranked_cosine)
+        elif kind == 'boolean':
+            try:
+                tree = parse(query)
+            except QuerySyntaxError as e:
+                raise BadRequest(f"Invalid query: {e}")
+            generation = service.generation
+            results = self.cache.lookup_results(normalize_query(query), 'boolean', None, generation)
+            if results is None:
+                texts = list(dict.fromkeys(word_runs(tree)))
+                terms = await asyncio.gather(*(self._preprocess('boolean', text) for text in texts))
+                results = self.cache.add_results(normalize_query(query), 'boolean', None, generation,
+                                                 await self._compute(service.search_boolean, tree,
+                                                                     dict(zip(texts, terms))))
+            response['results'] = _results(results)
+        elif kind == 'probabilistic':
+            model = params.get('model') or 'bm25'
+            terms = await self._preprocess('probabilistic', query)
+            response['model'] = model
+            response['results'] = _results(await self._ranked(terms, model, k, service.search_probabilistic,
+                                                              terms, k, model))
+        else:
+            return None
+        return response
+
+    async def _read_request(self, reader):
+        # The stream limit is MAX_REQUEST_BYTES (see serve), so a longer head overruns it
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HeadersTooLarge(f"Request line and headers exceed {MAX_REQUEST_BYTES} bytes")
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise BadRequest('Malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise BadRequest('Invalid Content-Length')
+        if length > MAX_REQUEST_BYTES:
+            raise PayloadTooLarge(f"Body exceeds {MAX_REQUEST_BYTES} bytes")
+        if length:
+            body = await reader.readexactly(length)
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                raise BadRequest('Body is not valid JSON')
+            if not isinstance(payload, dict):
+                raise BadRequest('Body must be a JSON object')
+            params.update(payload)
+        return method.upper(), url.path, params
+
+    async def _respond(self, writer, status, payload, headers=None):
+        # Payloads are JSON objects, except for plain text such as Prometheus metrics
+        if isinstance(payload, str):
+            body = payload.encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        else:
+            body = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json'
+        extra = ''.join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write((f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                      f"Content-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"{extra}"
+                      "Connection: close\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        headers = None
+        try:
+            try:
+                method, path, params = await asyncio.wait_for(self._read_request(reader), self.timeout)
+                if method not in ('GET', 'POST'):
+                    raise MethodNotAllowed('GET, POST', f"Method {method} not allowed")
+                # A reload runs to the end: cancelling it would release the reload lock
+                # while load() still runs in its thread
+                timeout = None if path == '/reload' else self.timeout
+                payload = await asyncio.wait_for(self.dispatch(method, path, params), timeout)
+                status = 200
+                if payload is None:
+                    status, payload = 404, {'error': f"No endpoint {path}"}
+            except BadRequest as e:
+                # The connection is closed after any response, so an unread body or head is dropped
+                status, payload, headers = e.status, {'error': str(e)}, e.headers
+            except asyncio.TimeoutError:
+                status, payload = 504, {'error': f"Request took longer than {self.timeout} s"}
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except Exception as e:
+                status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+            if isinstance(payload, dict):
+                payload['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            await self._respond(writer, status, payload, headers)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+        sockets = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        print(f"Serving {len(self.service.doc_names)} documents from {self.service.folder_path} on {sockets}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve search queries over a folder of .txt files")
+    parser.add_argument('folder', help="folder containing the .txt documents")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="preprocessing processes (default: every core)")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds before a request is answered with 504")
+    parser.add_argument('--instrument', action='store_true',
+                        help="record stage timings from the start (see /metrics)")
+    args = parser.parse_args(argv)
+    if args.instrument:
+        instrument.enable()
+
+    if not os.path.isdir(args.folder):
+        print(f"Not a folder: {args.folder}", file=sys.stderr)
+        return 1
+
+    service = SearchService(args.folder, args.workers)
+    pool = ProcessPoolExecutor(max_workers=args.workers)
+    try:
+        asyncio.run(QueryServer(service, pool, args.timeout).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.shutdown()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Sharded indexes served by local worker processes.
+
+The documents are split into contiguous shards and every shard is indexed
+and served by its own process. Building takes two rounds:
+
+1. each worker reads and counts the terms of its documents and reports its
+   document count, total length and per-term document frequencies;
+2. the coordinator adds those up and sends every worker the global
+   statistics for its terms, and the worker writes its TF-IDF index (an
+   on-disk DiskIndex) and its BM25 index with the global IDF and average
+   document length.
+
+Term weights, document norms and BM25 length normalization are therefore
+exactly what a single index over all documents holds, and a query is scored
+the same way (score_query / bm25_scores, query term order), so the scores
+the coordinator merges from the per-shard top k are exactly the scores of a
+single-index run. Equal scores are ordered by document name.
+
+count_func(filenames) must return {term: [(filename, count), ...]} and
+weight_scale(df, num_docs) the IDF factor; a TF-IDF weight is
+(count / document length) * weight_scale(df, num_docs). Like the worker
+functions of ir_core/parallel.py, both must be picklable where processes
+are spawned rather than forked (Windows).
+"""
+
+import os
+import heapq
+import threading
+import multiprocessing
+from collections import namedtuple
+
+from ir_core.index_store import DiskIndex, write_index
+from ir_core.postings import DocIdMap
+from ir_core.probabilistic import DEFAULT_B, DEFAULT_K1, ProbabilisticIndex
+from ir_core.scoring import score_query, top_k
+
+DEFAULT_SHARDS = 4
+MODELS = ('tfidf', 'cosine', 'bm25')
+
+CollectionStats = namedtuple('CollectionStats', ['num_docs', 'total_length', 'document_frequency'])
+
+
+def partition(items, num_shards):
+    """
+    Split items into at most num_shards contiguous, nearly equal parts
+    """
+    num_shards = max(1, min(num_shards, len(items)))
+    size, extra = divmod(len(items), num_shards)
+    parts = []
+    start = 0
+    for i in range(num_shards):
+        end = start + size + (1 if i < extra else 0)
+        parts.append(items[start:end])
+        start = end
+    return parts
+
+
+class _Shard:
+    """
+    One shard's indexes, living in a worker process
+    """
+
+    def __init__(self, index_dir, filenames, term_counts, doc_lengths, stats, weight_scale, k1, b):
+        self.doc_names = filenames
+        df = stats.document_frequency
+
+        inverted_index = {}
+        for term, counts in term_counts.items():
+            scale = weight_scale(df[term], stats.num_docs)
+            inverted_index[term] = [(doc, (count / doc_lengths[doc]) * scale) for doc, count in counts.items()]
+        write_index(index_dir, inverted_index, filenames, '')
+        self.disk_index = DiskIndex(index_dir)
+
+        average = stats.total_length / stats.num_docs if stats.num_docs else 0.0
+        self.bm25_index = ProbabilisticIndex(term_counts, DocIdMap(filenames), k1, b,
+                                             num_docs=stats.num_docs, avg_doc_length=average,
+                                             document_frequency=df.get)
+
+    def search(self, query_terms, k, model):
+        if model == 'bm25':
+            return self.bm25_index.rank_bm25(query_terms, k)
+        tfidf_scores, cosine_scores = score_query(self.disk_index, query_terms)
+        scores = cosine_scores if model == 'cosine' else tfidf_scores
+        names = self.doc_names
+        if k is not None:
+            return [(names[doc], score) for doc, score in top_k(scores, k)]
+        return sorted(((names[doc], score) for doc, score in scores.items()),
+                      key=lambda item: (-item[1], item[0]))
+
+    def close(self):
+        self.disk_index.close()
+
+
+def _count_shard(filenames, count_func):
+    term_counts = {}
+    doc_lengths = dict.fromkeys(filenames, 0)
+    for term, postings in count_func(filenames).items():
+        counts = term_counts.setdefault(term, {})
+        for filename, count in postings:
+            counts[filename] = counts.get(filename, 0) + count
+            doc_lengths[filename] += count
+    return term_counts, doc_lengths
+
+
+def _serve_shard(connection, index_dir, filenames, count_func, weight_scale, k1, b):
+    shard = None
+    try:
+        # Round 1: local statistics
+        term_counts, doc_lengths = _count_shard(filenames, count_func)
+        connection.send(('ok', (len(filenames), sum(doc_lengths.values()),
+                                {term: len(counts) for term, counts in term_counts.items()})))
+
+        # Round 2: build with the global statistics
+        stats = connection.recv()
+        shard = _Shard(index_dir, filenames, term_counts, doc_lengths, stats, weight_scale, k1, b)
+        del term_counts
+        connection.send(('ok', None))
+    except Exception as e:
+        connection.send(('error', f"{type(e).__name__}: {e}"))
+        return
+
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            try:
+                connection.send(('ok', shard.search(*message)))
+            except Exception as e:
+                connection.send(('error', f"{type(e).__name__}: {e}"))
+    except EOFError:
+        pass
+    finally:
+        shard.close()
+
+
+class ShardedIndex:
+    """
+    Coordinator for an index split over num_shards worker processes.
+
+    search() sends the query to every shard at once, then merges the
+    shards' top k into the global top k. It may be called from several
+    threads: the pipes are shared, so one query at a time is sent and
+    answered.
+    """
+
+    def __init__(self, filenames, count_func, weight_scale, index_root,
+                 num_shards=DEFAULT_SHARDS, k1=DEFAULT_K1, b=DEFAULT_B):
+        self.filenames = sorted(filenames)
+        self.connections = []
+        self.processes = []
+        # Held from sending a query until every shard has answered it
+        self._lock = threading.Lock()
+        try:
+            for i, shard_files in enumerate(partition(self.filenames, num_shards)):
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=_serve_shard, daemon=True,
+                    args=(child, os.path.join(index_root, f"shard{i:03d}"), shard_files,
+                          count_func, weight_scale, k1, b))
+                process.start()
+                child.close()
+                self.connections.append(parent)
+                self.processes.append(process)
+
+            local_stats = self._gather()
+            document_frequency = {}
+            for _, _, local_df in local_stats:
+                for term, df in local_df.items():
+                    document_frequency[term] = document_frequency.get(term, 0) + df
+            num_docs = sum(stats[0] for stats in local_stats)
+            total_length = sum(stats[1] for stats in local_stats)
+
+            # Each shard only needs the global frequencies of its own terms
+            for connection, (_, _, local_df) in zip(self.connections, local_stats):
+                connection.send(CollectionStats(num_docs, total_length,
+                                                {term: document_frequency[term] for term in local_df}))
+            self._gather()
+        except BaseException:
+            self.close()
+            raise
+        self.stats = CollectionStats(num_docs, total_length, document_frequency)
+
+    @property
+    def num_shards(self):
+        return len(self.connections)
+
+    def _gather(self):
+        results = []
+        errors = []
+        for connection in self.connections:
+            status, result = connection.recv()
+            if status == 'ok':
+                results.append(result)
+            else:
+                errors.append(result)
+        if errors:
+            raise RuntimeError(f"Shard failed: {errors[0]}")
+        return results
+
+    def search(self, query_terms, k=10, model='tfidf'):
+        """
+        Return the k best (doc name, score) pairs, best first (all matches if
+        k is None). model is 'tfidf', 'cosine' or 'bm25'.
+        """
+        if model not in MODELS:
+            raise ValueError(f"Unknown model {model!r}; expected one of {MODELS}")
+        # Scatter to every shard before collecting any answer, so shards work in parallel
+        with self._lock:
+            for connection in self.connections:
+                connection.send((list(query_terms), k, model))
+            shard_results = self._gather()
+        merged = heapq.merge(*shard_results, key=lambda item: (-item[1], item[0]))
+        results = list(merged)
+        return results if k is None else results[:k]
+
+    def close(self):
+        with self._lock:
+            for connection in self.connections:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+            for process in self.processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+            self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
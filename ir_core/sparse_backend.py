@@ -0,0 +1,99 @@
+"""
+Optional vectorized scoring backend built on numpy and scipy.sparse.
+
+The TF-IDF weights are held as a documents x terms CSC matrix. The on-disk
+postings (grouped by term, ascending doc ids) are already in CSC layout, so
+the matrix is a straight copy of the index arrays. A query, or a batch of
+queries, becomes a sparse terms x queries matrix of query term counts, and
+one sparse product scores every document for every query at once.
+
+numpy and scipy are only needed when this module is used.
+"""
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+    sparse = None
+
+from ir_core.scoring import query_term_counts
+
+
+def available():
+    return sparse is not None
+
+
+class SparseScorer:
+    """
+    Batch TF-IDF / cosine scorer over a DiskIndex.
+
+    The index arrays are copied, so the scorer stays valid after the index
+    is closed.
+    """
+
+    def __init__(self, index):
+        if not available():
+            raise ImportError("The sparse backend needs numpy and scipy installed")
+        self.doc_names = list(index.doc_names)
+        self.terms = {term: column for column, term in enumerate(index)}
+        self.matrix = sparse.csc_matrix(
+            (np.array(index._post_weights, dtype=np.float64),
+             np.array(index._post_docs, dtype=np.int32),
+             np.array(index._post_offsets, dtype=np.int64)),
+            shape=(index.num_docs, index.num_terms))
+        self.doc_norms = np.array(index.doc_norms, dtype=np.float64)
+
+    def query_matrix(self, queries):
+        """
+        terms x queries matrix of query term counts, plus each query's norm
+        """
+        rows, cols, values = [], [], []
+        query_norms = np.zeros(len(queries))
+        for col, query_terms in enumerate(queries):
+            counts = query_term_counts(query_terms)
+            query_norms[col] = np.sqrt(sum(count * count for count in counts.values()))
+            for term, count in counts.items():
+                row = self.terms.get(term)
+                if row is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    values.append(count)
+        matrix = sparse.csc_matrix((values, (rows, cols)), shape=(len(self.terms), len(queries)))
+        return matrix, query_norms
+
+    def score_batch(self, queries):
+        """
+        Return documents x queries sparse matrices of TF-IDF and cosine scores
+        """
+        query_matrix, query_norms = self.query_matrix(queries)
+        tfidf = (self.matrix @ query_matrix).tocsc()
+        tfidf.sort_indices()
+
+        # Divide each stored score by its document norm and its query norm
+        cosine = tfidf.copy()
+        rows = cosine.indices
+        cols = np.repeat(np.arange(len(queries)), np.diff(cosine.indptr))
+        denominators = self.doc_norms[rows] * query_norms[cols]
+        cosine.data = np.divide(cosine.data, denominators,
+                                out=np.zeros_like(cosine.data), where=denominators != 0)
+        return tfidf, cosine
+
+    def _ranked_column(self, matrix, col):
+        start, end = matrix.indptr[col], matrix.indptr[col + 1]
+        # Every document, 0.0 where no query term occurs, as scoring.rank(every_document=True)
+        scores = np.zeros(len(self.doc_names))
+        scores[matrix.indices[start:end]] = matrix.data[start:end]
+        # Ascending by score, ties in doc id order, like scoring.rank
+        order = np.argsort(scores, kind='stable')
+        names = self.doc_names
+        return [(names[doc], score) for doc, score in zip(order.tolist(), scores[order].tolist())]
+
+    def rank_batch(self, queries):
+        """
+        Return one (ranked_tfidf, ranked_cosine) pair per query, in the same
+        shape as TF-IDFscoring.search
+        """
+        tfidf, cosine = self.score_batch(queries)
+        return [(self._ranked_column(tfidf, col), self._ranked_column(cosine, col))
+                for col in range(len(queries))]
@@ -0,0 +1,159 @@
+"""
+Single-pass in-memory indexing (SPIMI) with a bounded memory budget.
+
+Documents are fed one at a time. Postings accumulate in an in-memory block
+until its estimated size reaches the budget; the block is then written to
+disk as a run sorted by term and cleared. finish() k-way merges the runs
+straight into an IndexWriter, so peak memory depends on the budget, not on
+the size of the corpus.
+
+Doc ids are handed out in the order documents are added, so every run holds
+ascending doc ids and a term's postings from run i all come before those
+from run i + 1.
+"""
+
+import os
+import heapq
+import shutil
+import struct
+from array import array
+from itertools import groupby
+
+from ir_core.index_store import IndexWriter
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+# Rough in-memory cost of a block entry: dict slot, key and two arrays per
+# term, and one uint32 + one float64 per posting
+TERM_OVERHEAD = 240
+POSTING_BYTES = 12
+
+# Most runs merged at once; more are first merged into intermediate runs
+MAX_MERGE_FAN_IN = 256
+
+_HEADER = struct.Struct('<II')
+
+
+def _write_record(file, key, doc_ids, weights):
+    file.write(_HEADER.pack(len(key), len(doc_ids)))
+    file.write(key)
+    doc_ids.tofile(file)
+    weights.tofile(file)
+
+
+def _write_run(path, block):
+    with open(path, 'wb') as file:
+        for term in sorted(block, key=lambda term: term.encode('utf-8')):
+            doc_ids, weights = block[term]
+            _write_record(file, term.encode('utf-8'), doc_ids, weights)
+
+
+def _read_run(path):
+    """
+    Yield (term_bytes, doc_ids, weights) records from a run file
+    """
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(_HEADER.size)
+            if not header:
+                return
+            key_length, count = _HEADER.unpack(header)
+            key = file.read(key_length)
+            doc_ids, weights = array('I'), array('d')
+            doc_ids.fromfile(file, count)
+            weights.fromfile(file, count)
+            yield key, doc_ids, weights
+
+
+def _merge_runs(paths):
+    """
+    k-way merge of run files, yielding one (term_bytes, doc_ids, weights)
+    record per term with the postings of all runs concatenated in run order
+    """
+    merged = heapq.merge(*(_read_run(path) for path in paths), key=lambda record: record[0])
+    for key, records in groupby(merged, key=lambda record: record[0]):
+        doc_ids, weights = array('I'), array('d')
+        for _, run_docs, run_weights in records:
+            doc_ids.extend(run_docs)
+            weights.extend(run_weights)
+        yield key, doc_ids, weights
+
+
+class SpimiIndexer:
+    """
+    Build an on-disk index from a stream of documents within a memory budget.
+
+    weight_scale, if given, is called as weight_scale(df, num_docs) for every
+    term during the merge and multiplies that term's weights; it is how
+    collection-wide factors such as IDF are applied once df is known.
+    """
+
+    def __init__(self, index_dir, memory_budget=DEFAULT_MEMORY_BUDGET, run_dir=None):
+        self.memory_budget = memory_budget
+        self.run_dir = run_dir or os.path.join(index_dir, 'runs')
+        self.writer = IndexWriter(index_dir)
+        self.runs = []
+        self._block = {}
+        self._block_bytes = 0
+        os.makedirs(self.run_dir, exist_ok=True)
+
+    def add_document(self, name, term_weights):
+        """
+        Add one document's {term: weight} map and return its doc id
+        """
+        doc_id = self.writer.add_document(name)
+        for term, weight in term_weights.items():
+            entry = self._block.get(term)
+            if entry is None:
+                entry = self._block[term] = (array('I'), array('d'))
+                self._block_bytes += TERM_OVERHEAD + len(term)
+            entry[0].append(doc_id)
+            entry[1].append(weight)
+            self._block_bytes += POSTING_BYTES
+        if self._block_bytes >= self.memory_budget:
+            self.flush()
+        return doc_id
+
+    def flush(self):
+        """
+        Write the current block to disk as a sorted run
+        """
+        if not self._block:
+            return
+        path = os.path.join(self.run_dir, f"run{len(self.runs):05d}.bin")
+        _write_run(path, self._block)
+        self.runs.append(path)
+        self._block = {}
+        self._block_bytes = 0
+
+    def finish(self, fingerprint, weight_scale=None, stats=None):
+        """
+        Merge all runs into the final index and remove them
+        """
+        self.flush()
+        num_docs = self.writer.num_docs
+
+        # Keep the number of open run files bounded
+        level = 0
+        while len(self.runs) > MAX_MERGE_FAN_IN:
+            merged_runs = []
+            for i in range(0, len(self.runs), MAX_MERGE_FAN_IN):
+                batch = self.runs[i:i + MAX_MERGE_FAN_IN]
+                path = os.path.join(self.run_dir, f"merge{level}-{len(merged_runs):05d}.bin")
+                with open(path, 'wb') as file:
+                    for record in _merge_runs(batch):
+                        _write_record(file, *record)
+                for run in batch:
+                    os.remove(run)
+                merged_runs.append(path)
+            self.runs = merged_runs
+            level += 1
+
+        for key, doc_ids, weights in _merge_runs(self.runs):
+            if weight_scale is not None:
+                scale = weight_scale(len(doc_ids), num_docs)
+                weights = array('d', (weight * scale for weight in weights))
+            self.writer.add_term(key.decode('utf-8'), doc_ids, weights)
+        self.writer.finish(fingerprint, stats)
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+        self.runs = []
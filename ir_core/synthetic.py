@@ -0,0 +1,129 @@
+"""
+Deterministic synthetic corpora for benchmarks and evaluation.
+
+Words are drawn from a vocabulary of made-up alphabetic words with Zipfian
+frequencies (the word of rank r has weight 1 / r**zipf_s), mixed with
+common English stopwords so the NLTK preprocessing has something to drop.
+Documents are split into paragraphs by blank lines, as the scripts expect,
+and paragraphs into sentences. The same configuration and seed always give
+the same files, so runs on different machines or commits are comparable.
+"""
+
+import os
+import random
+from collections import namedtuple
+
+# Written into every generated corpus folder, so tools know the folder is theirs to replace
+CORPUS_MARKER = '.synthetic_corpus'
+
+STOPWORDS = ('the', 'of', 'and', 'a', 'to', 'in', 'is', 'for', 'on', 'with')
+STOPWORD_RATE = 0.3
+
+_ONSETS = ('b', 'c', 'd', 'f', 'g', 'k', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'z',
+           'br', 'cl', 'dr', 'gr', 'pl', 'st', 'tr')
+_VOWELS = ('a', 'e', 'i', 'o', 'u')
+_CODAS = ('', 'n', 'r', 's', 'l', 'm', 'x')
+
+CorpusConfig = namedtuple('CorpusConfig', ['num_docs', 'vocab_size', 'zipf_s', 'paragraphs',
+                                           'sentences', 'sentence_words', 'seed'])
+CorpusConfig.__new__.__defaults__ = (1000, 5000, 1.1, (1, 5), (1, 4), (5, 15), 42)
+
+
+def vocabulary(size, seed=0):
+    """
+    size distinct lowercase pseudo-words, built from random syllables
+    """
+    rng = random.Random(seed)
+    words = []
+    seen = set(STOPWORDS)
+    while len(words) < size:
+        syllables = rng.randint(2, 4)
+        word = ''.join(rng.choice(_ONSETS) + rng.choice(_VOWELS) for _ in range(syllables)) + rng.choice(_CODAS)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def zipf_cumulative_weights(size, s):
+    total = 0.0
+    cumulative = []
+    for rank in range(1, size + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return cumulative
+
+
+class CorpusGenerator:
+    """
+    Generates documents and queries for one CorpusConfig
+    """
+
+    def __init__(self, config=None):
+        self.config = config or CorpusConfig()
+        self.vocab = vocabulary(self.config.vocab_size, self.config.seed)
+        self._weights = zipf_cumulative_weights(len(self.vocab), self.config.zipf_s)
+
+    def _words(self, rng, count):
+        return rng.choices(self.vocab, cum_weights=self._weights, k=count)
+
+    def document(self, doc_number):
+        """
+        Text of one document; each document has its own random stream, so
+        any document can be generated on its own
+        """
+        config = self.config
+        rng = random.Random(f"{config.seed}:{doc_number}")
+        paragraphs = []
+        for _ in range(rng.randint(*config.paragraphs)):
+            sentences = []
+            for _ in range(rng.randint(*config.sentences)):
+                words = []
+                for word in self._words(rng, rng.randint(*config.sentence_words)):
+                    if rng.random() < STOPWORD_RATE:
+                        words.append(rng.choice(STOPWORDS))
+                    words.append(word)
+                sentences.append(' '.join(words).capitalize() + '.')
+            paragraphs.append(' '.join(sentences))
+        return '\n\n'.join(paragraphs)
+
+    def filename(self, doc_number):
+        return f"doc{doc_number:06d}.txt"
+
+    def write(self, folder_path):
+        """
+        Write every document as a .txt file, plus the CORPUS_MARKER file;
+        returns the filenames
+        """
+        os.makedirs(folder_path, exist_ok=True)
+        with open(os.path.join(folder_path, CORPUS_MARKER), 'w', encoding='utf-8') as file:
+            file.write(repr(tuple(self.config)) + '\n')
+        filenames = []
+        for doc_number in range(self.config.num_docs):
+            filename = self.filename(doc_number)
+            with open(os.path.join(folder_path, filename), 'w', encoding='utf-8') as file:
+                file.write(self.document(doc_number))
+            filenames.append(filename)
+        return filenames
+
+    def queries(self, count, terms=(1, 3), seed=None):
+        """
+        count queries of a few distinct words each, drawn with the corpus'
+        Zipf weights but without the most frequent 1% of the vocabulary,
+        which act like stopwords
+        """
+        rng = random.Random(f"{self.config.seed if seed is None else seed}:queries")
+        skip = len(self.vocab) // 100
+        candidates = self.vocab[skip:]
+        weights = self._weights
+        cumulative = [weight - weights[skip - 1] for weight in weights[skip:]] if skip else weights
+        queries = []
+        for _ in range(count):
+            wanted = min(len(candidates), rng.randint(*terms))
+            words = []
+            while len(words) < wanted:
+                word = rng.choices(candidates, cum_weights=cumulative)[0]
+                if word not in words:
+                    words.append(word)
+            queries.append(' '.join(words))
+        return queries
@@ -0,0 +1,319 @@
+"""
+Bipartite term-document graph in compressed sparse row (CSR) arrays.
+
+An edge joins a term and a document that contains it, weighted by the
+term's count there. The graph is stored twice, once per side:
+
+    term_offsets[t] .. term_offsets[t + 1]   slice of term_docs / term_counts
+    doc_offsets[d] .. doc_offsets[d + 1]     slice of doc_terms / doc_counts
+
+Each neighbour list is sorted by id. Terms and documents have dense ids
+(DocIdMap). The graph is built once per index, so a query only walks the
+slices it needs, and no per-query graph object is created:
+
+- neighborhood / documents_within: breadth-first search from the query
+  terms. Documents are an odd number of hops away and terms an even number.
+- related_terms: terms ranked by co-occurrence with the query terms,
+  sum over shared documents of count(query term) * count(term).
+- related_documents: documents ranked by the weight of the query terms
+  they hold.
+- similar_documents: documents ranked by the weight of the terms they
+  share with one document, sum of min(count here, count there).
+
+update() applies added, changed and removed documents by rebuilding only
+the rows they touch and copying the rest of the arrays.
+
+Drawing is separate: subgraph_edges gives the edges of a neighborhood, and
+draw() plots them with networkx and matplotlib, which are imported only
+when draw() is called.
+"""
+
+from array import array
+from collections import namedtuple
+
+from ir_core.postings import DocIdMap
+
+Neighborhood = namedtuple('Neighborhood', ['terms', 'documents'])
+
+
+def _csr(rows, num_rows):
+    """
+    (offsets, columns, weights) arrays of num_rows sparse rows, each a {column: weight} dict
+    """
+    offsets = array('I', [0])
+    columns = array('I')
+    weights = array('I')
+    for row in range(num_rows):
+        for column, weight in sorted(rows.get(row, {}).items()):
+            columns.append(column)
+            weights.append(weight)
+        offsets.append(len(columns))
+    return offsets, columns, weights
+
+
+def _splice(csr, rows, num_rows):
+    """
+    Copy of CSR arrays with the given rows ({row: {column: weight}}) replaced
+    and empty rows added up to num_rows; each run of untouched rows is copied
+    as one slice
+    """
+    offsets, columns, weights = csr
+    old_rows = len(offsets) - 1
+    new_offsets = array('I', [0])
+    new_columns = array('I')
+    new_weights = array('I')
+    row = 0
+    for replaced in sorted(rows) + [num_rows]:
+        end = min(replaced, old_rows)
+        if row < end:
+            shift = len(new_columns) - offsets[row]
+            new_columns.extend(columns[offsets[row]:offsets[end]])
+            new_weights.extend(weights[offsets[row]:offsets[end]])
+            new_offsets.extend(offset + shift for offset in offsets[row + 1:end + 1])
+        for _ in range(max(row, old_rows), replaced):
+            new_offsets.append(len(new_columns))
+        if replaced == num_rows:
+            break
+        for column, weight in sorted(rows[replaced].items()):
+            new_columns.append(column)
+            new_weights.append(weight)
+        new_offsets.append(len(new_columns))
+        row = replaced + 1
+    return new_offsets, new_columns, new_weights
+
+
+def _top(scores, names, k):
+    ranked = sorted(((names[i], score) for i, score in scores.items()), key=lambda item: (-item[1], item[0]))
+    return ranked if k is None else ranked[:k]
+
+
+class TermDocumentGraph:
+    """
+    Term <-> document graph with CSR adjacency on both sides
+    """
+
+    def __init__(self, term_map, doc_map, term_csr, doc_csr):
+        self.term_map = term_map
+        self.doc_map = doc_map
+        self.term_offsets, self.term_docs, self.term_counts = term_csr
+        self.doc_offsets, self.doc_terms, self.doc_counts = doc_csr
+        # Ids of documents that update() removed or left without terms; they have no edges
+        self._removed = set()
+
+    @classmethod
+    def from_postings(cls, postings):
+        """
+        Graph of a term -> {document: count} index
+        """
+        term_map = DocIdMap()
+        doc_map = DocIdMap()
+        term_rows = {}
+        doc_rows = {}
+        for term, documents in postings.items():
+            term_id = term_map.add(term)
+            for document, count in documents.items():
+                if count:
+                    doc_id = doc_map.add(document)
+                    term_rows.setdefault(term_id, {})[doc_id] = count
+                    doc_rows.setdefault(doc_id, {})[term_id] = count
+        return cls(term_map, doc_map, _csr(term_rows, len(term_map)), _csr(doc_rows, len(doc_map)))
+
+    @classmethod
+    def from_documents(cls, document_terms):
+        """
+        Graph of a document -> {term: count} map
+        """
+        postings = {}
+        for document, terms in document_terms.items():
+            for term, count in terms.items():
+                postings.setdefault(term, {})[document] = count
+        return cls.from_postings(postings)
+
+    def update(self, documents, removed=()):
+        """
+        Apply new or re-indexed documents ({document: {term: count}}) and
+        removed ones. Only the rows of those documents and of the terms they
+        hold, before or after, are rebuilt; the rest of the arrays is copied.
+        """
+        term_rows = {}
+        doc_rows = {}
+        for document in list(documents) + list(removed):
+            doc_id = self.doc_map.id(document)
+            if doc_id is None:
+                continue
+            for term_id, _ in self._terms_of(doc_id):
+                term_rows.setdefault(term_id, {})[doc_id] = 0
+            doc_rows[doc_id] = {}
+            self._removed.add(doc_id)
+        for document, terms in documents.items():
+            doc_id = self.doc_map.add(document)
+            row = doc_rows[doc_id] = {}
+            for term, count in terms.items():
+                if count:
+                    term_id = self.term_map.add(term)
+                    row[term_id] = count
+                    term_rows.setdefault(term_id, {})[doc_id] = count
+            # Like from_postings, a document without terms is not a node
+            if row:
+                self._removed.discard(doc_id)
+            else:
+                self._removed.add(doc_id)
+
+        num_terms = len(self.term_offsets) - 1
+        for term_id, changes in term_rows.items():
+            row = dict(self._documents_of(term_id)) if term_id < num_terms else {}
+            for doc_id, count in changes.items():
+                if count:
+                    row[doc_id] = count
+                else:
+                    row.pop(doc_id, None)
+            term_rows[term_id] = row
+        self.term_offsets, self.term_docs, self.term_counts = _splice(
+            (self.term_offsets, self.term_docs, self.term_counts), term_rows, len(self.term_map))
+        self.doc_offsets, self.doc_terms, self.doc_counts = _splice(
+            (self.doc_offsets, self.doc_terms, self.doc_counts), doc_rows, len(self.doc_map))
+
+    def __len__(self):
+        return len(self.doc_map) - len(self._removed)
+
+    def __contains__(self, term):
+        term_id = self.term_map.id(term)
+        return term_id is not None and self.term_offsets[term_id] != self.term_offsets[term_id + 1]
+
+    def _term_ids(self, terms):
+        ids = (self.term_map.id(term) for term in terms)
+        return list(dict.fromkeys(term_id for term_id in ids if term_id is not None))
+
+    def _documents_of(self, term_id):
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return zip(self.term_docs[start:end], self.term_counts[start:end])
+
+    def _terms_of(self, doc_id):
+        start, end = self.doc_offsets[doc_id], self.doc_offsets[doc_id + 1]
+        return zip(self.doc_terms[start:end], self.doc_counts[start:end])
+
+    def document_terms(self, document):
+        """
+        {term: count} of one document
+        """
+        doc_id = self.doc_map.id(document)
+        if doc_id is None:
+            return {}
+        terms = self.term_map.names
+        return {terms[term_id]: count for term_id, count in self._terms_of(doc_id)}
+
+    def neighborhood(self, terms, hops=1):
+        """
+        Terms and documents at most hops edges from the query terms, as
+        Neighborhood({term: distance}, {document: distance})
+        """
+        term_distance = {term_id: 0 for term_id in self._term_ids(terms)}
+        doc_distance = {}
+        frontier = list(term_distance)
+        for distance in range(1, hops + 1):
+            next_frontier = []
+            if distance % 2:
+                for term_id in frontier:
+                    for doc_id, _ in self._documents_of(term_id):
+                        if doc_id not in doc_distance:
+                            doc_distance[doc_id] = distance
+                            next_frontier.append(doc_id)
+            else:
+                for doc_id in frontier:
+                    for term_id, _ in self._terms_of(doc_id):
+                        if term_id not in term_distance:
+                            term_distance[term_id] = distance
+                            next_frontier.append(term_id)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        term_names = self.term_map.names
+        doc_names = self.doc_map.names
+        return Neighborhood({term_names[i]: d for i, d in term_distance.items()},
+                            {doc_names[i]: d for i, d in doc_distance.items()})
+
+    def documents_within(self, terms, hops=1):
+        """
+        [(document, distance)] at most hops edges from the query terms, nearest first
+        """
+        documents = self.neighborhood(terms, hops).documents
+        return sorted(documents.items(), key=lambda item: (item[1], item[0]))
+
+    def related_terms(self, terms, k=10):
+        """
+        [(term, weight)] of the terms co-occurring with the query terms,
+        weighted by the product of their counts in each shared document
+        """
+        query_ids = self._term_ids(terms)
+        scores = {}
+        for term_id in query_ids:
+            for doc_id, count in self._documents_of(term_id):
+                for other_id, other_count in self._terms_of(doc_id):
+                    scores[other_id] = scores.get(other_id, 0) + count * other_count
+        for term_id in query_ids:
+            scores.pop(term_id, None)
+        return _top(scores, self.term_map.names, k)
+
+    def related_documents(self, terms, k=10):
+        """
+        [(document, weight)] of the documents holding the query terms,
+        weighted by the summed counts of the terms they share with the query
+        """
+        scores = {}
+        for term_id in self._term_ids(terms):
+            for doc_id, count in self._documents_of(term_id):
+                scores[doc_id] = scores.get(doc_id, 0) + count
+        return _top(scores, self.doc_map.names, k)
+
+    def similar_documents(self, document, k=10):
+        """
+        [(document, weight)] of the documents sharing terms with document,
+        weighted by sum of min(count here, count there) over shared terms
+        """
+        doc_id = self.doc_map.id(document)
+        if doc_id is None:
+            return []
+        scores = {}
+        for term_id, count in self._terms_of(doc_id):
+            for other_id, other_count in self._documents_of(term_id):
+                if other_id != doc_id:
+                    scores[other_id] = scores.get(other_id, 0) + min(count, other_count)
+        return _top(scores, self.doc_map.names, k)
+
+    def subgraph_edges(self, neighborhood):
+        """
+        [(term, document, count)] edges between the nodes of a neighborhood
+        """
+        edges = []
+        for term, _ in sorted(neighborhood.terms.items(), key=lambda item: item[1]):
+            for doc_id, count in self._documents_of(self.term_map.id(term)):
+                document = self.doc_map.names[doc_id]
+                if document in neighborhood.documents:
+                    edges.append((term, document, count))
+        return edges
+
+    def nbytes(self):
+        return sum(values.itemsize * len(values) for values in (
+            self.term_offsets, self.term_docs, self.term_counts,
+            self.doc_offsets, self.doc_terms, self.doc_counts))
+
+
+def draw(edges, query_terms, title=None):
+    """
+    Plot subgraph_edges with the query terms in blue and everything else in
+    red; needs networkx and matplotlib, and blocks until the window is closed
+    """
+    import networkx as nx
+    import matplotlib.pyplot as plt
+
+    graph = nx.Graph()
+    graph.add_nodes_from(query_terms)
+    graph.add_weighted_edges_from(edges)
+    query_terms = set(query_terms)
+    plt.figure(figsize=(10, 8))
+    pos = nx.spring_layout(graph, seed=42)
+    node_colors = ['blue' if node in query_terms else 'red' for node in graph.nodes()]
+    nx.draw(graph, pos, with_labels=True, node_color=node_colors, font_size=10, node_size=500, font_weight='bold')
+    if title:
+        plt.title(title)
+    plt.show()
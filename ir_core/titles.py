@@ -0,0 +1,155 @@
+"""
+Trigram index over document titles (file names).
+
+Titles are casefolded and padded with a start and an end marker, and every
+title id is posted under each distinct trigram of its padded title. Title
+ids are assigned in insertion order, so every posting list stays sorted.
+
+- substring: the candidates are the titles posted under the query's rarest
+  trigram. Each is then checked, because sharing trigrams does not make the
+  query a substring.
+- prefix / suffix: the same, with the start / end marker in the query, so
+  only trigrams at the start / end of a title are looked up.
+- exact: a dict from the normalized title.
+
+A query shorter than a trigram is answered from the postings of every
+indexed trigram that contains it. With the markers, every character of a
+title lies in some trigram, so these need no check. The scan is over the
+trigram vocabulary, which stays small (a few tens of thousands of
+trigrams), not over the titles.
+
+Matching is case-insensitive; with case_sensitive=True the candidates are
+checked against the original titles instead. Removed titles are skipped
+until more than half of the ids are dead, then the postings are rebuilt.
+"""
+
+from array import array
+
+START = '\x02'
+END = '\x03'
+GRAM = 3
+MODES = ('substring', 'prefix', 'suffix', 'exact')
+
+
+def normalize_title(title):
+    return title.casefold()
+
+
+def trigrams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class TitleIndex:
+    """
+    Incrementally updatable title -> document lookup for substring, prefix,
+    suffix and exact queries
+    """
+
+    def __init__(self, titles=()):
+        self._titles = []
+        self._normalized = []
+        self._ids = {}
+        self._exact = {}
+        self._postings = {}
+        self._removed = 0
+        for title in titles:
+            self.add(title)
+
+    def add(self, title):
+        """
+        Index a title; adding one that is already indexed does nothing
+        """
+        if title in self._ids:
+            return self._ids[title]
+        title_id = len(self._titles)
+        normalized = normalize_title(title)
+        self._titles.append(title)
+        self._normalized.append(normalized)
+        self._ids[title] = title_id
+        self._exact.setdefault(normalized, []).append(title_id)
+        for gram in trigrams(START + normalized + END):
+            postings = self._postings.get(gram)
+            if postings is None:
+                postings = self._postings[gram] = array('I')
+            postings.append(title_id)
+        return title_id
+
+    def remove(self, title):
+        title_id = self._ids.pop(title, None)
+        if title_id is None:
+            return
+        same = self._exact[self._normalized[title_id]]
+        same.remove(title_id)
+        if not same:
+            del self._exact[self._normalized[title_id]]
+        self._titles[title_id] = None
+        self._removed += 1
+        if self._removed * 2 > len(self._titles):
+            self._compact()
+
+    def _compact(self):
+        titles = [title for title in self._titles if title is not None]
+        self.__init__(titles)
+
+    def __contains__(self, title):
+        return title in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return (title for title in self._titles if title is not None)
+
+    def _candidates(self, key):
+        """
+        Title ids that may contain key, a normalized and possibly padded string
+        """
+        if len(key) < GRAM:
+            # Every indexed trigram holding the key; these ids need no check
+            ids = set()
+            for gram, postings in self._postings.items():
+                if key in gram:
+                    ids.update(postings)
+            return sorted(ids), False
+        grams = trigrams(key)
+        if any(gram not in self._postings for gram in grams):
+            return [], False
+        return min((self._postings[gram] for gram in grams), key=len), True
+
+    def search(self, query, mode='substring', case_sensitive=False, limit=None):
+        """
+        Titles matching query, in the order they were added. mode is one of
+        'substring', 'prefix', 'suffix' or 'exact'.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown title search mode {mode!r}; expected one of {', '.join(MODES)}")
+        key = normalize_title(query)
+        if mode == 'exact':
+            ids = self._exact.get(key, [])
+            check = None
+        else:
+            padded = {'substring': key, 'prefix': START + key, 'suffix': key + END}[mode]
+            ids, needs_check = self._candidates(padded)
+            check = {'substring': str.__contains__, 'prefix': str.startswith,
+                     'suffix': str.endswith}[mode] if needs_check or case_sensitive else None
+
+        results = []
+        for title_id in ids:
+            title = self._titles[title_id]
+            if title is None:
+                continue
+            if check is not None:
+                if case_sensitive:
+                    if not check(title, query):
+                        continue
+                elif not check(self._normalized[title_id], key):
+                    continue
+            elif case_sensitive and mode == 'exact' and title != query:
+                continue
+            results.append(title)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def nbytes(self):
+        return sum(postings.itemsize * len(postings) for postings in self._postings.values())
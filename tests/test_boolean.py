@@ -0,0 +1,39 @@
+import pytest
+
+from ir_core.bitmap import BitmapIndex
+from ir_core.boolean import QuerySyntaxError, parse, run_query
+from ir_core.postings import DocIdMap
+
+
+def test_word_run_is_one_operand():
+    assert parse('a b') == ('words', 'a b')
+    assert parse('a, b') == ('words', 'a b')
+
+
+def test_juxtaposed_not_is_and():
+    assert parse('a NOT b') == ('and', [('words', 'a'), ('not', ('words', 'b'))])
+
+
+def test_juxtaposed_group_is_and():
+    assert parse('(a) b') == ('and', [('words', 'a'), ('words', 'b')])
+    assert parse('a (b OR c)') == ('and', [('words', 'a'), ('or', [('words', 'b'), ('words', 'c')])])
+
+
+def test_precedence():
+    assert parse('a OR b c AND d') == ('or', [('words', 'a'), ('and', [('words', 'b c'), ('words', 'd')])])
+    assert parse('a OR NOT b') == ('or', [('words', 'a'), ('not', ('words', 'b'))])
+
+
+@pytest.mark.parametrize('query', ['a AND', 'OR a', 'a OR OR b', '(a', 'a)', 'NOT'])
+def test_syntax_errors(query):
+    with pytest.raises(QuerySyntaxError):
+        parse(query)
+
+
+def test_juxtaposed_not_excludes():
+    term_docs = {'a': {'d1', 'd2'}, 'b': {'d2', 'd3'}}
+    index = BitmapIndex.from_sets(term_docs, DocIdMap(['d1', 'd2', 'd3']))
+    normalize = str.split
+    assert run_query('a NOT b', index, normalize) == ['d1']
+    assert run_query('a b', index, normalize) == ['d1', 'd2', 'd3']
+    assert run_query('(a) b', index, normalize) == ['d2']
@@ -0,0 +1,19 @@
+from ir_core.forward import ForwardIndex
+from ir_core.index_store import DiskIndex, write_index
+
+
+def test_from_in_memory_index():
+    forward_index = ForwardIndex.from_inverted_index({'cat': {'d1': 2, 'd2': 1}, 'dog': {'d1': 1}})
+    assert forward_index.vector('d1') == {'cat': 2, 'dog': 1}
+    assert forward_index.length('d2') == 1
+
+
+def test_from_disk_index_keeps_integer_counts(tmp_path):
+    # DiskIndex stores every weight as a float
+    write_index(str(tmp_path), {'cat': [('d1', 2.0), ('d2', 1.0)], 'dog': [('d1', 3.0)]}, ['d1', 'd2'], 'x')
+    with DiskIndex(str(tmp_path)) as disk_index:
+        forward_index = ForwardIndex.from_inverted_index(disk_index)
+    assert forward_index.terms('d1') == [('cat', 2), ('dog', 3)]
+    assert all(isinstance(count, int) for _, count in forward_index.terms('d1'))
+    assert forward_index.length('d1') == 5
+    assert forward_index.length_stats()['total'] == 6
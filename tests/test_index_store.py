@@ -0,0 +1,12 @@
+from ir_core.index_store import DiskCountIndex, DiskIndex, write_index
+
+
+def test_count_index_lists_integer_counts(tmp_path):
+    write_index(str(tmp_path), {'cat': [('d1', 2.0), ('d2', 1.0)]}, ['d1', 'd2'], 'x')
+    with DiskIndex(str(tmp_path)) as disk_index:
+        assert disk_index['cat'] == [('d1', 2.0), ('d2', 1.0)]
+    with DiskCountIndex(str(tmp_path)) as count_index:
+        postings = count_index['cat']
+        assert postings == [('d1', 2), ('d2', 1)]
+        assert all(isinstance(count, int) for _, count in postings)
+        assert dict(count_index.items()) == {'cat': postings}